@@ -4,6 +4,7 @@ Django settings for ReforestGo project.
 
 from pathlib import Path
 import os
+import dj_database_url
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -72,13 +73,64 @@ TEMPLATES = [
 WSGI_APPLICATION = 'ReforestGo.wsgi.application'
 
 # Database
+# DATABASE_URL elige el motor (PostgreSQL en Render); sin ella se usa SQLite local.
+# Las conexiones se reutilizan entre peticiones durante DB_CONN_MAX_AGE segundos
+# y se verifican antes de reutilizarlas.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': dj_database_url.config(
+        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+        conn_max_age=int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        conn_health_checks=True,
+    )
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # IMMEDIATE toma el bloqueo de escritura al abrir la transacción y timeout espera
+    # (en segundos) a que se libere en lugar de fallar con "database is locked"
+    # durante subidas concurrentes
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': int(os.getenv('SQLITE_TIMEOUT', '20')),
+        'transaction_mode': 'IMMEDIATE',
+    }
+    if os.getenv('SQLITE_WAL', 'False') == 'True':
+        # WAL permite leer mientras otra conexión escribe. Es opcional porque cambia
+        # el formato del archivo db.sqlite3 (versionado en el repositorio)
+        DATABASES['default']['OPTIONS']['init_command'] = 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;'
+elif os.getenv('DB_POOL', 'False') == 'True':
+    # Pool de conexiones nativo de Django (solo PostgreSQL con psycopg 3 y psycopg_pool).
+    # Reemplaza a las conexiones persistentes: Django no admite ambos a la vez
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+    }
+
+# Cache
+# LocMem por defecto (una copia por proceso). CACHE_DIR usa archivos compartidos
+# entre los workers de gunicorn y REDIS_URL un servidor Redis (requiere el paquete redis)
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'reforestgo',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -119,6 +171,10 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Con IMAGENES_EN_COLA=True las fotos esperan al comando procesar_imagenes
+# (debe ver el mismo MEDIA_ROOT); si no, cada petición procesa las suyas tras el commit
+IMAGENES_EN_COLA = os.getenv('IMAGENES_EN_COLA', 'False') == 'True'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from django.db.models import Count, Max, Min, Q
 from django.utils import timezone
-from .models import Perfil, Avatar, Vivero, Zona, Siembra, Verificacion
+from .oxigeno import actualizar_rango
+from .models import Perfil, Avatar, Vivero, Zona, Siembra, Verificacion, TareaImagen, EstadisticasGlobales
 
 
 @admin.register(Avatar)
@@ -21,6 +23,7 @@ class PerfilAdmin(admin.ModelAdmin):
     readonly_fields = ['fecha_creacion', 'total_siembras', 'stats_verificador_detalle']
     ordering = ['-puntos']
     list_editable = ['rol']
+    list_select_related = ['user', 'avatar_actual']
     
     fieldsets = (
         ('Usuario', {
@@ -34,6 +37,12 @@ class PerfilAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # Contar las siembras validadas en la misma consulta del listado
+        return super().get_queryset(request).annotate(
+            siembras_validadas=Count('user__siembras', filter=Q(user__siembras__estado='validada'))
+        )
+    
     def usuario_display(self, obj):
         return f"{obj.user.get_full_name()} (@{obj.user.username})"
     usuario_display.short_description = 'Usuario'
@@ -45,8 +54,9 @@ class PerfilAdmin(admin.ModelAdmin):
     avatar_emoji.short_description = 'Avatar'
     
     def total_siembras(self, obj):
-        return obj.user.siembras.filter(estado='validada').count()
+        return obj.siembras_validadas
     total_siembras.short_description = 'Siembras validadas'
+    total_siembras.admin_order_field = 'siembras_validadas'
     
     def stats_verificador(self, obj):
         if obj.rol in ['verificador', 'admin']:
@@ -58,11 +68,11 @@ class PerfilAdmin(admin.ModelAdmin):
         if obj.rol in ['verificador', 'admin']:
             return format_html(
                 '<strong>Total:</strong> {} | <strong>Aprobadas:</strong> {} | '
-                '<strong>Puntos ganados:</strong> {} | <strong>Tasa aprobación:</strong> {:.1f}%',
+                '<strong>Puntos ganados:</strong> {} | <strong>Tasa aprobación:</strong> {}%',
                 obj.verificaciones_realizadas,
                 obj.verificaciones_aprobadas,
                 obj.puntos_verificacion,
-                obj.tasa_aprobacion_verificaciones()
+                f'{obj.tasa_aprobacion_verificaciones():.1f}'
             )
         return "No es verificador"
     stats_verificador_detalle.short_description = 'Estadísticas de verificación'
@@ -98,9 +108,10 @@ class ViveroAdmin(admin.ModelAdmin):
 
 @admin.register(Zona)
 class ZonaAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'tipo_terreno', 'coordenadas', 'activa', 'fecha_creacion']
+    list_display = ['nombre', 'tipo_terreno', 'coordenadas', 'total_siembras', 'activa', 'fecha_creacion']
     list_filter = ['tipo_terreno', 'activa', 'fecha_creacion']
     search_fields = ['nombre', 'descripcion', 'recomendaciones']
+    readonly_fields = ['total_siembras', 'impacto_zona']
     list_editable = ['activa']
     ordering = ['-activa', 'nombre']
     
@@ -109,11 +120,14 @@ class ZonaAdmin(admin.ModelAdmin):
             'fields': ('nombre', 'tipo_terreno', 'descripcion', 'recomendaciones')
         }),
         ('Ubicación', {
-            'fields': ('latitud', 'longitud')
+            'fields': ('latitud', 'longitud', 'radio_km')
         }),
         ('Estado', {
             'fields': ('activa',)
         }),
+        ('Siembras', {
+            'fields': ('total_siembras', 'impacto_zona')
+        }),
     )
     
     def coordenadas(self, obj):
@@ -122,6 +136,21 @@ class ZonaAdmin(admin.ModelAdmin):
             obj.latitud, obj.longitud, obj.latitud, obj.longitud
         )
     coordenadas.short_description = 'Coordenadas'
+    
+    def impacto_zona(self, obj):
+        if obj.pk is None:
+            return "-"
+        impacto = obj.impacto()
+        especies = ', '.join(f"{especie or 'Sin especie'} ({total})" for especie, total in obj.especies()[:5])
+        return format_html(
+            '<strong>Oxígeno generado:</strong> {} kg/año<br>'
+            '<strong>CO2 absorbido:</strong> {} kg/año<br>'
+            '<strong>Especies:</strong> {}',
+            impacto['oxigeno'] or 0,
+            impacto['co2'] or 0,
+            especies or '-'
+        )
+    impacto_zona.short_description = 'Impacto de la zona'
 
 
 @admin.register(Siembra)
@@ -133,6 +162,7 @@ class SiembraAdmin(admin.ModelAdmin):
     readonly_fields = ['usuario', 'foto_preview', 'fecha_siembra', 'ubicacion_mapa', 
                        'oxigeno_detalle', 'edad_arbol']
     ordering = ['-fecha_siembra']
+    list_select_related = ['usuario']
     actions = ['validar_siembras', 'rechazar_siembras', 'actualizar_oxigeno']
     
     fieldsets = (
@@ -161,7 +191,7 @@ class SiembraAdmin(admin.ModelAdmin):
         if obj.foto:
             return format_html(
                 '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 5px;" />',
-                obj.foto.url
+                obj.foto_miniatura_url()
             )
         return "Sin foto"
     miniatura.short_description = 'Foto'
@@ -169,8 +199,8 @@ class SiembraAdmin(admin.ModelAdmin):
     def foto_preview(self, obj):
         if obj.foto:
             return format_html(
-                '<img src="{}" style="max-width: 400px; max-height: 400px; border-radius: 10px;" />',
-                obj.foto.url
+                '<a href="{}" target="_blank"><img src="{}" style="max-width: 400px; max-height: 400px; border-radius: 10px;" /></a>',
+                obj.foto.url, obj.foto_tarjeta_url()
             )
         return "Sin foto"
     foto_preview.short_description = 'Foto de la siembra'
@@ -229,18 +259,11 @@ class SiembraAdmin(admin.ModelAdmin):
     
     def validar_siembras(self, request, queryset):
         """Acción para validar múltiples siembras"""
-        count = 0
-        usuarios_nivel3 = []
+        # Por lotes: un incremento de puntos por usuario y zonas revisadas al final
+        count, subieron = queryset.validar(request.user)
         
-        for siembra in queryset.filter(estado='pendiente'):
-            nivel_anterior = siembra.usuario.perfil.nivel
-            subio_nivel = siembra.validar(request.user)
-            
-            # Verificar si alcanzó nivel 3
-            if subio_nivel and siembra.usuario.perfil.nivel == 3:
-                usuarios_nivel3.append(siembra.usuario.username)
-            
-            count += 1
+        # Verificar quiénes alcanzaron nivel 3
+        usuarios_nivel3 = [perfil.user.username for perfil in subieron if perfil.nivel == 3]
         
         mensaje = f'{count} siembra(s) validada(s) exitosamente.'
         
@@ -253,8 +276,8 @@ class SiembraAdmin(admin.ModelAdmin):
     
     def rechazar_siembras(self, request, queryset):
         """Acción para rechazar múltiples siembras"""
-        count = queryset.filter(estado='pendiente').update(
-            estado='rechazada',
+        count = queryset.filter(estado='pendiente').cambiar_estado(
+            'rechazada',
             validada_por=request.user,
             fecha_validacion=timezone.now()
         )
@@ -263,10 +286,13 @@ class SiembraAdmin(admin.ModelAdmin):
     
     def actualizar_oxigeno(self, request, queryset):
         """Actualiza el cálculo de oxígeno de las siembras validadas"""
+        validadas = queryset.filter(estado='validada')
+        limites = validadas.aggregate(desde=Min('id'), hasta=Max('id'))
         count = 0
-        for siembra in queryset.filter(estado='validada'):
-            siembra.calcular_oxigeno()
-            count += 1
+        if limites['desde'] is not None:
+            # Lotes con un UPDATE por fila, igual que el comando actualizar_oxigeno; actualizar_rango
+            # también marca fecha_actualizacion e invalida las estadísticas de los dueños
+            _, count = actualizar_rango(limites['desde'], limites['hasta'] + 1, queryset=validadas)
         
         self.message_user(request, f'Oxígeno actualizado para {count} siembra(s).')
     actualizar_oxigeno.short_description = "🌿 Actualizar cálculo de oxígeno"
@@ -308,11 +334,12 @@ class SiembraAdmin(admin.ModelAdmin):
 class VerificacionAdmin(admin.ModelAdmin):
     list_display = ['verificador_nombre', 'siembra_info', 'estado', 'distancia_precision',
                     'puntos_otorgados', 'fecha_verificacion', 'acciones']
-    list_filter = ['estado', 'fecha_verificacion']
+    list_filter = ['estado', 'precision', 'fecha_verificacion']
     search_fields = ['verificador__username', 'siembra__especie']
     readonly_fields = ['fecha_verificacion', 'siembra', 'verificador', 'fotos_preview',
                        'mapa_comparacion', 'distancia_calculada']
     ordering = ['-fecha_verificacion']
+    list_select_related = ['verificador', 'siembra__usuario']
     actions = ['aprobar_verificaciones', 'rechazar_verificaciones']
     
     fieldsets = (
@@ -334,6 +361,9 @@ class VerificacionAdmin(admin.ModelAdmin):
         }),
     )
     
+    COLORES_PRECISION = {'excelente': 'green', 'buena': 'orange', 'revisar': 'red'}
+    ETIQUETAS_PRECISION = {'excelente': 'Excelente ✅', 'buena': 'Buena ⚠️', 'revisar': 'Revisar ❌'}
+    
     def verificador_nombre(self, obj):
         return f"{obj.verificador.get_full_name()} (@{obj.verificador.username})"
     verificador_nombre.short_description = 'Verificador'
@@ -348,19 +378,20 @@ class VerificacionAdmin(admin.ModelAdmin):
     
     def distancia_precision(self, obj):
         dist = obj.calcular_distancia()
-        color = 'green' if dist < 20 else 'orange' if dist < 50 else 'red'
+        color = self.COLORES_PRECISION[obj.precision or Verificacion.precision_para(dist)]
         return format_html(
-            '<span style="color: {}; font-weight: bold;">{:.2f} m</span>',
-            color, dist
+            '<span style="color: {}; font-weight: bold;">{} m</span>',
+            color, f'{dist:.2f}'
         )
     distancia_precision.short_description = 'Distancia'
+    distancia_precision.admin_order_field = 'distancia_metros'
     
     def fotos_preview(self, obj):
         html = '<div style="display: flex; gap: 10px;">'
         if obj.foto_verificacion:
-            html += f'<div><p><strong>Foto principal:</strong></p><img src="{obj.foto_verificacion.url}" style="max-width: 300px; border-radius: 5px;"></div>'
+            html += f'<div><p><strong>Foto principal:</strong></p><a href="{obj.foto_verificacion.url}" target="_blank"><img src="{obj.foto_verificacion_tarjeta_url()}" style="max-width: 300px; border-radius: 5px;"></a></div>'
         if obj.foto_ubicacion:
-            html += f'<div><p><strong>Foto ubicación:</strong></p><img src="{obj.foto_ubicacion.url}" style="max-width: 300px; border-radius: 5px;"></div>'
+            html += f'<div><p><strong>Foto ubicación:</strong></p><a href="{obj.foto_ubicacion.url}" target="_blank"><img src="{obj.foto_ubicacion_tarjeta_url()}" style="max-width: 300px; border-radius: 5px;"></a></div>'
         html += '</div>'
         return format_html(html)
     fotos_preview.short_description = 'Fotos de verificación'
@@ -368,10 +399,10 @@ class VerificacionAdmin(admin.ModelAdmin):
     def distancia_calculada(self, obj):
         dist = obj.calcular_distancia()
         return format_html(
-            '<strong>Distancia:</strong> {:.2f} metros<br>'
+            '<strong>Distancia:</strong> {} metros<br>'
             '<strong>Precisión:</strong> {}',
-            dist,
-            'Excelente ✅' if dist < 20 else 'Buena ⚠️' if dist < 50 else 'Revisar ❌'
+            f'{dist:.2f}',
+            self.ETIQUETAS_PRECISION[obj.precision or Verificacion.precision_para(dist)]
         )
     distancia_calculada.short_description = 'Análisis de precisión'
     
@@ -415,20 +446,14 @@ class VerificacionAdmin(admin.ModelAdmin):
     
     def aprobar_verificaciones(self, request, queryset):
         """Aprobar múltiples verificaciones"""
-        count = 0
-        for verificacion in queryset.filter(estado='pendiente'):
-            verificacion.aprobar(request.user)
-            count += 1
+        count = queryset.aprobar(request.user)
         
         self.message_user(request, f'{count} verificación(es) aprobada(s).')
     aprobar_verificaciones.short_description = "✅ Aprobar verificaciones"
     
     def rechazar_verificaciones(self, request, queryset):
         """Rechazar múltiples verificaciones"""
-        count = 0
-        for verificacion in queryset.filter(estado='pendiente'):
-            verificacion.rechazar(request.user, 'Rechazado desde el admin')
-            count += 1
+        count = queryset.rechazar(request.user, 'Rechazado desde el admin')
         
         self.message_user(request, f'{count} verificación(es) rechazada(s).')
     rechazar_verificaciones.short_description = "❌ Rechazar verificaciones"
@@ -450,4 +475,36 @@ class VerificacionAdmin(admin.ModelAdmin):
             except Verificacion.DoesNotExist:
                 pass
         
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(TareaImagen)
+class TareaImagenAdmin(admin.ModelAdmin):
+    list_display = ['id', 'modelo', 'objeto_id', 'campo', 'estado', 'intentos', 'fecha_creacion', 'fecha_actualizacion']
+    list_filter = ['estado', 'modelo', 'campo']
+    search_fields = ['objeto_id', 'error']
+    readonly_fields = ['modelo', 'objeto_id', 'campo', 'intentos', 'error', 'fecha_creacion', 'fecha_actualizacion']
+    ordering = ['-id']
+    actions = ['reintentar_tareas']
+    
+    def reintentar_tareas(self, request, queryset):
+        """Devuelve a la cola las tareas con error o bloqueadas"""
+        count = queryset.exclude(estado='pendiente').update(estado='pendiente', intentos=0, error='')
+        self.message_user(request, f'{count} tarea(s) devuelta(s) a la cola.')
+    reintentar_tareas.short_description = "🔁 Reintentar tareas seleccionadas"
+
+
+@admin.register(EstadisticasGlobales)
+class EstadisticasGlobalesAdmin(admin.ModelAdmin):
+    list_display = ['total_siembras', 'total_usuarios', 'oxigeno_total', 'co2_total', 'fecha_actualizacion']
+    readonly_fields = ['total_siembras', 'total_usuarios', 'oxigeno_total', 'co2_total', 'fecha_actualizacion']
+    actions = ['reconstruir']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def reconstruir(self, request, queryset):
+        """Recalcula los contadores desde las tablas de origen"""
+        EstadisticasGlobales.reconstruir()
+        self.message_user(request, 'Estadísticas globales reconstruidas.')
+    reconstruir.short_description = "🔄 Reconstruir estadísticas"
@@ -0,0 +1,323 @@
+"""
+Motor de agrupamiento espacial (estilo DBSCAN sobre rejilla) para detectar
+concentraciones de siembras sin comparar todos los pares de puntos.
+
+Los puntos se reparten en celdas de lado radio/√2, de modo que dos puntos de
+una misma celda siempre están a menos de `radio_km`. Así:
+
+- Una celda con `minimo` o más puntos convierte a todos sus puntos en núcleo
+  sin calcular distancias.
+- Las celdas con núcleos forman un grafo: dos celdas se conectan si algún par
+  de núcleos está dentro del radio. Cada componente conexa es un grupo.
+- Los puntos no núcleo se asignan al núcleo más cercano dentro del radio o
+  quedan como ruido.
+
+Para cada punto solo se miran las celdas vecinas que el círculo de radio
+alcanza; las que quedan completamente dentro del círculo se cuentan sin
+calcular distancias. Los pares restantes se evalúan por bloques con NumPy
+para mantener acotada la memoria.
+"""
+from math import ceil, cos, radians, sqrt
+
+import numpy as np
+
+from . import geo
+
+# Máximo de pares candidatos evaluados por bloque
+MAX_PARES_POR_BLOQUE = 4_000_000
+
+# Puntos de origen procesados por bloque al generar candidatos
+ORIGENES_POR_BLOQUE = 32_768
+
+# Tamaño máximo de la tabla directa de celdas (entradas)
+MAX_TABLA_DIRECTA = 20_000_000
+
+# Núcleos a partir de los cuales dos celdas vecinas se comparan una a una
+UMBRAL_CELDA_DENSA = 64
+
+RUIDO = -1
+
+
+class _Rejilla:
+    """Índice de puntos por celda, ordenado por clave de celda"""
+
+    def __init__(self, claves, indices, total_claves):
+        orden = np.argsort(claves[indices], kind='stable')
+        self.indices = indices[orden]
+        self.unicas, self.inicio, self.conteo = np.unique(
+            claves[self.indices], return_index=True, return_counts=True
+        )
+
+        # Si el rango de claves es pequeño, una tabla directa evita búsquedas binarias
+        self.tabla = None
+        if total_claves <= MAX_TABLA_DIRECTA:
+            self.tabla = np.full(total_claves, -1, dtype=np.int64)
+            self.tabla[self.unicas] = np.arange(len(self.unicas))
+
+    def numerar(self, n):
+        """Arreglo con la posición de celda de cada punto indexado (-1 si no está)"""
+        celda = np.full(n, -1, dtype=np.int64)
+        celda[self.indices] = np.repeat(np.arange(len(self.unicas)), self.conteo)
+        return celda
+
+    def buscar(self, objetivo):
+        """Retorna (posición de celda, existe) para un arreglo de claves"""
+        if not len(self.unicas):
+            return np.zeros(objetivo.shape, dtype=np.int64), np.zeros(objetivo.shape, dtype=bool)
+        if self.tabla is not None:
+            pos = self.tabla[np.clip(objetivo, 0, len(self.tabla) - 1)]
+            existe = (pos >= 0) & (objetivo >= 0) & (objetivo < len(self.tabla))
+            return np.maximum(pos, 0), existe
+        pos = np.minimum(np.searchsorted(self.unicas, objetivo), len(self.unicas) - 1)
+        return pos, self.unicas[pos] == objetivo
+
+    def puntos_de(self, pos):
+        return self.indices[self.inicio[pos]:self.inicio[pos] + self.conteo[pos]]
+
+    def pares(self, bloque, pos, expandir):
+        """
+        Genera por bloques los pares (origen, candidato) de los orígenes con
+        cada punto de las celdas marcadas en `expandir` (forma: orígenes x vecinas).
+        """
+        conteo = np.where(expandir, self.conteo[pos], 0)
+        inicio = self.inicio[pos]
+        vecinas = expandir.shape[1]
+
+        acumulado = np.cumsum(conteo.sum(axis=1))
+        a = 0
+        while a < len(bloque):
+            base = acumulado[a - 1] if a else 0
+            z = max(int(np.searchsorted(acumulado, base + MAX_PARES_POR_BLOQUE, side='right')), a + 1)
+
+            c = conteo[a:z].ravel()
+            total = int(c.sum())
+            if total:
+                s = inicio[a:z].ravel()
+                o = np.repeat(np.repeat(bloque[a:z], vecinas), c)
+                desfase = np.repeat(s - (np.cumsum(c) - c), c)
+                yield o, self.indices[desfase + np.arange(total)]
+            a = z
+
+
+def _componentes(n, u, v):
+    """Etiqueta las componentes conexas de un grafo con aristas (u, v)"""
+    etiquetas = np.arange(n)
+    while True:
+        eu, ev = etiquetas[u], etiquetas[v]
+        bajo, alto = np.minimum(eu, ev), np.maximum(eu, ev)
+        cambio = bajo != alto
+        if not cambio.any():
+            return etiquetas
+        np.minimum.at(etiquetas, alto[cambio], bajo[cambio])
+        # Saltos de puntero hasta estabilizar
+        while True:
+            siguientes = etiquetas[etiquetas]
+            if np.array_equal(siguientes, etiquetas):
+                break
+            etiquetas = siguientes
+
+
+def _hay_par_cercano(lats_a, lngs_a, lats_b, lngs_b, radio_km):
+    """Indica si algún punto de A está a radio_km o menos de algún punto de B"""
+    filas_por_bloque = max(1, MAX_PARES_POR_BLOQUE // max(len(lats_b), 1))
+    for inicio in range(0, len(lats_a), filas_por_bloque):
+        fin = inicio + filas_por_bloque
+        distancias = geo.matriz_distancias_km(lats_a[inicio:fin], lngs_a[inicio:fin], lats_b, lngs_b)
+        if (distancias <= radio_km).any():
+            return True
+    return False
+
+
+def _bloques(indices):
+    for b in range(0, len(indices), ORIGENES_POR_BLOQUE):
+        yield indices[b:b + ORIGENES_POR_BLOQUE]
+
+
+def agrupar_por_radio(lats, lngs, radio_km, minimo):
+    """
+    Agrupa puntos por densidad: un punto es núcleo si tiene al menos `minimo`
+    puntos (incluido él mismo) a radio_km o menos.
+
+    Retorna un arreglo de etiquetas con un entero por punto: el número de
+    grupo (0..k-1) o RUIDO (-1).
+    """
+    if radio_km <= 0 or minimo < 1:
+        raise ValueError('radio_km debe ser positivo y minimo al menos 1')
+
+    lats = geo.arreglo(lats)
+    lngs = geo.arreglo(lngs)
+    n = len(lats)
+    etiquetas = np.full(n, RUIDO, dtype=np.int64)
+    if n == 0:
+        return etiquetas
+
+    # Lado de celda en grados; el margen absorbe errores de redondeo
+    lado = 0.999 * radio_km / (sqrt(2) * geo.KM_POR_GRADO)
+    filas = np.floor(lats / lado).astype(np.int64)
+    columnas = np.floor(lngs / lado).astype(np.int64)
+
+    # Alcance en celdas: 2 en latitud; en longitud depende de la latitud máxima
+    lat_max = min(float(np.abs(lats).max()) + radio_km / geo.KM_POR_GRADO, 89.0)
+    alcance_fila = 2
+    alcance_columna = ceil(sqrt(2) / cos(radians(lat_max)))
+
+    # Clave entera por celda; el ancho evita que vecinas de filas distintas coincidan
+    ancho = int(columnas.max() - columnas.min()) + 2 * alcance_columna + 1
+    claves = (filas - filas.min()) * ancho + (columnas - columnas.min())
+    total_claves = int(claves.max()) + 1
+    filas_vecinas = np.arange(-alcance_fila, alcance_fila + 1)[np.newaxis, :]
+    columnas_vecinas = np.arange(-alcance_columna, alcance_columna + 1)[np.newaxis, :]
+    desplazamientos = (filas_vecinas.T * ancho + columnas_vecinas).ravel()
+
+    # Posición de cada punto dentro de su celda (0..1) y lado de celda en km.
+    # Las cotas usan el lado más corto (mínimos) o más largo (máximos) posible
+    fraccion_fila = lats / lado - filas
+    fraccion_columna = lngs / lado - columnas
+    lado_km = lado * geo.KM_POR_GRADO
+    lado_km_columna_min = lado_km * np.cos(np.radians(np.minimum(np.abs(lats) + lado, 90.0)))
+    lado_km_columna_max = lado_km * np.cos(np.radians(np.maximum(np.abs(lats) - lado, 0.0)))
+    radio_holgado = (radio_km * 1.01) ** 2
+    radio_estricto = (radio_km * 0.99) ** 2
+
+    def huecos(desplazamiento, fraccion):
+        """Distancia mínima y máxima (en celdas) del punto a la fila/columna vecina"""
+        cerca = np.where(
+            desplazamiento > 0, desplazamiento - fraccion,
+            np.where(desplazamiento < 0, -desplazamiento - 1 + fraccion, 0.0)
+        )
+        lejos = np.where(
+            desplazamiento > 0, desplazamiento + 1 - fraccion,
+            np.where(desplazamiento < 0, -desplazamiento + fraccion, np.maximum(fraccion, 1 - fraccion))
+        )
+        return cerca, lejos
+
+    def vecindad(bloque, rejilla):
+        """
+        Para cada origen y celda vecina retorna la posición de la celda en la
+        rejilla, si el círculo la alcanza y si la contiene por completo.
+        """
+        pos, existe = rejilla.buscar(claves[bloque][:, np.newaxis] + desplazamientos)
+
+        cerca_fila, lejos_fila = huecos(filas_vecinas, fraccion_fila[bloque][:, np.newaxis])
+        cerca_columna, lejos_columna = huecos(columnas_vecinas, fraccion_columna[bloque][:, np.newaxis])
+        cerca_fila = (cerca_fila * lado_km) ** 2
+        lejos_fila = (lejos_fila * lado_km) ** 2
+        cerca_columna = (cerca_columna * lado_km_columna_min[bloque][:, np.newaxis]) ** 2
+        lejos_columna = (lejos_columna * lado_km_columna_max[bloque][:, np.newaxis]) ** 2
+
+        # Combinar filas y columnas vecinas en el mismo orden que `desplazamientos`
+        minima = (cerca_fila[:, :, np.newaxis] + cerca_columna[:, np.newaxis, :]).reshape(len(bloque), -1)
+        maxima = (lejos_fila[:, :, np.newaxis] + lejos_columna[:, np.newaxis, :]).reshape(len(bloque), -1)
+
+        alcanza = existe & (minima <= radio_holgado)
+        contiene = alcanza & (maxima <= radio_estricto)
+        return pos, alcanza, contiene
+
+    # Comparar en el espacio del término 'a' de Haversine evita arcsin y raíces
+    phi = np.radians(lats)
+    lam = np.radians(lngs)
+    cos_phi = np.cos(phi)
+    umbral = geo.umbral_haversine(radio_km)
+
+    def haversine_a(o, j):
+        return geo.termino_haversine(phi[o], lam[o], cos_phi[o], phi[j], lam[j], cos_phi[j])
+
+    # 1. Núcleos: celdas densas completas y conteo de vecinos en el resto
+    todos = _Rejilla(claves, np.arange(n), total_claves)
+    es_nucleo = todos.conteo[todos.numerar(n)] >= minimo
+    for bloque in _bloques(np.flatnonzero(~es_nucleo)):
+        pos, alcanza, contiene = vecindad(bloque, todos)
+        conteo = todos.conteo[pos]
+        seguros = np.where(contiene, conteo, 0).sum(axis=1)
+        posibles = np.where(alcanza, conteo, 0).sum(axis=1)
+
+        # Solo se calculan distancias si las cotas no deciden
+        dudosos = (seguros < minimo) & (posibles >= minimo)
+        vecinos = np.zeros(n, dtype=np.int64)
+        for o, j in todos.pares(bloque, pos, alcanza & ~contiene & dudosos[:, np.newaxis]):
+            vecinos += np.bincount(o[haversine_a(o, j) <= umbral], minlength=n)
+        es_nucleo[bloque] = (seguros + vecinos[bloque]) >= minimo
+
+    nucleos = _Rejilla(claves, np.flatnonzero(es_nucleo), total_claves)
+    if not len(nucleos.indices):
+        return etiquetas
+    celda_nucleo = nucleos.numerar(n)
+    total_celdas = len(nucleos.unicas)
+
+    # 2. Conectar celdas de núcleos. Desde celdas pequeñas se evalúan los pares
+    #    en bloque; entre dos celdas densas se busca un par cercano con salida temprana
+    densa = nucleos.conteo > UMBRAL_CELDA_DENSA
+    origenes = nucleos.indices[~densa[celda_nucleo[nucleos.indices]]]
+    aristas = []
+    for bloque in _bloques(origenes):
+        pos, alcanza, contiene = vecindad(bloque, nucleos)
+        propia = celda_nucleo[bloque][:, np.newaxis]
+        alcanza &= pos != propia
+        contiene &= pos != propia
+
+        # Una celda vecina contenida en el círculo garantiza la conexión
+        filas_contenidas, columnas_contenidas = np.nonzero(contiene)
+        aristas.append(propia[filas_contenidas, 0] * total_celdas + pos[filas_contenidas, columnas_contenidas])
+
+        for o, j in nucleos.pares(bloque, pos, alcanza & ~contiene):
+            cerca = haversine_a(o, j) <= umbral
+            aristas.append(celda_nucleo[o[cerca]] * total_celdas + celda_nucleo[j[cerca]])
+
+    aristas = np.unique(np.concatenate(aristas)) if aristas else np.empty(0, dtype=np.int64)
+    componente = _componentes(total_celdas, aristas // total_celdas, aristas % total_celdas)
+
+    densas = np.flatnonzero(densa)
+    if len(densas):
+        pos, existe = nucleos.buscar(nucleos.unicas[densas][:, np.newaxis] + desplazamientos)
+        pares_densos = [
+            (a, b)
+            for a, b in zip(np.repeat(densas, len(desplazamientos))[existe.ravel()], pos[existe])
+            if a < b and densa[b]
+        ]
+        padre = {}
+
+        def raiz(c):
+            while padre.get(c, c) != c:
+                c = padre[c]
+            return c
+
+        for a, b in pares_densos:
+            ra, rb = raiz(componente[a]), raiz(componente[b])
+            if ra == rb:
+                continue
+            pa, pb = nucleos.puntos_de(a), nucleos.puntos_de(b)
+            if _hay_par_cercano(lats[pa], lngs[pa], lats[pb], lngs[pb], radio_km):
+                padre[max(ra, rb)] = min(ra, rb)
+
+        if padre:
+            componente = np.array([raiz(c) for c in componente])
+
+    # Numerar los grupos de forma compacta
+    _, grupo_de_celda = np.unique(componente, return_inverse=True)
+    etiquetas[nucleos.indices] = grupo_de_celda[celda_nucleo[nucleos.indices]]
+
+    # 3. Asignar los puntos frontera al núcleo más cercano dentro del radio
+    for bloque in _bloques(np.flatnonzero(~es_nucleo)):
+        pos, alcanza, _ = vecindad(bloque, nucleos)
+        for o, j in nucleos.pares(bloque, pos, alcanza):
+            d = haversine_a(o, j)
+            cerca = d <= umbral
+            o, j, d = o[cerca], j[cerca], d[cerca]
+            if not len(o):
+                continue
+            orden = np.lexsort((d, o))
+            primero = np.concatenate(([True], o[orden][1:] != o[orden][:-1]))
+            elegidos = orden[primero]
+            etiquetas[o[elegidos]] = etiquetas[j[elegidos]]
+
+    return etiquetas
+
+
+def indices_por_grupo(etiquetas):
+    """Convierte etiquetas en una lista de arreglos de índices, uno por grupo"""
+    validos = np.flatnonzero(etiquetas != RUIDO)
+    if not len(validos):
+        return []
+    orden = validos[np.argsort(etiquetas[validos], kind='stable')]
+    cortes = np.flatnonzero(np.diff(etiquetas[orden])) + 1
+    return np.split(orden, cortes)
@@ -11,6 +11,7 @@ class CoreConfig(AppConfig):
         # Importar aquí los módulos que registran señales para evitar import cycles
         try:
             import core.models
+            import core.signals
         except Exception:
             # Evitar que errores en imports impidan el arranque; se puede loguear si se desea
             pass
\ No newline at end of file
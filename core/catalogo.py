@@ -0,0 +1,106 @@
+"""
+Catálogo de viveros y zonas del mapa serializado a JSON y guardado en caché.
+Las claves llevan un número de versión que core.signals incrementa al cambiar
+un vivero o una zona, así las entradas viejas dejan de leerse sin borrarlas.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def datos_vivero(vivero):
+    """Datos de un vivero para los popups del mapa"""
+    return {
+        'id': vivero.id,
+        'nombre': vivero.nombre,
+        'lat': float(vivero.latitud),
+        'lng': float(vivero.longitud),
+        'direccion': vivero.direccion,
+        'telefono': vivero.telefono,
+        'horario': vivero.horario,
+        'especies': vivero.especies_disponibles,
+        'destacado': vivero.destacado,
+    }
+
+
+def datos_zona(zona):
+    """Datos de una zona para los popups del mapa"""
+    return {
+        'id': zona.id,
+        'nombre': zona.nombre,
+        'lat': float(zona.latitud),
+        'lng': float(zona.longitud),
+        'tipo': zona.tipo_terreno,
+        'descripcion': zona.descripcion,
+        'recomendaciones': zona.recomendaciones,
+    }
+
+
+class CatalogoMapa:
+    """Servicio del catálogo de viveros y zonas activas"""
+
+    # Con LocMemCache cada worker tiene su propia copia de la versión:
+    # la duración acota cuánto puede servir un worker un catálogo viejo
+    DURACION_CACHE = 600  # segundos
+    CLAVE_VERSION = 'catalogo_mapa:version'
+    TIPOS = ['viveros', 'zonas', 'todos']
+
+    @classmethod
+    def version(cls):
+        version = cache.get(cls.CLAVE_VERSION)
+        if version is None:
+            # Partir de la hora actual evita reutilizar versiones si la clave se pierde
+            cache.add(cls.CLAVE_VERSION, time.time_ns(), None)
+            version = cache.get(cls.CLAVE_VERSION, 0)
+        return version
+
+    @classmethod
+    def clave(cls, tipo):
+        return f'catalogo_mapa:{cls.version()}:{tipo}'
+
+    @classmethod
+    def cargar(cls, tipo):
+        """Retorna (JSON como bytes, huella del JSON) del catálogo desde la caché"""
+        clave = cls.clave(tipo)
+        entrada = cache.get(clave)
+        if entrada is None:
+            contenido = json.dumps(cls.calcular(tipo), cls=DjangoJSONEncoder).encode()
+            entrada = (contenido, hashlib.md5(contenido).hexdigest())
+            cache.set(clave, entrada, cls.DURACION_CACHE)
+        return entrada
+
+    @classmethod
+    def obtener(cls, tipo):
+        """Retorna el JSON del catálogo ('viveros', 'zonas' o 'todos') como bytes"""
+        return cls.cargar(tipo)[0]
+
+    @classmethod
+    def etag(cls, tipo):
+        """
+        Huella del mismo JSON que se envía: un worker con la caché local
+        desactualizada nunca sirve un cuerpo viejo bajo un ETag nuevo.
+        """
+        return cls.cargar(tipo)[1]
+
+    @classmethod
+    def invalidar(cls):
+        """Incrementa la versión: las claves anteriores quedan huérfanas y expiran solas"""
+        try:
+            cache.incr(cls.CLAVE_VERSION)
+        except ValueError:
+            # La versión no existe todavía o fue expulsada de la caché
+            cache.set(cls.CLAVE_VERSION, time.time_ns(), None)
+
+    @classmethod
+    def calcular(cls, tipo):
+        from .models import Vivero, Zona
+
+        data = {}
+        if tipo in ['viveros', 'todos']:
+            data['viveros'] = [datos_vivero(vivero) for vivero in Vivero.objects.order_by('id')]
+        if tipo in ['zonas', 'todos']:
+            data['zonas'] = [datos_zona(zona) for zona in Zona.objects.filter(activa=True).order_by('id')]
+        return data
@@ -0,0 +1,364 @@
+"""
+Índice de agrupamiento de marcadores para los mapas de ReforestGo.
+
+Cada capa (viveros, zonas activas y siembras pendientes) se resume por nivel
+de zoom en celdas de la proyección Web Mercator: cuántos puntos caen en la
+celda y la suma de sus coordenadas, para ubicar el marcador del grupo en el
+centroide. Los modelos aplican la diferencia al guardarse o eliminarse; el
+comando reconstruir_clusters recalcula el índice desde cero.
+"""
+from math import atan, degrees, floor, log, pi, radians, sin, sinh
+
+import numpy as np
+from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
+
+from . import geo
+
+# Niveles de zoom indexados; por encima de ZOOM_MAX se muestran los puntos
+ZOOM_MIN = 0
+ZOOM_MAX = 16
+
+# Celdas por lado de una tesela de 256 px (celdas de 64 px en pantalla)
+DIVISIONES_POR_TESELA = 4
+
+# Límite de latitud de la proyección Web Mercator
+LATITUD_MAXIMA = 85.05112878
+
+# Puntos individuales retornados como máximo por capa en una consulta
+MAX_PUNTOS = 500
+
+# Celdas por lado como máximo en una consulta (una pantalla de ~4000 px)
+MAX_CELDAS_LADO = 64
+
+# Celdas modificadas por consulta al aplicar cambios en lote
+TAMANO_LOTE_CELDAS = 100
+
+CAPAS = ['vivero', 'zona', 'pendiente']
+
+
+# ========== PROYECCIÓN ==========
+
+def escala(zoom):
+    """Celdas por lado del mundo en un nivel de zoom"""
+    return (2 ** zoom) * DIVISIONES_POR_TESELA
+
+
+def proyectar(lats, lngs):
+    """Proyecta coordenadas a Web Mercator normalizado: arreglos (u, v) en [0, 1)"""
+    lats = np.clip(geo.arreglo(lats), -LATITUD_MAXIMA, LATITUD_MAXIMA)
+    lngs = geo.arreglo(lngs)
+    senos = np.sin(np.radians(lats))
+    u = (lngs + 180.0) / 360.0
+    v = 0.5 - np.log((1 + senos) / (1 - senos)) / (4 * pi)
+    return np.clip(u, 0.0, 1.0), np.clip(v, 0.0, 1.0)
+
+
+def celda_en_zoom(lat, lng, zoom):
+    """Índices (x, y) de la celda de un punto en un nivel de zoom"""
+    lat = min(max(float(lat), -LATITUD_MAXIMA), LATITUD_MAXIMA)
+    seno = sin(radians(lat))
+    u = (float(lng) + 180.0) / 360.0
+    v = 0.5 - log((1 + seno) / (1 - seno)) / (4 * pi)
+    lado = escala(zoom)
+    return (
+        min(max(floor(u * lado), 0), lado - 1),
+        min(max(floor(v * lado), 0), lado - 1),
+    )
+
+
+def limites_celda(zoom, x, y):
+    """Caja (lat_min, lat_max, lng_min, lng_max) que cubre una celda"""
+    lado = escala(zoom)
+    return (
+        degrees(atan(sinh(pi * (1 - 2 * (y + 1) / lado)))),
+        degrees(atan(sinh(pi * (1 - 2 * y / lado)))),
+        x / lado * 360.0 - 180.0,
+        (x + 1) / lado * 360.0 - 180.0,
+    )
+
+
+def acumular(lats, lngs):
+    """
+    Agrupa puntos por celda en todos los niveles de zoom.
+    Retorna {(zoom, x, y): (cantidad, suma_lat, suma_lng)}.
+    """
+    lats = geo.arreglo(lats)
+    lngs = geo.arreglo(lngs)
+    if not len(lats):
+        return {}
+
+    u, v = proyectar(lats, lngs)
+    celdas = {}
+    for zoom in range(ZOOM_MIN, ZOOM_MAX + 1):
+        lado = escala(zoom)
+        xs = np.minimum((u * lado).astype(np.int64), lado - 1)
+        ys = np.minimum((v * lado).astype(np.int64), lado - 1)
+        claves, inverso = np.unique(np.stack([xs, ys], axis=1), axis=0, return_inverse=True)
+        inverso = inverso.ravel()
+        cantidades = np.bincount(inverso)
+        sumas_lat = np.bincount(inverso, weights=lats)
+        sumas_lng = np.bincount(inverso, weights=lngs)
+        for (x, y), cantidad, suma_lat, suma_lng in zip(
+            claves.tolist(), cantidades.tolist(), sumas_lat.tolist(), sumas_lng.tolist()
+        ):
+            celdas[(zoom, x, y)] = (cantidad, suma_lat, suma_lng)
+    return celdas
+
+
+# ========== MANTENIMIENTO INCREMENTAL ==========
+
+def punto(instancia):
+    """(capa, lat, lng) con que la instancia aparece en el índice, o None"""
+    capa = instancia.capa_cluster()
+    if capa is None or instancia.latitud is None or instancia.longitud is None:
+        return None
+    return capa, float(instancia.latitud), float(instancia.longitud)
+
+
+def recordar(instancia):
+    """Guarda el punto cargado de la base de datos para detectar cambios al guardar"""
+    if all(campo in instancia.__dict__ for campo in instancia.CAMPOS_CLUSTER):
+        instancia._cluster_original = punto(instancia)
+
+
+def cambio_al_guardar(instancia, update_fields=None):
+    """
+    Retorna (antes, después) del punto de la instancia para este guardado,
+    o None si el guardado no escribe campos que afecten al índice.
+    """
+    campos = instancia.CAMPOS_CLUSTER
+    if update_fields is not None and not set(campos) & set(update_fields):
+        return None
+
+    if instancia._state.adding:
+        antes = None
+    elif hasattr(instancia, '_cluster_original'):
+        antes = instancia._cluster_original
+    else:
+        # Punto original desconocido (instancia no cargada de la base de datos o campos diferidos)
+        original = type(instancia)._base_manager.filter(pk=instancia.pk).only(*campos).first()
+        antes = punto(original) if original is not None else None
+    return antes, punto(instancia)
+
+
+def aplicar_cambio(instancia, cambio):
+    """Mueve la instancia en el índice según el resultado de cambio_al_guardar"""
+    if cambio is None:
+        return
+    antes, despues = cambio
+    if antes != despues:
+        if antes is not None:
+            aplicar(antes[0], [antes[1]], [antes[2]], -1)
+        if despues is not None:
+            aplicar(despues[0], [despues[1]], [despues[2]], 1)
+    instancia._cluster_original = despues
+
+
+def quitar(instancia):
+    """Descuenta del índice una instancia eliminada"""
+    if hasattr(instancia, '_cluster_original'):
+        antes = instancia._cluster_original
+    else:
+        antes = punto(instancia)
+    if antes is not None:
+        aplicar(antes[0], [antes[1]], [antes[2]], -1)
+
+
+def filtro_celdas(claves):
+    """Q que selecciona las celdas (zoom, x, y) indicadas"""
+    filtro = Q()
+    for zoom, x, y in claves:
+        filtro |= Q(zoom=zoom, x=x, y=y)
+    return filtro
+
+
+def delta(lote, indice, signo, output_field):
+    """Expresión con la diferencia de cada celda del lote para un contador"""
+    diferencias = {celda: valores[indice] * signo for celda, valores in lote}
+    if len(set(diferencias.values())) == 1:
+        # Un solo punto: la misma diferencia en todos los niveles de zoom
+        return Value(next(iter(diferencias.values())), output_field=output_field)
+    return Case(
+        *[When(zoom=zoom, x=x, y=y, then=Value(valor)) for (zoom, x, y), valor in diferencias.items()],
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
+def sumar_lote(capa, lote, signo):
+    """Aplica las diferencias de un lote de celdas existentes; retorna cuántas se actualizaron"""
+    from .models import CeldaCluster
+
+    return CeldaCluster.objects.filter(filtro_celdas(dict(lote)), capa=capa).update(
+        cantidad=F('cantidad') + delta(lote, 0, signo, IntegerField()),
+        suma_lat=F('suma_lat') + delta(lote, 1, signo, FloatField()),
+        suma_lng=F('suma_lng') + delta(lote, 2, signo, FloatField()),
+    )
+
+
+def aplicar_por_filas(capa, celdas, signo):
+    """
+    Variante de aplicar para muchas celdas (acciones por lotes): un UPDATE por
+    celda con executemany, como oxigeno.actualizar_rango, porque los CASE de
+    sumar_lote cuestan más de armar que de ejecutar cuando el lote crece.
+    """
+    from django.db import connection, transaction
+    from .models import CeldaCluster
+
+    opts = CeldaCluster._meta
+
+    def columna(nombre):
+        return connection.ops.quote_name(opts.get_field(nombre).column)
+
+    tabla = connection.ops.quote_name(opts.db_table)
+    donde = f'{columna("capa")} = %s AND {columna("zoom")} = %s AND {columna("x")} = %s AND {columna("y")} = %s'
+    sumas = ', '.join(f'{columna(campo)} = {columna(campo)} + %s' for campo in ['cantidad', 'suma_lat', 'suma_lng'])
+
+    with transaction.atomic():
+        if signo > 0:
+            # Crear vacías las celdas que faltan; el UPDATE les suma después
+            CeldaCluster.objects.bulk_create(
+                [CeldaCluster(capa=capa, zoom=zoom, x=x, y=y) for (zoom, x, y), _ in celdas],
+                ignore_conflicts=True,
+                batch_size=1000,
+            )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {tabla} SET {sumas} WHERE {donde}',
+                [
+                    (cantidad * signo, suma_lat * signo, suma_lng * signo, capa, zoom, x, y)
+                    for (zoom, x, y), (cantidad, suma_lat, suma_lng) in celdas
+                ],
+            )
+            if signo < 0:
+                cursor.executemany(
+                    f'DELETE FROM {tabla} WHERE {donde} AND {columna("cantidad")} <= 0',
+                    [(capa, zoom, x, y) for (zoom, x, y), _ in celdas],
+                )
+
+
+def aplicar(capa, lats, lngs, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) puntos de una capa en todas sus celdas
+    con una actualización atómica por lote de celdas.
+    """
+    from .models import CeldaCluster
+
+    celdas = list(acumular(lats, lngs).items())
+    if len(celdas) > TAMANO_LOTE_CELDAS:
+        aplicar_por_filas(capa, celdas, signo)
+        return
+
+    for inicio in range(0, len(celdas), TAMANO_LOTE_CELDAS):
+        lote = celdas[inicio:inicio + TAMANO_LOTE_CELDAS]
+        actualizadas = sumar_lote(capa, lote, signo)
+
+        if signo < 0:
+            CeldaCluster.objects.filter(filtro_celdas(dict(lote)), capa=capa, cantidad__lte=0).delete()
+        elif actualizadas < len(lote):
+            # Crear vacías las celdas que faltan y sumarles después: otro proceso pudo crearlas primero
+            existentes = set(
+                CeldaCluster.objects.filter(filtro_celdas(dict(lote)), capa=capa).values_list('zoom', 'x', 'y')
+            )
+            nuevas = [(celda, valores) for celda, valores in lote if celda not in existentes]
+            if nuevas:
+                CeldaCluster.objects.bulk_create(
+                    [CeldaCluster(capa=capa, zoom=zoom, x=x, y=y) for (zoom, x, y), _ in nuevas],
+                    ignore_conflicts=True,
+                )
+                sumar_lote(capa, nuevas, signo)
+
+
+def reconstruir(capa):
+    """Recalcula desde cero las celdas de una capa; retorna cuántas se crearon"""
+    from django.db import transaction
+    from .models import CeldaCluster
+
+    coordenadas = list(queryset_capa(capa).order_by().values_list('latitud', 'longitud'))
+    lats, lngs = zip(*coordenadas) if coordenadas else ((), ())
+    celdas = [
+        CeldaCluster(capa=capa, zoom=zoom, x=x, y=y, cantidad=cantidad, suma_lat=suma_lat, suma_lng=suma_lng)
+        for (zoom, x, y), (cantidad, suma_lat, suma_lng) in acumular(lats, lngs).items()
+    ]
+    with transaction.atomic():
+        CeldaCluster.objects.filter(capa=capa).delete()
+        CeldaCluster.objects.bulk_create(celdas, batch_size=1000)
+    return len(celdas)
+
+
+# ========== CONSULTAS ==========
+
+def queryset_capa(capa):
+    """Filas que forman una capa del índice (ver capa_cluster de cada modelo)"""
+    from .models import Siembra, Vivero, Zona
+
+    if capa == 'vivero':
+        return Vivero.objects.all()
+    if capa == 'zona':
+        return Zona.objects.filter(activa=True)
+    if capa == 'pendiente':
+        return Siembra.objects.filter(estado='pendiente')
+    raise ValueError(f'Capa desconocida: {capa}')
+
+
+def en_limites(queryset, lat_min, lat_max, lng_min, lng_max):
+    """Filtra un queryset con latitud/longitud a una caja"""
+    if hasattr(queryset, 'en_limites'):
+        return queryset.en_limites(lat_min, lat_max, lng_min, lng_max)
+    return queryset.filter(
+        latitud__gte=lat_min, latitud__lte=lat_max,
+        longitud__gte=lng_min, longitud__lte=lng_max,
+    )
+
+
+def consultar(capa, queryset, serializar, zoom, lat_min, lat_max, lng_min, lng_max):
+    """
+    Marcadores visibles de una capa en la caja para un nivel de zoom.
+    Con zoom > ZOOM_MAX retorna los puntos; si no, los grupos del índice,
+    y las celdas con un solo punto se reemplazan por ese punto.
+    Lanza ValueError si la caja cubre más de MAX_CELDAS_LADO celdas por lado.
+    `queryset` son las filas de la capa que se pueden mostrar como punto
+    y `serializar` convierte una fila en el dict que recibe el mapa.
+    """
+    from .models import CeldaCluster
+
+    if zoom > ZOOM_MAX:
+        filas = en_limites(queryset, lat_min, lat_max, lng_min, lng_max)[:MAX_PUNTOS]
+        return [dict(serializar(fila), cluster=False) for fila in filas]
+
+    zoom = max(zoom, ZOOM_MIN)
+    x_min, y_min = celda_en_zoom(lat_max, lng_min, zoom)
+    x_max, y_max = celda_en_zoom(lat_min, lng_max, zoom)
+    if x_max - x_min >= MAX_CELDAS_LADO or y_max - y_min >= MAX_CELDAS_LADO:
+        raise ValueError('La caja es demasiado grande para el nivel de zoom')
+    celdas = CeldaCluster.objects.filter(
+        capa=capa, zoom=zoom, x__gte=x_min, x__lte=x_max, y__gte=y_min, y__lte=y_max
+    ).values_list('x', 'y', 'cantidad', 'suma_lat', 'suma_lng')
+
+    marcadores = {}
+    sueltas = []
+    for x, y, cantidad, suma_lat, suma_lng in celdas:
+        marcadores[(x, y)] = {
+            'cluster': True,
+            'lat': suma_lat / cantidad,
+            'lng': suma_lng / cantidad,
+            'cantidad': cantidad,
+        }
+        if cantidad == 1:
+            sueltas.append((x, y))
+
+    if sueltas:
+        filtro = Q()
+        for x, y in sueltas[:MAX_PUNTOS]:
+            celda_lat_min, celda_lat_max, celda_lng_min, celda_lng_max = limites_celda(zoom, x, y)
+            filtro |= Q(
+                latitud__gte=celda_lat_min, latitud__lte=celda_lat_max,
+                longitud__gte=celda_lng_min, longitud__lte=celda_lng_max,
+            )
+        for fila in queryset.filter(filtro):
+            celda = celda_en_zoom(fila.latitud, fila.longitud, zoom)
+            marcador = marcadores.get(celda)
+            if marcador is not None and marcador['cluster'] and marcador['cantidad'] == 1:
+                marcadores[celda] = dict(serializar(fila), cluster=False)
+
+    return list(marcadores.values())
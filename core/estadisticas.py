@@ -0,0 +1,69 @@
+"""
+Estadísticas por usuario (siembras por estado e impacto ambiental)
+calculadas en una sola consulta y guardadas en caché.
+La caché se invalida desde core.signals al cambiar siembras o verificaciones.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from . import oxigeno
+
+
+class EstadisticasUsuario:
+    """Servicio de estadísticas de siembras de un usuario"""
+
+    DURACION_CACHE = 300  # segundos
+    ESTADOS = ['pendiente', 'en_verificacion', 'validada', 'rechazada']
+
+    @staticmethod
+    def clave(usuario_id):
+        return f'estadisticas_usuario:{usuario_id}'
+
+    @classmethod
+    def obtener(cls, usuario):
+        """
+        Retorna un dict con total, validadas, pendientes, en_verificacion,
+        rechazadas, oxigeno y co2 del usuario.
+        """
+        usuario_id = getattr(usuario, 'pk', usuario)
+        estadisticas = cache.get(cls.clave(usuario_id))
+        if estadisticas is None:
+            estadisticas = cls.calcular(usuario_id)
+            cache.set(cls.clave(usuario_id), estadisticas, cls.DURACION_CACHE)
+        return estadisticas
+
+    @classmethod
+    def invalidar(cls, usuario_id):
+        cache.delete(cls.clave(usuario_id))
+
+    @classmethod
+    def calcular(cls, usuario_id):
+        """Calcula las estadísticas con una agregación condicional"""
+        from .models import Siembra
+
+        ahora = timezone.now()
+        validada = Q(estado='validada')
+        limite = ahora - timedelta(days=oxigeno.DIAS_POR_TRAMO)
+        siembras = Siembra.objects.filter(usuario_id=usuario_id)
+
+        datos = siembras.aggregate(
+            total=Count('id'),
+            validadas=Count('id', filter=validada),
+            pendientes=Count('id', filter=Q(estado='pendiente')),
+            en_verificacion=Count('id', filter=Q(estado='en_verificacion')),
+            rechazadas=Count('id', filter=Q(estado='rechazada')),
+            oxigeno=Sum('oxigeno_generado', filter=validada),
+            co2=Sum('co2_absorbido', filter=validada),
+            desactualizadas=Count('id', filter=validada & Q(ultima_actualizacion_oxigeno__lt=limite)),
+        )
+
+        if datos.pop('desactualizadas'):
+            # Hay valores de oxígeno viejos: recalcularlos en memoria (ver impacto_oxigeno)
+            datos['oxigeno'], datos['co2'] = siembras.impacto_oxigeno(ahora)
+
+        datos['oxigeno'] = float(datos['oxigeno'] or 0)
+        datos['co2'] = float(datos['co2'] or 0)
+        return datos
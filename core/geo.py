@@ -0,0 +1,194 @@
+"""
+Utilidades geográficas para ReforestGo: distancias Haversine vectorizadas,
+rejilla espacial y cajas de búsqueda
+"""
+from math import asin, cos, floor, radians, sin, sqrt
+
+import numpy as np
+
+# Radio medio de la Tierra en km
+RADIO_TIERRA_KM = 6371
+
+# Tamaño de la celda de la rejilla en grados (~1.1 km en el ecuador)
+TAMANO_CELDA_GRADOS = 0.01
+
+# Kilómetros por grado de latitud (aproximación esférica)
+KM_POR_GRADO = 111.195
+
+# Si una búsqueda cubre más celdas que esto, se filtra solo por caja
+MAX_CELDAS_CONSULTA = 400
+
+
+# ========== DISTANCIAS ==========
+
+def arreglo(valores):
+    """Convierte coordenadas (floats o Decimals) en un arreglo float64 contiguo"""
+    if isinstance(valores, np.ndarray) and valores.dtype == np.float64:
+        return np.ascontiguousarray(valores)
+    return np.fromiter((float(v) for v in valores), dtype=np.float64)
+
+
+def distancia_km(lat1, lng1, lat2, lng2):
+    """Distancia en km entre dos puntos usando la fórmula de Haversine"""
+    lat1 = radians(float(lat1))
+    lat2 = radians(float(lat2))
+    dlat = lat2 - lat1
+    dlng = radians(float(lng2)) - radians(float(lng1))
+
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * asin(sqrt(min(a, 1.0)))
+
+
+def termino_haversine(phi1, lam1, cos_phi1, phi2, lam2, cos_phi2):
+    """
+    Término 'a' de Haversine entre puntos en radianes, con los cosenos de las
+    latitudes ya calculados. Crece con la distancia: compararlo con
+    umbral_haversine(radio_km) decide si dos puntos están a radio_km o menos
+    sin arcsin ni raíces.
+    """
+    return np.sin((phi2 - phi1) / 2) ** 2 + cos_phi1 * cos_phi2 * np.sin((lam2 - lam1) / 2) ** 2
+
+
+def umbral_haversine(radio_km):
+    """Término 'a' de Haversine que corresponde a una distancia de radio_km"""
+    return sin(radio_km / (2 * RADIO_TIERRA_KM)) ** 2
+
+
+def km_desde_termino(a):
+    """Convierte el término 'a' de Haversine en kilómetros"""
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distancias_km(lat, lng, lats, lngs):
+    """
+    Distancias en km desde un punto hacia muchos (uno a muchos).
+    Retorna un arreglo con la misma longitud que lats/lngs.
+    """
+    lat = radians(float(lat))
+    lng = radians(float(lng))
+    lats = np.radians(arreglo(lats))
+    lngs = np.radians(arreglo(lngs))
+    return km_desde_termino(termino_haversine(lat, lng, cos(lat), lats, lngs, np.cos(lats)))
+
+
+def distancias_pares_km(lats1, lngs1, lats2, lngs2):
+    """Distancias en km entre pares de puntos elemento a elemento"""
+    lats1 = np.radians(arreglo(lats1))
+    lngs1 = np.radians(arreglo(lngs1))
+    lats2 = np.radians(arreglo(lats2))
+    lngs2 = np.radians(arreglo(lngs2))
+    return km_desde_termino(termino_haversine(lats1, lngs1, np.cos(lats1), lats2, lngs2, np.cos(lats2)))
+
+
+def matriz_distancias_km(lats1, lngs1, lats2, lngs2):
+    """
+    Matriz de distancias en km (muchos a muchos) con forma
+    (len(lats1), len(lats2)).
+    """
+    lats1 = np.radians(arreglo(lats1))[:, np.newaxis]
+    lngs1 = np.radians(arreglo(lngs1))[:, np.newaxis]
+    lats2 = np.radians(arreglo(lats2))[np.newaxis, :]
+    lngs2 = np.radians(arreglo(lngs2))[np.newaxis, :]
+    return km_desde_termino(termino_haversine(lats1, lngs1, np.cos(lats1), lats2, lngs2, np.cos(lats2)))
+
+
+# ========== REJILLA ESPACIAL ==========
+
+def indice_celda(lat, lng):
+    """Retorna los índices enteros (fila, columna) de la celda de un punto"""
+    return (
+        floor(float(lat) / TAMANO_CELDA_GRADOS),
+        floor(float(lng) / TAMANO_CELDA_GRADOS),
+    )
+
+
+def clave_celda(fila, columna):
+    """Serializa los índices de una celda como texto indexable"""
+    return f"{fila}:{columna}"
+
+
+def celda_para(lat, lng):
+    """Retorna la clave de celda de la rejilla para un punto"""
+    return clave_celda(*indice_celda(lat, lng))
+
+
+# ========== CAJAS DE BÚSQUEDA ==========
+
+def caja_alrededor(lat, lng, radio_km):
+    """
+    Calcula la caja (lat_min, lat_max, lng_min, lng_max) que contiene
+    el círculo de radio_km alrededor del punto.
+    """
+    lat = float(lat)
+    lng = float(lng)
+    delta_lat = radio_km / KM_POR_GRADO
+
+    # Cerca de los polos la caja cubre todas las longitudes
+    cos_lat = cos(radians(min(abs(lat) + delta_lat, 90.0)))
+    if cos_lat < 1e-6:
+        delta_lng = 180.0
+    else:
+        delta_lng = min(radio_km / (KM_POR_GRADO * cos_lat), 180.0)
+
+    return (
+        max(lat - delta_lat, -90.0),
+        min(lat + delta_lat, 90.0),
+        lng - delta_lng,
+        lng + delta_lng,
+    )
+
+
+def caja_interior(lat, lng, radio_km):
+    """
+    Calcula una caja (lat_min, lat_max, lng_min, lng_max) contenida en el
+    círculo de radio_km alrededor del punto, con margen para la curvatura.
+    Todo punto dentro de ella está a menos de radio_km.
+    """
+    lat = float(lat)
+    lng = float(lng)
+    mitad_km = radio_km / sqrt(2) * 0.95
+    delta_lat = mitad_km / KM_POR_GRADO
+
+    # El grado de longitud es más ancho en la latitud más cercana al ecuador
+    lat_cercana_ecuador = 0.0 if abs(lat) <= delta_lat else abs(lat) - delta_lat
+    delta_lng = mitad_km / (KM_POR_GRADO * cos(radians(lat_cercana_ecuador)))
+
+    return lat - delta_lat, lat + delta_lat, lng - delta_lng, lng + delta_lng
+
+
+def celdas_en_caja(lat_min, lat_max, lng_min, lng_max):
+    """
+    Lista las claves de celda que cubren la caja, o None si son
+    demasiadas para usarlas en un filtro IN.
+    """
+    fila_min, col_min = indice_celda(lat_min, lng_min)
+    fila_max, col_max = indice_celda(lat_max, lng_max)
+
+    total = (fila_max - fila_min + 1) * (col_max - col_min + 1)
+    if total > MAX_CELDAS_CONSULTA:
+        return None
+
+    return [
+        clave_celda(fila, columna)
+        for fila in range(fila_min, fila_max + 1)
+        for columna in range(col_min, col_max + 1)
+    ]
+
+
+# ========== VECINOS MÁS CERCANOS ==========
+
+def indices_mas_cercanos(distancias, ids, k):
+    """
+    Índices de las k distancias menores ordenadas de menor a mayor, con
+    empates desempatados por id. Usa selección parcial (O(n)) en lugar
+    de ordenar todo el arreglo.
+    """
+    if k <= 0 or not len(distancias):
+        return np.array([], dtype=np.int64)
+    if k < len(distancias):
+        umbral = np.partition(distancias, k - 1)[k - 1]
+        candidatos = np.flatnonzero(distancias <= umbral)
+    else:
+        candidatos = np.arange(len(distancias))
+    orden = np.lexsort((ids[candidatos], distancias[candidatos]))
+    return candidatos[orden[:k]]
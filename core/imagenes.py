@@ -0,0 +1,221 @@
+"""
+Procesamiento de las fotos subidas a ReforestGo.
+
+Cuando el archivo de una foto cambia, el modelo encola una TareaImagen;
+el comando procesar_imagenes optimiza el original y genera versiones de
+tamaño fijo que se registran en el campo versiones_foto del modelo.
+Sin IMAGENES_EN_COLA la misma petición procesa la tarea tras el commit.
+Los guardados de estado (validar, rechazar, oxígeno...) no tocan archivos.
+"""
+import os
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+# Lado máximo en píxeles de la foto original optimizada
+LADO_MAXIMO = 1200
+
+# Versiones generadas: nombre -> (lado máximo, formato, extensión)
+VERSIONES = {
+    'miniatura': (64, 'JPEG', 'jpg'),
+    'tarjeta': (400, 'JPEG', 'jpg'),
+    'webp': (1200, 'WEBP', 'webp'),
+}
+
+# Carpeta del storage donde se guardan las versiones
+CARPETA_VERSIONES = 'versiones'
+
+
+# ========== DETECCIÓN DE CAMBIOS ==========
+
+def recordar_fotos(instancia, campos):
+    """Guarda los nombres de archivo cargados para detectar reemplazos"""
+    originales = {}
+    for campo in campos:
+        valor = instancia.__dict__.get(campo)
+        originales[campo] = getattr(valor, 'name', valor) or None
+    instancia._fotos_originales = originales
+
+
+def fotos_cambiadas(instancia, campos, update_fields=None):
+    """
+    Lista los campos de foto nuevos o distintos de los cargados de la base
+    de datos que se escribirán en este guardado.
+    """
+    originales = getattr(instancia, '_fotos_originales', {})
+    cambiadas = []
+    for campo in campos:
+        if update_fields is not None and campo not in update_fields:
+            continue
+        if campo not in instancia.__dict__:
+            continue  # Campo diferido y no asignado: no cambió
+        if (getattr(instancia, campo).name or None) != originales.get(campo):
+            cambiadas.append(campo)
+    return cambiadas
+
+
+def encolar(instancia, campos):
+    """Encola el procesamiento de las fotos indicadas de una instancia ya guardada"""
+    from .models import TareaImagen
+
+    modelo = instancia._meta.model_name
+    if not hasattr(instancia, '_fotos_originales'):
+        instancia._fotos_originales = {}
+    for campo in campos:
+        instancia._fotos_originales[campo] = getattr(instancia, campo).name or None
+        tarea, _ = TareaImagen.objects.get_or_create(
+            modelo=modelo, objeto_id=instancia.pk, campo=campo, estado='pendiente'
+        )
+        if not settings.IMAGENES_EN_COLA:
+            # Sin proceso procesar_imagenes desplegado: procesar al confirmar la
+            # transacción; si falla, la tarea queda en la cola para reintentarla
+            transaction.on_commit(partial(atender_tarea, tarea.pk), robust=True)
+
+
+# ========== PROCESAMIENTO ==========
+
+def es_imagen(ruta):
+    """Verifica que el archivo sea una imagen que Pillow puede leer"""
+    try:
+        with Image.open(ruta) as img:
+            img.verify()
+        return True
+    except Exception:
+        return False
+
+
+def a_rgb(img):
+    """Convierte la imagen a RGB con fondo blanco si tiene transparencia o paleta"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        rgb_img.paste(img, mask=img.split()[-1])
+        return rgb_img
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def optimizar_foto(archivo):
+    """Reduce la foto a LADO_MAXIMO píxeles por lado y la guarda sobre el original"""
+    img = a_rgb(Image.open(archivo.path))
+
+    if img.height > LADO_MAXIMO or img.width > LADO_MAXIMO:
+        img.thumbnail((LADO_MAXIMO, LADO_MAXIMO), Image.Resampling.LANCZOS)
+        img.save(archivo.path, quality=85, optimize=True)
+
+
+def generar_versiones(archivo):
+    """Genera las VERSIONES de una foto y retorna {nombre: ruta en el storage}"""
+    archivo.open('rb')
+    try:
+        img = Image.open(archivo)
+        img = a_rgb(ImageOps.exif_transpose(img))
+    finally:
+        archivo.close()
+
+    base = os.path.splitext(archivo.name)[0]
+    versiones = {}
+    for nombre, (lado, formato, extension) in VERSIONES.items():
+        copia = img.copy()
+        copia.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        copia.save(buffer, formato, quality=80, optimize=True)
+
+        ruta = f'{CARPETA_VERSIONES}/{base}_{nombre}.{extension}'
+        if archivo.storage.exists(ruta):
+            archivo.storage.delete(ruta)
+        versiones[nombre] = archivo.storage.save(ruta, ContentFile(buffer.getvalue()))
+    return versiones
+
+
+def procesar_tarea(tarea):
+    """Optimiza la foto de una tarea y registra sus versiones en el modelo"""
+    from django.apps import apps
+
+    modelo = apps.get_model('core', tarea.modelo)
+    instancia = modelo.objects.filter(pk=tarea.objeto_id).first()
+    if instancia is None:
+        return  # El objeto se eliminó antes de procesar su foto
+
+    archivo = getattr(instancia, tarea.campo)
+    versiones = {}
+    if archivo:
+        optimizar_foto(archivo)
+        versiones = generar_versiones(archivo)
+
+    with transaction.atomic():
+        fila = modelo.objects.select_for_update().only('versiones_foto').get(pk=instancia.pk)
+        versiones_foto = dict(fila.versiones_foto)
+        versiones_foto[tarea.campo] = versiones
+        cambios = {'versiones_foto': versiones_foto}
+        nombres = {campo.name for campo in modelo._meta.concrete_fields}
+        if 'foto_procesada' in nombres:
+            cambios['foto_procesada'] = True
+        if 'fecha_actualizacion' in nombres:
+            # update() no aplica auto_now
+            cambios['fecha_actualizacion'] = timezone.now()
+        modelo.objects.filter(pk=instancia.pk).update(**cambios)
+
+
+def atender_tarea(tarea_id, max_intentos=3):
+    """
+    Reclama y procesa una tarea pendiente. Retorna True si se completó,
+    False si falló y None si otro proceso la tomó primero.
+    """
+    from .models import TareaImagen
+
+    # Reclamar la tarea; otro proceso pudo tomarla primero
+    if not TareaImagen.objects.filter(pk=tarea_id, estado='pendiente').update(estado='procesando'):
+        return None
+
+    tarea = TareaImagen.objects.get(pk=tarea_id)
+    tarea.intentos += 1
+    try:
+        procesar_tarea(tarea)
+    except Exception as e:
+        tarea.estado = 'error' if tarea.intentos >= max_intentos else 'pendiente'
+        tarea.error = str(e)
+    else:
+        tarea.estado = 'completada'
+        tarea.error = ''
+    tarea.save(update_fields=['estado', 'intentos', 'error', 'fecha_actualizacion'])
+    return tarea.estado == 'completada'
+
+
+def procesar_pendientes(lote=50, max_intentos=3):
+    """
+    Toma hasta `lote` tareas pendientes de la cola y las procesa.
+    Retorna (completadas, fallidas).
+    """
+    from .models import TareaImagen
+
+    completadas = fallidas = 0
+    ids = list(
+        TareaImagen.objects.filter(estado='pendiente').order_by('id').values_list('id', flat=True)[:lote]
+    )
+    for tarea_id in ids:
+        resultado = atender_tarea(tarea_id, max_intentos)
+        if resultado is True:
+            completadas += 1
+        elif resultado is False:
+            fallidas += 1
+
+    return completadas, fallidas
+
+
+# ========== URLS ==========
+
+def url_version(archivo, version):
+    """URL de una versión de la foto, o del original si aún no se generó"""
+    if not archivo:
+        return ''
+    versiones = getattr(archivo.instance, 'versiones_foto', None) or {}
+    ruta = versiones.get(archivo.field.name, {}).get(version)
+    return archivo.storage.url(ruta) if ruta else archivo.url
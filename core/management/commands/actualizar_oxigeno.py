@@ -1,7 +1,12 @@
-from django.core.management.base import BaseCommand
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
 from core.models import Siembra
+from core.oxigeno import actualizar_rango, actualizar_rango_en_proceso
+from django.db import connections
+from django.db.models import Max, Min, Sum
 from django.utils import timezone
-from django.db.models import Sum
 import traceback
 
 
@@ -14,49 +19,98 @@ class Command(BaseCommand):
             action='store_true',
             help='Muestra información detallada del proceso',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Siembras leídas y escritas por lote (por defecto: 2000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Procesos en paralelo, cada uno sobre un rango de ids (por defecto: 1)',
+        )
+        parser.add_argument(
+            '--only-stale',
+            action='store_true',
+            help='Omite las siembras cuyo tramo de edad no cambió desde la última actualización',
+        )
 
     def handle(self, *args, **options):
         verbose = options.get('verbose', False)
+        tamano_lote = options['chunk_size']
+        workers = options['workers']
+        solo_desactualizadas = options['only_stale']
+
+        if tamano_lote < 1:
+            raise CommandError('--chunk-size debe ser mayor que 0')
+        if workers < 1:
+            raise CommandError('--workers debe ser mayor que 0')
 
         self.stdout.write(self.style.SUCCESS('🌿 Iniciando actualización de oxígeno...'))
 
         # Obtener todas las siembras validadas
         siembras_validadas = Siembra.objects.filter(estado='validada')
+        limites = siembras_validadas.aggregate(desde=Min('id'), hasta=Max('id'))
         total = siembras_validadas.count()
 
         self.stdout.write(f'📊 Total de siembras validadas: {total}')
 
+        # Todos los lotes usan la misma fecha de referencia
+        ahora = timezone.now()
+        inicio = perf_counter()
+        revisadas = 0
         actualizadas = 0
         errores = 0
 
-        for siembra in siembras_validadas.iterator():
-            try:
-                oxigeno_anterior = siembra.oxigeno_generado
-                # calcular_oxigeno() guarda internamente el objeto
-                siembra.calcular_oxigeno()
-
-                if verbose:
-                    especie = siembra.especie or 'Sin especie'
-                    self.stdout.write(
-                        f'  ✓ Siembra #{siembra.id} - {especie}: '
-                        f'{oxigeno_anterior} → {siembra.oxigeno_generado} kg O2/año'
-                    )
-
-                actualizadas += 1
+        if total:
+            rangos = self.dividir_rangos(limites['desde'], limites['hasta'] + 1, workers)
 
-            except Exception as e:
-                errores += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  ✗ Error en siembra #{siembra.id}: {str(e)}')
-                )
-                if verbose:
-                    for l in traceback.format_exc().splitlines():
-                        self.stdout.write(self.style.ERROR('    ' + l))
+            if workers == 1:
+                try:
+                    revisadas, actualizadas = actualizar_rango(
+                        rangos[0][0], rangos[0][1], tamano_lote, solo_desactualizadas, ahora
+                    )
+                except Exception as e:
+                    errores += 1
+                    self.mostrar_error(rangos[0], e, verbose)
+            else:
+                # Los procesos hijos no deben heredar la conexión abierta
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    tareas = {
+                        executor.submit(
+                            actualizar_rango_en_proceso, desde, hasta, tamano_lote, solo_desactualizadas, ahora
+                        ): (desde, hasta)
+                        for desde, hasta in rangos
+                    }
+                    for tarea in as_completed(tareas):
+                        desde, hasta = tareas[tarea]
+                        try:
+                            rango_revisadas, rango_actualizadas = tarea.result()
+                        except Exception as e:
+                            errores += 1
+                            self.mostrar_error((desde, hasta), e, verbose)
+                            continue
+
+                        revisadas += rango_revisadas
+                        actualizadas += rango_actualizadas
+                        if verbose:
+                            self.stdout.write(
+                                f'  ✓ Ids {desde}-{hasta - 1}: {rango_actualizadas} de {rango_revisadas} actualizadas'
+                            )
+
+        duracion = perf_counter() - inicio
 
         # Estadísticas finales
         self.stdout.write(self.style.SUCCESS('\n📈 Resumen de actualización:'))
-        self.stdout.write(f'  ✅ Siembras procesadas: {actualizadas}')
-        self.stdout.write(f'  ❌ Errores: {errores}')
+        self.stdout.write(f'  🔎 Siembras revisadas: {revisadas}')
+        self.stdout.write(f'  ✅ Siembras actualizadas: {actualizadas}')
+        if solo_desactualizadas:
+            self.stdout.write(f'  ⏭️  Sin cambios de tramo: {revisadas - actualizadas}')
+        self.stdout.write(f'  ❌ Rangos con error: {errores}')
+        self.stdout.write(f'  ⏱️  Tiempo: {duracion:.2f} s')
 
         # Calcular total de oxígeno y CO2
         totales = Siembra.objects.filter(estado='validada').aggregate(
@@ -75,3 +129,23 @@ class Command(BaseCommand):
         self.stdout.write(f'  🚗 Equivalente a: {equivalentes:.2f} autos fuera de circulación')
 
         self.stdout.write(self.style.SUCCESS('\n✨ Actualización completada exitosamente!'))
+
+    def mostrar_error(self, rango, error, verbose):
+        """Informa un rango de ids que no se pudo actualizar"""
+        desde, hasta = rango
+        self.stdout.write(
+            self.style.ERROR(f'  ✗ Error en ids {desde}-{hasta - 1}: {str(error)}')
+        )
+        if verbose:
+            for l in traceback.format_exc().splitlines():
+                self.stdout.write(self.style.ERROR('    ' + l))
+
+    def dividir_rangos(self, desde, hasta, workers):
+        """Divide [desde, hasta) en rangos de ids para repartir entre procesos"""
+        if workers == 1:
+            return [(desde, hasta)]
+
+        # Varios rangos por proceso para equilibrar la carga
+        partes = workers * 4
+        paso = max(1, -(-(hasta - desde) // partes))
+        return [(inicio, min(inicio + paso, hasta)) for inicio in range(desde, hasta, paso)]
@@ -33,7 +33,7 @@ class Command(BaseCommand):
             
             # Asignar rol de verificador
             perfil.rol = 'verificador'
-            perfil.save()
+            perfil.save(update_fields=['rol'])
             
             self.stdout.write(
                 self.style.SUCCESS(
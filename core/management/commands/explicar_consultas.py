@@ -0,0 +1,146 @@
+"""
+Comando de gestión que muestra el plan de ejecución (EXPLAIN) de las consultas
+más frecuentes y señala las que recorren una tabla completa
+Uso: python manage.py explicar_consultas [--verbose] [--analyze] [--estricto]
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Max
+from django.utils import timezone
+from core import geo
+from core.models import CeldaCluster, Eliminacion, Perfil, Siembra, SiembraZona, TareaImagen, Verificacion, Zona
+from django.contrib.auth.models import User
+
+# Marcas de recorrido completo en el plan según el motor
+RECORRIDOS_COMPLETOS = {
+    'postgresql': ['Seq Scan'],
+    'sqlite': ['SCAN '],
+    'mysql': ['type: ALL', "'type': 'ALL'"],
+}
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta EXPLAIN sobre las consultas frecuentes y señala los recorridos completos de tabla'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Muestra el plan completo de cada consulta',
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Ejecuta las consultas y muestra tiempos reales (EXPLAIN ANALYZE, solo PostgreSQL)',
+        )
+        parser.add_argument(
+            '--estricto',
+            action='store_true',
+            help='Termina con error si alguna consulta recorre una tabla completa',
+        )
+
+    def handle(self, *args, **options):
+        verbose = options['verbose']
+        opciones_explain = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--analyze solo está disponible con PostgreSQL')
+            opciones_explain = {'analyze': True}
+
+        self.stdout.write(self.style.SUCCESS(f'🔬 Planes de ejecución ({connection.vendor})...'))
+
+        consultas = self.consultas_frecuentes()
+        con_recorrido = []
+        for nombre, consulta in consultas:
+            plan = consulta.explain(**opciones_explain)
+            recorridos = self.recorridos_completos(plan)
+
+            if recorridos:
+                con_recorrido.append(nombre)
+                self.stdout.write(self.style.WARNING(f'  ⚠️  {nombre}'))
+                for linea in recorridos:
+                    self.stdout.write(self.style.WARNING(f'      {linea}'))
+            else:
+                self.stdout.write(f'  ✅ {nombre}')
+
+            if verbose:
+                for linea in plan.splitlines():
+                    self.stdout.write(f'      {linea}')
+
+        self.stdout.write(self.style.SUCCESS('\n📈 Resumen:'))
+        self.stdout.write(f'  🔎 Consultas revisadas: {len(consultas)}')
+        self.stdout.write(f'  ⚠️  Con recorrido completo: {len(con_recorrido)}')
+        if con_recorrido and connection.vendor == 'postgresql':
+            self.stdout.write(
+                '  💡 En tablas pequeñas PostgreSQL prefiere recorrerlas; ejecuta ANALYZE y revisa con datos reales'
+            )
+
+        if con_recorrido and options['estricto']:
+            raise CommandError(f'{len(con_recorrido)} consulta(s) recorren una tabla completa')
+
+    def recorridos_completos(self, plan):
+        """Líneas del plan que indican un recorrido completo de tabla"""
+        marcas = RECORRIDOS_COMPLETOS.get(connection.vendor, [])
+        lineas = []
+        for linea in plan.splitlines():
+            if not any(marca in linea for marca in marcas):
+                continue
+            # En SQLite "SCAN ... USING INDEX" recorre un índice, no la tabla
+            if connection.vendor == 'sqlite' and 'USING' in linea and 'INDEX' in linea:
+                continue
+            lineas.append(linea.strip())
+        return lineas
+
+    def consultas_frecuentes(self):
+        """Consultas representativas de las vistas, el admin y los comandos"""
+        usuario_id = User.objects.order_by('id').values_list('id', flat=True).first() or 0
+        zona_id = Zona.objects.order_by('id').values_list('id', flat=True).first() or 0
+        siembra_id = Siembra.objects.order_by('id').values_list('id', flat=True).first() or 0
+        celdas = geo.celdas_en_caja(*geo.caja_alrededor(7.0653, -73.8534, 5))
+        limite_oxigeno = timezone.now() - timedelta(days=30)
+
+        return [
+            ('Siembras pendientes más recientes (cola de verificación)',
+             Siembra.objects.filter(estado='pendiente').order_by('-fecha_siembra')[:20]),
+            ('Mis siembras',
+             Siembra.objects.filter(usuario_id=usuario_id).order_by('-fecha_siembra')[:12]),
+            ('Mis siembras por estado',
+             Siembra.objects.filter(usuario_id=usuario_id, estado='validada').order_by('-fecha_siembra')[:12]),
+            ('Estadísticas del usuario',
+             Siembra.objects.filter(usuario_id=usuario_id).order_by().values('estado').annotate(total=Count('id'))),
+            ('Siembras pendientes cercanas (por celda)',
+             Siembra.objects.filter(estado='pendiente', celda__in=celdas).order_by().values_list('id', 'latitud', 'longitud')),
+            ('Validador de siembras pendientes (ETag de siembras cercanas)',
+             Siembra.objects.filter(estado='pendiente').order_by().values('estado').annotate(
+                 cantidad=Count('id'), ultima=Max('fecha_actualizacion'))),
+            ('Siembras validadas con oxígeno desactualizado',
+             Siembra.objects.filter(estado='validada', ultima_actualizacion_oxigeno__lt=limite_oxigeno).order_by()),
+            ('Listado de siembras del admin',
+             Siembra.objects.order_by('-fecha_siembra')[:100]),
+            ('Verificaciones pendientes (panel de administrador)',
+             Verificacion.objects.filter(estado='pendiente').order_by('-fecha_verificacion')[:15]),
+            ('Verificaciones pendientes por precisión',
+             Verificacion.objects.filter(estado='pendiente', precision='excelente').order_by('distancia_metros')[:15]),
+            ('Mis verificaciones',
+             Verificacion.objects.filter(verificador_id=usuario_id).order_by('-fecha_verificacion')[:12]),
+            ('Mis verificaciones por estado',
+             Verificacion.objects.filter(verificador_id=usuario_id, estado='pendiente').order_by()),
+            ('Ranking de usuarios',
+             Perfil.en_ranking().order_by('-puntos')[:Perfil.TAMANO_RANKING]),
+            ('Posición en el ranking',
+             Perfil.en_ranking().filter(puntos__gt=100).order_by()),
+            ('Siembras modificadas desde el cursor (sincronización)',
+             Siembra.objects.filter(fecha_actualizacion__gte=limite_oxigeno).order_by()),
+            ('Eliminaciones desde el cursor (sincronización)',
+             Eliminacion.objects.filter(modelo='siembra', fecha_eliminacion__gte=limite_oxigeno).order_by()),
+            ('Impacto de una zona (siembras de la zona)',
+             Siembra.objects.filter(membresias_zona__zona_id=zona_id).order_by().values('especie').annotate(total=Count('id'))),
+            ('Zonas de una siembra',
+             SiembraZona.objects.filter(siembra_id=siembra_id)),
+            ('Cola de imágenes',
+             TareaImagen.objects.filter(estado='pendiente').order_by('id')[:50]),
+            ('Clusters visibles en el mapa',
+             CeldaCluster.objects.filter(capa='pendiente', zoom=12, x__gte=0, x__lte=100, y__gte=0, y__lte=100)),
+        ]
@@ -1,11 +1,21 @@
 """
 Comando de gestión para generar zonas automáticas a partir de siembras existentes
-Uso: python manage.py generar_zonas_automaticas
+Uso: python manage.py generar_zonas_automaticas [--radio 1.0] [--minimo 10] [--dry-run]
 """
-from django.core.management.base import BaseCommand
+from collections import Counter
+from decimal import Decimal, ROUND_UP
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from core.models import Siembra, Zona
-from collections import defaultdict
-from math import radians, sin, cos, sqrt, atan2
+from core import clusters, geo, zonas
+from core.catalogo import CatalogoMapa
+from core.agrupamiento import agrupar_por_radio, indices_por_grupo
+import numpy as np
+
+# Distancia máxima (km) entre un grupo y una zona activa para considerarla la misma
+TOLERANCIA_ZONA_KM = 1.5
 
 
 class Command(BaseCommand):
@@ -16,7 +26,10 @@ class Command(BaseCommand):
             '--radio',
             type=float,
             default=1.0,
-            help='Radio de búsqueda en kilómetros (por defecto: 1.0)'
+            help=(
+                'Radio de búsqueda en kilómetros (por defecto: 1.0). Cada zona creada usa '
+                'este radio o, si es mayor, el necesario para cubrir todos los árboles de su grupo'
+            )
         )
         parser.add_argument(
             '--minimo',
@@ -24,134 +37,157 @@ class Command(BaseCommand):
             default=10,
             help='Número mínimo de árboles para crear zona (por defecto: 10)'
         )
-
-    def calcular_distancia(self, lat1, lon1, lat2, lon2):
-        """Calcula distancia en km usando Haversine"""
-        R = 6371
-        lat1_rad = radians(lat1)
-        lon1_rad = radians(lon1)
-        lat2_rad = radians(lat2)
-        lon2_rad = radians(lon2)
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-        a = sin(dlat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        return R * c
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Calcula los grupos y muestra los cambios sin escribir en la base de datos'
+        )
 
     def handle(self, *args, **options):
         radio_busqueda = options['radio']
         minimo_arboles = options['minimo']
-        
+        dry_run = options['dry_run']
+        tiempos = {}
+
+        if radio_busqueda <= 0:
+            raise CommandError('--radio debe ser mayor que 0')
+        if minimo_arboles < 1:
+            raise CommandError('--minimo debe ser al menos 1')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('🧪 Modo simulación: no se guardarán cambios'))
+
         self.stdout.write(self.style.SUCCESS('🔍 Analizando siembras validadas...'))
-        
-        # Obtener todas las siembras validadas
-        siembras = Siembra.objects.filter(estado='validada')
-        total_siembras = siembras.count()
-        
+
+        # Leer coordenadas una sola vez
+        inicio = perf_counter()
+        filas = list(
+            Siembra.objects.filter(estado='validada')
+            .order_by()
+            .values_list('latitud', 'longitud', 'especie')
+        )
+        total_siembras = len(filas)
+
         if total_siembras == 0:
             self.stdout.write(self.style.WARNING('❌ No hay siembras validadas'))
             return
-        
+
+        lats = geo.arreglo(f[0] for f in filas)
+        lngs = geo.arreglo(f[1] for f in filas)
+        especies = [f[2] for f in filas]
+        del filas
+        tiempos['Lectura'] = perf_counter() - inicio
+
         self.stdout.write(f'📊 Total de siembras validadas: {total_siembras}')
-        
-        # Agrupar siembras por cercanía
-        grupos = []
-        siembras_procesadas = set()
-        
-        for siembra in siembras:
-            if siembra.id in siembras_procesadas:
-                continue
-            
-            # Buscar siembras cercanas
-            grupo = [siembra]
-            siembras_procesadas.add(siembra.id)
-            
-            for otra_siembra in siembras:
-                if otra_siembra.id in siembras_procesadas:
-                    continue
-                
-                distancia = self.calcular_distancia(
-                    float(siembra.latitud), float(siembra.longitud),
-                    float(otra_siembra.latitud), float(otra_siembra.longitud)
-                )
-                
-                if distancia <= radio_busqueda:
-                    grupo.append(otra_siembra)
-                    siembras_procesadas.add(otra_siembra.id)
-            
-            if len(grupo) >= minimo_arboles:
-                grupos.append(grupo)
-        
+
+        # Agrupar siembras por densidad
+        inicio = perf_counter()
+        etiquetas = agrupar_por_radio(lats, lngs, radio_busqueda, minimo_arboles)
+        grupos = [g for g in indices_por_grupo(etiquetas) if len(g) >= minimo_arboles]
+        tiempos['Agrupamiento'] = perf_counter() - inicio
+
         self.stdout.write(f'\n🌳 Grupos encontrados con {minimo_arboles}+ árboles: {len(grupos)}')
-        
+
         if len(grupos) == 0:
             self.stdout.write(self.style.WARNING(
                 f'\n❌ No se encontraron grupos con al menos {minimo_arboles} árboles en {radio_busqueda}km'
             ))
+            self.mostrar_tiempos(tiempos)
             return
-        
-        # Crear zonas para cada grupo
-        zonas_creadas = 0
-        zonas_actualizadas = 0
-        
+
+        # Emparejar cada grupo con la zona activa más cercana (si la hay)
+        inicio = perf_counter()
+        centros_lat = np.array([lats[g].mean() for g in grupos])
+        centros_lng = np.array([lngs[g].mean() for g in grupos])
+
+        zonas_activas = list(Zona.objects.filter(activa=True))
+        zona_de_grupo = [None] * len(grupos)
+        if zonas_activas:
+            distancias = geo.matriz_distancias_km(
+                centros_lat, centros_lng,
+                [z.latitud for z in zonas_activas],
+                [z.longitud for z in zonas_activas],
+            )
+            mas_cercana = distancias.argmin(axis=1)
+            for i, j in enumerate(mas_cercana):
+                if distancias[i, j] <= TOLERANCIA_ZONA_KM:
+                    zona_de_grupo[i] = zonas_activas[j]
+
+        # Crear o actualizar zonas para cada grupo
+        zonas_nuevas = []
+        zonas_existentes = set()
+
         for i, grupo in enumerate(grupos, 1):
-            # Calcular centro de masa
-            lat_promedio = sum(float(s.latitud) for s in grupo) / len(grupo)
-            lng_promedio = sum(float(s.longitud) for s in grupo) / len(grupo)
-            
-            # Verificar si ya existe una zona en esta área
-            zona_existente = None
-            for zona in Zona.objects.filter(activa=True):
-                distancia = self.calcular_distancia(
-                    lat_promedio, lng_promedio,
-                    float(zona.latitud), float(zona.longitud)
-                )
-                if distancia <= 1.5:  # 1.5 km de tolerancia
-                    zona_existente = zona
-                    break
-            
+            lat_promedio = float(centros_lat[i - 1])
+            lng_promedio = float(centros_lng[i - 1])
+            zona_existente = zona_de_grupo[i - 1]
+
             if zona_existente:
-                # Actualizar zona existente
-                zona_existente.total_siembras = len(grupo)
-                zona_existente.save()
-                zonas_actualizadas += 1
+                # Su contador ya lo mantienen las validaciones (ver core.zonas)
+                zonas_existentes.add(zona_existente.pk)
                 self.stdout.write(
-                    f'  {i}. ✏️  Actualizada: {zona_existente.nombre} ({len(grupo)} árboles)'
+                    f'  {i}. ✔️  Ya existe: {zona_existente.nombre} '
+                    f'({len(grupo)} árboles en el grupo, {zona_existente.total_siembras} en la zona)'
                 )
             else:
                 # Determinar especie predominante
-                especies = {}
-                for siembra in grupo:
-                    if siembra.especie:
-                        especies[siembra.especie] = especies.get(siembra.especie, 0) + 1
-                
-                especie_comun = 'árboles'
-                if especies:
-                    especie_comun = max(especies.items(), key=lambda x: x[1])[0]
-                
-                # Crear nueva zona
-                nueva_zona = Zona.objects.create(
+                conteo = Counter(especies[j] for j in grupo if especies[j])
+                especie_comun = conteo.most_common(1)[0][0] if conteo else 'árboles'
+
+                # El radio de la zona cubre a todos los árboles del grupo, que puede
+                # extenderse más allá del radio de búsqueda (ver --radio)
+                alcance = geo.distancias_km(lat_promedio, lng_promedio, lats[grupo], lngs[grupo]).max()
+                radio_zona = Decimal(str(max(radio_busqueda, float(alcance)))).quantize(
+                    Decimal('0.01'), rounding=ROUND_UP
+                )
+
+                nueva_zona = Zona(
                     nombre=f"Zona de Reforestación - {len(grupo)} {especie_comun}",
-                    latitud=lat_promedio,
-                    longitud=lng_promedio,
+                    latitud=round(lat_promedio, 6),
+                    longitud=round(lng_promedio, 6),
                     tipo_terreno='urbano',
                     descripcion=f"Zona generada automáticamente con {len(grupo)} árboles plantados. Especie predominante: {especie_comun}.",
                     recomendaciones=f"Esta zona tiene una buena concentración de árboles. Se recomienda continuar plantando especies similares.",
                     activa=True,
                     auto_generada=True,
-                    radio_km=radio_busqueda,
+                    radio_km=min(radio_zona, Decimal('999.99')),
                     total_siembras=len(grupo)
                 )
-                zonas_creadas += 1
-                
+                zonas_nuevas.append(nueva_zona)
+
                 self.stdout.write(
                     f'  {i}. ✅ Creada: {nueva_zona.nombre} '
                     f'({lat_promedio:.4f}, {lng_promedio:.4f})'
                 )
-        
+
+        if not dry_run:
+            with transaction.atomic():
+                Zona.objects.bulk_create(zonas_nuevas, batch_size=500)
+                # bulk_create no pasa por Zona.save(): agregar los marcadores al índice
+                if zonas_nuevas:
+                    clusters.aplicar(
+                        'zona',
+                        [zona.latitud for zona in zonas_nuevas],
+                        [zona.longitud for zona in zonas_nuevas],
+                    )
+                    transaction.on_commit(CatalogoMapa.invalidar)
+                # Tampoco asigna las siembras de cada zona nueva (ver core.zonas)
+                for zona in zonas_nuevas:
+                    zonas.recalcular(zona)
+        tiempos['Persistencia' if not dry_run else 'Planificación'] = perf_counter() - inicio
+
         self.stdout.write('\n' + '=' * 60)
-        self.stdout.write(self.style.SUCCESS(f'✅ Proceso completado'))
-        self.stdout.write(f'📍 Zonas creadas: {zonas_creadas}')
-        self.stdout.write(f'✏️  Zonas actualizadas: {zonas_actualizadas}')
+        self.stdout.write(self.style.SUCCESS(
+            '✅ Simulación completada' if dry_run else '✅ Proceso completado'
+        ))
+        self.stdout.write(f'📍 Zonas creadas: {len(zonas_nuevas)}')
+        self.stdout.write(f'✔️  Zonas ya existentes: {len(zonas_existentes)}')
         self.stdout.write(f'🌳 Total de árboles agrupados: {sum(len(g) for g in grupos)}')
+        self.mostrar_tiempos(tiempos)
         self.stdout.write('=' * 60)
+
+    def mostrar_tiempos(self, tiempos):
+        """Muestra la duración de cada fase del proceso"""
+        self.stdout.write('\n⏱️  Tiempos por fase:')
+        for fase, segundos in tiempos.items():
+            self.stdout.write(f'  {fase}: {segundos:.3f} s')
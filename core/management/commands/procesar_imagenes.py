@@ -0,0 +1,72 @@
+"""
+Comando de gestión que atiende la cola de procesamiento de fotos
+Uso: python manage.py procesar_imagenes [--lote 50] [--continuo] [--intervalo 5]
+"""
+from time import sleep
+
+from django.core.management.base import BaseCommand
+from core.imagenes import procesar_pendientes
+from core.models import TareaImagen
+
+
+class Command(BaseCommand):
+    help = 'Optimiza las fotos subidas y genera sus versiones (miniatura, tarjeta y WebP)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=50,
+            help='Tareas tomadas de la cola en cada vuelta (por defecto: 50)'
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='Sigue esperando nuevas tareas en lugar de terminar cuando la cola está vacía'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help='Segundos de espera con la cola vacía en modo continuo (por defecto: 5)'
+        )
+        parser.add_argument(
+            '--max-intentos',
+            type=int,
+            default=3,
+            help='Intentos antes de marcar una tarea como error (por defecto: 3)'
+        )
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        continuo = options['continuo']
+        intervalo = options['intervalo']
+        max_intentos = options['max_intentos']
+
+        pendientes = TareaImagen.objects.filter(estado='pendiente').count()
+        self.stdout.write(self.style.SUCCESS(f'🖼️  Procesando imágenes ({pendientes} en cola)...'))
+
+        total_completadas = 0
+        total_fallidas = 0
+
+        try:
+            while True:
+                completadas, fallidas = procesar_pendientes(lote, max_intentos)
+                total_completadas += completadas
+                total_fallidas += fallidas
+
+                if completadas or fallidas:
+                    self.stdout.write(f'  ✓ {completadas} completadas, ✗ {fallidas} con error')
+                elif continuo:
+                    sleep(intervalo)
+                else:
+                    break
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n⏹️  Detenido por el usuario'))
+
+        self.stdout.write(self.style.SUCCESS('\n📈 Resumen:'))
+        self.stdout.write(f'  ✅ Tareas completadas: {total_completadas}')
+        self.stdout.write(f'  ❌ Intentos fallidos: {total_fallidas}')
+        errores = TareaImagen.objects.filter(estado='error').count()
+        if errores:
+            self.stdout.write(self.style.WARNING(f'  ⚠️  Tareas en error (revisar en el admin): {errores}'))
@@ -0,0 +1,21 @@
+"""
+Comando de gestión para borrar los registros de eliminaciones que ya no necesita
+la sincronización incremental (api_sync)
+Uso: python manage.py purgar_eliminaciones
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import Eliminacion
+
+
+class Command(BaseCommand):
+    help = 'Borra las eliminaciones más viejas que Eliminacion.DIAS_RETENCION (los clientes más atrasados se sincronizan completos)'
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=Eliminacion.DIAS_RETENCION)
+        borradas, _ = Eliminacion.objects.filter(fecha_eliminacion__lt=limite).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'🧹 {borradas} eliminación(es) de hace más de {Eliminacion.DIAS_RETENCION} días borradas'
+        ))
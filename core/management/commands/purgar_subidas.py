@@ -0,0 +1,29 @@
+"""
+Comando de gestión para borrar las subidas por fragmentos abandonadas y sus archivos parciales
+Uso: python manage.py purgar_subidas
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import SubidaSiembra
+
+
+class Command(BaseCommand):
+    help = 'Borra las subidas de siembras sin actividad en SubidaSiembra.DIAS_EXPIRACION días que no crearon una siembra'
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=SubidaSiembra.DIAS_EXPIRACION)
+        abandonadas = SubidaSiembra.objects.filter(
+            estado__in=['en_curso', 'fallida'], fecha_actualizacion__lt=limite
+        )
+
+        borradas = 0
+        for subida in abandonadas.iterator():
+            subida.borrar_parcial()
+            subida.delete()
+            borradas += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'🧹 {borradas} subida(s) abandonada(s) hace más de {SubidaSiembra.DIAS_EXPIRACION} días borradas'
+        ))
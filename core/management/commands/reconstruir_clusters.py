@@ -0,0 +1,34 @@
+"""
+Comando de gestión para recalcular el índice de clusters de los mapas desde cero
+Uso: python manage.py reconstruir_clusters [--capa pendiente]
+"""
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from core import clusters
+from core.models import CeldaCluster
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las celdas de agrupamiento de marcadores de los mapas y corrige desviaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--capa',
+            choices=clusters.CAPAS,
+            help='Reconstruye solo esta capa (por defecto: todas)'
+        )
+
+    def handle(self, *args, **options):
+        capas = [options['capa']] if options['capa'] else clusters.CAPAS
+
+        self.stdout.write(self.style.SUCCESS('🗺️  Reconstruyendo índice de clusters...'))
+        for capa in capas:
+            inicio = perf_counter()
+            anteriores = CeldaCluster.objects.filter(capa=capa).count()
+            celdas = clusters.reconstruir(capa)
+            self.stdout.write(
+                f'  ✓ {capa}: {celdas} celdas (antes {anteriores}) en {perf_counter() - inicio:.2f} s'
+            )
+
+        self.stdout.write(self.style.SUCCESS('\n✨ Índice de clusters actualizado'))
@@ -0,0 +1,27 @@
+"""
+Comando de gestión para recalcular las estadísticas globales desde cero
+Uso: python manage.py reconstruir_estadisticas
+"""
+from django.core.management.base import BaseCommand
+from core.models import EstadisticasGlobales
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores globales de la página de inicio y corrige desviaciones'
+
+    def handle(self, *args, **options):
+        anterior = EstadisticasGlobales.objects.filter(pk=EstadisticasGlobales.PK_UNICA).first()
+        estadisticas = EstadisticasGlobales.reconstruir()
+
+        self.stdout.write(self.style.SUCCESS('📊 Estadísticas globales reconstruidas:'))
+        for campo, etiqueta in (
+            ('total_siembras', '🌳 Siembras validadas'),
+            ('total_usuarios', '👥 Usuarios activos'),
+            ('oxigeno_total', '💨 Oxígeno (kg/año)'),
+            ('co2_total', '🌿 CO2 (kg/año)'),
+        ):
+            valor = getattr(estadisticas, campo)
+            linea = f'  {etiqueta}: {valor}'
+            if anterior is not None and getattr(anterior, campo) != valor:
+                linea += self.style.WARNING(f' (antes {getattr(anterior, campo)})')
+            self.stdout.write(linea)
@@ -0,0 +1,30 @@
+"""
+Comando de gestión para recalcular desde cero las siembras de cada zona y sus contadores
+Uso: python manage.py reconstruir_zonas
+"""
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core import zonas
+from core.models import Zona
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las siembras validadas de cada zona y corrige desviaciones del contador'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('📍 Recalculando siembras por zona...'))
+        inicio = perf_counter()
+        corregidas = 0
+        for zona in Zona.objects.order_by('id'):
+            anterior = zona.total_siembras
+            with transaction.atomic():
+                total = zonas.recalcular(zona)
+            if total != anterior:
+                corregidas += 1
+                self.stdout.write(f'  ✏️  {zona.nombre}: {anterior} → {total}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✨ Zonas revisadas en {perf_counter() - inicio:.2f} s ({corregidas} contador(es) corregido(s))'
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:36
+
+from math import floor
+
+from django.db import migrations, models
+
+# Copia de core.geo al crear esta migración: las migraciones no importan el
+# código de la aplicación, que puede cambiar después
+TAMANO_CELDA_GRADOS = 0.01
+
+
+def celda_para(lat, lng):
+    """Clave 'fila:columna' de la celda de la rejilla de un punto"""
+    return f"{floor(float(lat) / TAMANO_CELDA_GRADOS)}:{floor(float(lng) / TAMANO_CELDA_GRADOS)}"
+
+
+def calcular_celdas(apps, schema_editor):
+    """Asigna la celda de la rejilla a las siembras existentes"""
+    Siembra = apps.get_model('core', 'Siembra')
+    siembras = list(Siembra.objects.only('id', 'latitud', 'longitud'))
+    for siembra in siembras:
+        siembra.celda = celda_para(siembra.latitud, siembra.longitud)
+    Siembra.objects.bulk_update(siembras, ['celda'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_zona_auto_generada_zona_radio_km_zona_total_siembras'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siembra',
+            name='celda',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=24),
+        ),
+        migrations.RunPython(calcular_celdas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:04
+
+from django.db import migrations, models
+
+
+def marcar_procesadas(apps, schema_editor):
+    """Las fotos existentes ya se optimizaron al guardarse"""
+    Siembra = apps.get_model('core', 'Siembra')
+    Siembra.objects.update(foto_procesada=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_siembra_celda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siembra',
+            name='foto_procesada',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(marcar_procesadas, migrations.RunPython.noop),
+    ]
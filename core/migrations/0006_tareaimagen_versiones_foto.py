@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+def encolar_fotos_existentes(apps, schema_editor):
+    """Encola la generación de versiones para las fotos ya subidas"""
+    TareaImagen = apps.get_model('core', 'TareaImagen')
+    tareas = []
+    for modelo, campos in (('siembra', ['foto']), ('verificacion', ['foto_verificacion', 'foto_ubicacion'])):
+        Modelo = apps.get_model('core', modelo)
+        for fila in Modelo.objects.values('id', *campos).iterator():
+            tareas.extend(
+                TareaImagen(modelo=modelo, objeto_id=fila['id'], campo=campo)
+                for campo in campos if fila[campo]
+            )
+    TareaImagen.objects.bulk_create(tareas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_siembra_foto_procesada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siembra',
+            name='versiones_foto',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='verificacion',
+            name='versiones_foto',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.CreateModel(
+            name='TareaImagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('siembra', 'Siembra'), ('verificacion', 'Verificación')], max_length=20)),
+                ('objeto_id', models.PositiveIntegerField()),
+                ('campo', models.CharField(max_length=50)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completada', 'Completada'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea de Imagen',
+                'verbose_name_plural': 'Tareas de Imágenes',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['estado', 'id'], name='core_tareai_estado_b32778_idx')],
+            },
+        ),
+        migrations.RunPython(encolar_fotos_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_tareaimagen_versiones_foto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticasGlobales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_siembras', models.IntegerField(default=0, help_text='Siembras validadas')),
+                ('total_usuarios', models.IntegerField(default=0, help_text='Usuarios activos')),
+                ('oxigeno_total', models.DecimalField(decimal_places=2, default=0, help_text='kg O2/año', max_digits=14)),
+                ('co2_total', models.DecimalField(decimal_places=2, default=0, help_text='kg CO2/año', max_digits=14)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estadísticas Globales',
+                'verbose_name_plural': 'Estadísticas Globales',
+            },
+        ),
+    ]
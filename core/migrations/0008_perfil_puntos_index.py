@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_estadisticasglobales'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='perfil',
+            name='puntos',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+    ]
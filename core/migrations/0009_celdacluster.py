@@ -0,0 +1,82 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:14
+
+from math import log, pi, radians, sin
+
+from django.db import migrations, models
+
+# Copia de los parámetros de core.clusters al crear esta migración: las
+# migraciones no importan el código de la aplicación, que puede cambiar después
+ZOOM_MIN = 0
+ZOOM_MAX = 16
+DIVISIONES_POR_TESELA = 4
+LATITUD_MAXIMA = 85.05112878
+
+
+def acumular(lats, lngs):
+    """
+    Agrupa puntos por celda Web Mercator en todos los niveles de zoom.
+    Retorna {(zoom, x, y): (cantidad, suma_lat, suma_lng)}.
+    """
+    celdas = {}
+    for lat, lng in zip(lats, lngs):
+        lat, lng = float(lat), float(lng)
+        seno = sin(radians(min(max(lat, -LATITUD_MAXIMA), LATITUD_MAXIMA)))
+        u = min(max((lng + 180.0) / 360.0, 0.0), 1.0)
+        v = min(max(0.5 - log((1 + seno) / (1 - seno)) / (4 * pi), 0.0), 1.0)
+        for zoom in range(ZOOM_MIN, ZOOM_MAX + 1):
+            lado = (2 ** zoom) * DIVISIONES_POR_TESELA
+            clave = (zoom, min(int(u * lado), lado - 1), min(int(v * lado), lado - 1))
+            cantidad, suma_lat, suma_lng = celdas.get(clave, (0, 0.0, 0.0))
+            celdas[clave] = (cantidad + 1, suma_lat + lat, suma_lng + lng)
+    return celdas
+
+
+def construir_indice(apps, schema_editor):
+    """Construye el índice de clusters con los viveros, zonas y siembras existentes"""
+    CeldaCluster = apps.get_model('core', 'CeldaCluster')
+    capas = {
+        'vivero': apps.get_model('core', 'Vivero').objects.all(),
+        'zona': apps.get_model('core', 'Zona').objects.filter(activa=True),
+        'pendiente': apps.get_model('core', 'Siembra').objects.filter(estado='pendiente'),
+    }
+    for capa, filas in capas.items():
+        coordenadas = list(filas.values_list('latitud', 'longitud'))
+        if not coordenadas:
+            continue
+        lats, lngs = zip(*coordenadas)
+        CeldaCluster.objects.bulk_create(
+            [
+                CeldaCluster(capa=capa, zoom=zoom, x=x, y=y, cantidad=cantidad, suma_lat=suma_lat, suma_lng=suma_lng)
+                for (zoom, x, y), (cantidad, suma_lat, suma_lng) in acumular(lats, lngs).items()
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_perfil_puntos_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CeldaCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('capa', models.CharField(choices=[('vivero', 'Viveros'), ('zona', 'Zonas activas'), ('pendiente', 'Siembras pendientes')], max_length=20)),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('x', models.IntegerField()),
+                ('y', models.IntegerField()),
+                ('cantidad', models.IntegerField(default=0)),
+                ('suma_lat', models.FloatField(default=0)),
+                ('suma_lng', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Celda de Cluster',
+                'verbose_name_plural': 'Celdas de Clusters',
+                'constraints': [models.UniqueConstraint(fields=('capa', 'zoom', 'x', 'y'), name='celda_cluster_unica')],
+            },
+        ),
+        migrations.RunPython(construir_indice, migrations.RunPython.noop),
+    ]
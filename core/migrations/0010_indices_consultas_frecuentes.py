@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_celdacluster'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='siembra',
+            name='celda',
+            field=models.CharField(blank=True, editable=False, max_length=24),
+        ),
+        migrations.AddIndex(
+            model_name='siembra',
+            index=models.Index(fields=['estado', '-fecha_siembra'], name='core_siembr_estado_8157dc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='siembra',
+            index=models.Index(fields=['usuario', 'estado', '-fecha_siembra'], name='core_siembr_usuario_5088f7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='siembra',
+            index=models.Index(fields=['usuario', '-fecha_siembra'], name='core_siembr_usuario_43e215_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='siembra',
+            index=models.Index(fields=['-fecha_siembra'], name='core_siembr_fecha_s_a4d0e5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='siembra',
+            index=models.Index(fields=['estado', 'celda'], name='core_siembr_estado_68eb23_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='siembra',
+            index=models.Index(condition=models.Q(('estado', 'validada')), fields=['ultima_actualizacion_oxigeno'], name='siembra_validada_oxigeno_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificacion',
+            index=models.Index(fields=['estado', '-fecha_verificacion'], name='core_verifi_estado_0e4a53_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificacion',
+            index=models.Index(fields=['verificador', 'estado'], name='core_verifi_verific_604c67_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificacion',
+            index=models.Index(fields=['verificador', '-fecha_verificacion'], name='core_verifi_verific_aea414_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificacion',
+            index=models.Index(fields=['-fecha_verificacion'], name='core_verifi_fecha_v_44a3ea_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Eliminacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('siembra', 'Siembra'), ('zona', 'Zona'), ('vivero', 'Vivero')], max_length=20)),
+                ('objeto_id', models.PositiveIntegerField()),
+                ('fecha_eliminacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Eliminación',
+                'verbose_name_plural': 'Eliminaciones',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='siembra',
+            index=models.Index(fields=['fecha_actualizacion'], name='core_siembr_fecha_a_90d2ee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eliminacion',
+            index=models.Index(fields=['fecha_eliminacion'], name='core_elimin_fecha_e_dac11e_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_eliminacion_sincronizacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaSiembra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(help_text='Clave de idempotencia generada por el cliente', max_length=64)),
+                ('nombre_archivo', models.CharField(max_length=100)),
+                ('tamano', models.PositiveIntegerField(help_text='Bytes totales de la foto')),
+                ('recibidos', models.PositiveIntegerField(default=0)),
+                ('latitud', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitud', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('especie', models.CharField(blank=True, max_length=100)),
+                ('descripcion', models.TextField(blank=True, max_length=500)),
+                ('estado', models.CharField(choices=[('en_curso', 'En curso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='en_curso', max_length=20)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('siembra', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='subida', to='core.siembra')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subidas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Subida de Siembra',
+                'verbose_name_plural': 'Subidas de Siembras',
+                'indexes': [models.Index(fields=['estado', 'fecha_actualizacion'], name='core_subida_estado_7652c9_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'clave'), name='subida_siembra_clave_unica')],
+            },
+        ),
+    ]
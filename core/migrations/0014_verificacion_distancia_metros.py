@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:39
+
+from math import asin, cos, radians, sin, sqrt
+
+from django.db import migrations, models
+
+# Copia de core.geo al crear esta migración: las migraciones no importan el
+# código de la aplicación, que puede cambiar después
+RADIO_TIERRA_KM = 6371
+
+
+def distancia_km(lat1, lng1, lat2, lng2):
+    """Distancia en km entre dos puntos usando la fórmula de Haversine"""
+    lat1 = radians(float(lat1))
+    lat2 = radians(float(lat2))
+    dlat = lat2 - lat1
+    dlng = radians(float(lng2)) - radians(float(lng1))
+
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * asin(sqrt(min(a, 1.0)))
+
+
+def calcular_distancias(apps, schema_editor):
+    """Guarda la distancia a la siembra de las verificaciones existentes"""
+    Verificacion = apps.get_model('core', 'Verificacion')
+    verificaciones = list(
+        Verificacion.objects.select_related('siembra').only(
+            'id', 'latitud_verificacion', 'longitud_verificacion', 'siembra__latitud', 'siembra__longitud'
+        )
+    )
+    for verificacion in verificaciones:
+        distancia = distancia_km(
+            verificacion.siembra.latitud, verificacion.siembra.longitud,
+            verificacion.latitud_verificacion, verificacion.longitud_verificacion,
+        )
+        verificacion.distancia_metros = round(distancia * 1000, 2)
+    Verificacion.objects.bulk_update(verificaciones, ['distancia_metros'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_subidasiembra'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verificacion',
+            name='distancia_metros',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(calcular_distancias, migrations.RunPython.noop),
+    ]
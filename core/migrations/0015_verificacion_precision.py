@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:40
+
+from django.db import migrations, models
+
+
+def asignar_precision(apps, schema_editor):
+    """Clasifica las verificaciones existentes según la distancia guardada"""
+    Verificacion = apps.get_model('core', 'Verificacion')
+    Verificacion.objects.filter(distancia_metros__isnull=False).update(
+        precision=models.Case(
+            models.When(distancia_metros__lt=20, then=models.Value('excelente')),
+            models.When(distancia_metros__lt=50, then=models.Value('buena')),
+            default=models.Value('revisar'),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_verificacion_distancia_metros'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verificacion',
+            name='precision',
+            field=models.CharField(blank=True, choices=[('excelente', 'Excelente (< 20 m)'), ('buena', 'Buena (< 50 m)'), ('revisar', 'Revisar')], editable=False, max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='verificacion',
+            index=models.Index(fields=['estado', 'precision', 'distancia_metros'], name='core_verifi_estado_41d263_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificacion',
+            index=models.Index(fields=['estado', 'distancia_metros'], name='core_verifi_estado_afacdc_idx'),
+        ),
+        migrations.RunPython(asignar_precision, migrations.RunPython.noop),
+    ]
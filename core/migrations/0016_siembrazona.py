@@ -0,0 +1,98 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:44
+
+from math import asin, cos, radians, sin, sqrt
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia de core.geo al crear esta migración: las migraciones no importan el
+# código de la aplicación, que puede cambiar después
+RADIO_TIERRA_KM = 6371
+KM_POR_GRADO = 111.195
+
+
+def caja_alrededor(lat, lng, radio_km):
+    """Caja (lat_min, lat_max, lng_min, lng_max) que contiene el círculo de radio_km"""
+    lat = float(lat)
+    lng = float(lng)
+    delta_lat = radio_km / KM_POR_GRADO
+
+    # Cerca de los polos la caja cubre todas las longitudes
+    cos_lat = cos(radians(min(abs(lat) + delta_lat, 90.0)))
+    if cos_lat < 1e-6:
+        delta_lng = 180.0
+    else:
+        delta_lng = min(radio_km / (KM_POR_GRADO * cos_lat), 180.0)
+
+    return max(lat - delta_lat, -90.0), min(lat + delta_lat, 90.0), lng - delta_lng, lng + delta_lng
+
+
+def distancia_km(lat1, lng1, lat2, lng2):
+    """Distancia en km entre dos puntos usando la fórmula de Haversine"""
+    lat1 = radians(float(lat1))
+    lat2 = radians(float(lat2))
+    dlat = lat2 - lat1
+    dlng = radians(float(lng2)) - radians(float(lng1))
+
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * asin(sqrt(min(a, 1.0)))
+
+
+def calcular_membresias(apps, schema_editor):
+    """Asigna las siembras validadas a las zonas que las contienen y fija los contadores"""
+    Siembra = apps.get_model('core', 'Siembra')
+    Zona = apps.get_model('core', 'Zona')
+    SiembraZona = apps.get_model('core', 'SiembraZona')
+
+    for zona in Zona.objects.all():
+        radio = float(zona.radio_km)
+        lat_min, lat_max, lng_min, lng_max = caja_alrededor(zona.latitud, zona.longitud, radio)
+        candidatos = list(
+            Siembra.objects.filter(
+                estado='validada',
+                latitud__gte=lat_min, latitud__lte=lat_max,
+                longitud__gte=lng_min, longitud__lte=lng_max,
+            ).order_by().values_list('id', 'latitud', 'longitud')
+        )
+        dentro = [
+            siembra_id for siembra_id, lat, lng in candidatos
+            if distancia_km(zona.latitud, zona.longitud, lat, lng) <= radio
+        ]
+
+        SiembraZona.objects.bulk_create(
+            [SiembraZona(zona_id=zona.pk, siembra_id=siembra_id) for siembra_id in dentro],
+            batch_size=1000,
+        )
+        Zona.objects.filter(pk=zona.pk).update(total_siembras=len(dentro))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_verificacion_precision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiembraZona',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('siembra', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='membresias_zona', to='core.siembra')),
+                ('zona', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='membresias', to='core.zona')),
+            ],
+            options={
+                'verbose_name': 'Siembra de Zona',
+                'verbose_name_plural': 'Siembras de Zonas',
+            },
+        ),
+        migrations.AddField(
+            model_name='zona',
+            name='siembras',
+            field=models.ManyToManyField(blank=True, related_name='zonas', through='core.SiembraZona', to='core.siembra'),
+        ),
+        migrations.AddConstraint(
+            model_name='siembrazona',
+            constraint=models.UniqueConstraint(fields=('zona', 'siembra'), name='siembra_zona_unica'),
+        ),
+        migrations.RunPython(calcular_membresias, migrations.RunPython.noop),
+    ]
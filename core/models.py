@@ -1,14 +1,34 @@
 # core/models.py - VERSIÓN ACTUALIZADA CON VERIFICACIÓN Y OXÍGENO
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.core.cache import cache
+from django.core.files import File
+from django.db.models import Case, Count, Exists, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
 from django.dispatch import receiver
-from PIL import Image
+from django.utils import timezone
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
-from decimal import Decimal
+from functools import partial
 import os
 
+import numpy as np
+
+from . import clusters, geo, imagenes, oxigeno, zonas
+
+# Ids por UPDATE en las operaciones por lotes (límite de parámetros de SQLite)
+TAMANO_LOTE_IDS = 500
+
+
+def lotes(ids, tamano=TAMANO_LOTE_IDS):
+    """Divide una lista de ids en lotes para filtros pk__in"""
+    ids = list(ids)
+    for inicio in range(0, len(ids), tamano):
+        yield ids[inicio:inicio + tamano]
+
 
 class Avatar(models.Model):
     """Avatares desbloqueables según nivel"""
@@ -23,8 +43,26 @@ class Avatar(models.Model):
         verbose_name = 'Avatar'
         verbose_name_plural = 'Avatares'
     
+    CLAVE_CACHE_POR_NIVEL = 'avatares:por_nivel'
+    DURACION_CACHE_POR_NIVEL = 600  # segundos
+    
     def __str__(self):
         return f"{self.emoji} {self.nombre} (Nivel {self.nivel_requerido})"
+    
+    @classmethod
+    def por_nivel(cls):
+        """
+        Retorna {nivel: id del primer avatar de ese nivel}, guardado en caché.
+        Con la caché por proceso los demás workers ven los cambios de avatares
+        al vencer DURACION_CACHE_POR_NIVEL.
+        """
+        avatares = cache.get(cls.CLAVE_CACHE_POR_NIVEL)
+        if avatares is None:
+            avatares = {}
+            for avatar_id, nivel in cls.objects.order_by('nivel_requerido', 'id').values_list('id', 'nivel_requerido'):
+                avatares.setdefault(nivel, avatar_id)
+            cache.set(cls.CLAVE_CACHE_POR_NIVEL, avatares, cls.DURACION_CACHE_POR_NIVEL)
+        return avatares
 
 
 class Perfil(models.Model):
@@ -36,7 +74,7 @@ class Perfil(models.Model):
     ]
     
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='perfil')
-    puntos = models.IntegerField(default=0)
+    puntos = models.IntegerField(default=0, db_index=True)
     nivel = models.IntegerField(default=1)
     avatar_actual = models.ForeignKey(Avatar, on_delete=models.SET_NULL, null=True, blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
@@ -55,34 +93,104 @@ class Perfil(models.Model):
         verbose_name = 'Perfil'
         verbose_name_plural = 'Perfiles'
     
+    # Puntos mínimos de cada nivel, de mayor a menor (el nivel 1 empieza en 0)
+    UMBRALES_NIVEL = [(5, 1000), (4, 500), (3, 250), (2, 100)]
+    
+    # Instantánea del ranking en caché (se invalida al sumar puntos)
+    CLAVE_CACHE_RANKING = 'ranking:top'
+    TAMANO_RANKING = 50
+    DURACION_CACHE_RANKING = 600  # segundos
+    
     def __str__(self):
         return f"{self.user.username} - Nivel {self.nivel} ({self.puntos} pts)"
     
-    def sumar_puntos(self, puntos):
-        """Suma puntos y actualiza nivel automáticamente"""
-        self.puntos += puntos
-        nivel_anterior = self.nivel
-        
-        # Sistema de niveles
-        if self.puntos >= 1000:
-            self.nivel = 5
-        elif self.puntos >= 500:
-            self.nivel = 4
-        elif self.puntos >= 250:
-            self.nivel = 3
-        elif self.puntos >= 100:
-            self.nivel = 2
-        else:
-            self.nivel = 1
+    @classmethod
+    def en_ranking(cls):
+        """Perfiles que participan en el ranking (sin staff ni superusuarios)"""
+        return cls.objects.filter(user__is_staff=False, user__is_superuser=False)
+    
+    @classmethod
+    def obtener_ranking(cls):
+        """
+        Retorna los mejores perfiles con su posición y siembras validadas,
+        calculados en una sola consulta y guardados en caché.
+        """
+        perfiles = cache.get(cls.CLAVE_CACHE_RANKING)
+        if perfiles is None:
+            perfiles = list(
+                cls.en_ranking()
+                .select_related('user', 'avatar_actual')
+                .annotate(siembras_validadas=Count(
+                    'user__siembras', filter=Q(user__siembras__estado='validada')
+                ))
+                .order_by('-puntos')[:cls.TAMANO_RANKING]
+            )
+            for posicion, perfil in enumerate(perfiles, start=1):
+                perfil.posicion = posicion
+            cache.set(cls.CLAVE_CACHE_RANKING, perfiles, cls.DURACION_CACHE_RANKING)
+        return perfiles
+    
+    @classmethod
+    def invalidar_ranking(cls):
+        """Descarta la instantánea del ranking para que se recalcule"""
+        cache.delete(cls.CLAVE_CACHE_RANKING)
+    
+    def posicion_en_ranking(self):
+        """Posición del perfil: perfiles con más puntos + 1 (usa el índice de puntos)"""
+        return Perfil.en_ranking().filter(puntos__gt=self.puntos).count() + 1
+    
+    @classmethod
+    def nivel_para(cls, puntos):
+        """Nivel correspondiente a una cantidad de puntos"""
+        for nivel, umbral in cls.UMBRALES_NIVEL:
+            if puntos >= umbral:
+                return nivel
+        return 1
+    
+    def sumar_puntos(self, puntos, **contadores):
+        """
+        Suma puntos y actualiza nivel y avatar en un único UPDATE atómico, sin
+        perder puntos ante aprobaciones concurrentes. `contadores` son otros
+        campos enteros a incrementar en la misma escritura
+        (p. ej. verificaciones_realizadas=1).
+        """
+        avatares = Avatar.por_nivel()
         
-        # Actualizar avatar si subió de nivel
-        if self.nivel > nivel_anterior:
-            nuevo_avatar = Avatar.objects.filter(nivel_requerido=self.nivel).first()
-            if nuevo_avatar:
-                self.avatar_actual = nuevo_avatar
+        # Las condiciones usan el valor previo de puntos (el del UPDATE), por eso
+        # se comparan contra umbral - puntos
+        nivel_nuevo = Case(
+            *[When(puntos__gte=umbral - puntos, then=Value(nivel)) for nivel, umbral in self.UMBRALES_NIVEL],
+            default=Value(1),
+        )
+        # El avatar solo cambia al subir a un nivel que tenga avatar. La tabla en
+        # caché puede traer un avatar ya eliminado en otro proceso: el mismo UPDATE
+        # comprueba que exista y si no pasa al del nivel anterior
+        avatar_nuevo = Case(
+            *[
+                When(
+                    Exists(Avatar.objects.filter(pk=avatares[nivel])),
+                    puntos__gte=umbral - puntos, nivel__lt=nivel, then=Value(avatares[nivel]),
+                )
+                for nivel, umbral in self.UMBRALES_NIVEL if nivel in avatares
+            ],
+            default=F('avatar_actual'),
+            output_field=models.BigIntegerField(),
+        )
         
-        self.save()
-        return self.nivel > nivel_anterior  # Retorna True si subió de nivel
+        with transaction.atomic():
+            # Bloquear la fila: el nivel previo sale de los puntos justo antes de este
+            # incremento, aunque otra aprobación sume puntos al mismo tiempo
+            puntos_previos = Perfil.objects.select_for_update().values_list('puntos', flat=True).get(pk=self.pk)
+            Perfil.objects.filter(pk=self.pk).update(
+                puntos=F('puntos') + puntos,
+                nivel=nivel_nuevo,
+                avatar_actual=avatar_nuevo,
+                **{campo: F(campo) + valor for campo, valor in contadores.items()}
+            )
+            self.refresh_from_db(fields=['puntos', 'nivel', 'avatar_actual', *contadores])
+        Perfil.invalidar_ranking()
+        
+        return self.nivel > self.nivel_para(puntos_previos)  # Retorna True si subió de nivel
     
     def progreso_siguiente_nivel(self):
         """Calcula el progreso hacia el siguiente nivel"""
@@ -110,16 +218,202 @@ class Perfil(models.Model):
         return (self.verificaciones_aprobadas / self.verificaciones_realizadas) * 100
 
 
-# Datos de oxígeno por especie (kg O2/año según edad)
-OXYGEN_RATES = {
-    'ceiba': {'joven': 12, 'maduro': 30, 'viejo': 25},
-    'guayacan': {'joven': 10, 'maduro': 25, 'viejo': 22},
-    'roble': {'joven': 15, 'maduro': 35, 'viejo': 30},
-    'saman': {'joven': 18, 'maduro': 40, 'viejo': 35},
-    'caracoli': {'joven': 11, 'maduro': 28, 'viejo': 24},
-    'pino': {'joven': 10, 'maduro': 22, 'viejo': 18},
-    'default': {'joven': 12, 'maduro': 28, 'viejo': 25}
-}
+class SiembraQuerySet(models.QuerySet):
+    """Consultas espaciales y operaciones por lotes sobre siembras"""
+    
+    # Radio con que empieza la búsqueda de las siembras más cercanas
+    RADIO_INICIAL_KM = 0.5
+
+    def en_caja(self, lat, lng, radio_km):
+        """
+        Prefiltra las siembras dentro de la caja que contiene el círculo de
+        radio_km alrededor del punto, usando la celda indexada de la rejilla.
+        La distancia exacta debe verificarse después sobre el resultado.
+        """
+        return self.en_limites(*geo.caja_alrededor(lat, lng, radio_km))
+
+    def en_limites(self, lat_min, lat_max, lng_min, lng_max):
+        """Siembras dentro de una caja, prefiltradas por la celda indexada"""
+        qs = self.filter(
+            latitud__gte=lat_min, latitud__lte=lat_max,
+            longitud__gte=lng_min, longitud__lte=lng_max,
+        )
+        celdas = geo.celdas_en_caja(lat_min, lat_max, lng_min, lng_max)
+        if celdas is not None:
+            qs = qs.filter(celda__in=celdas)
+        return qs
+
+    def cercanas(self, lat, lng, radio_km, k, despues=None):
+        """
+        Retorna [(id, distancia_km)] de las k siembras más cercanas al punto
+        dentro de radio_km, de la más cercana a la más lejana. `despues` es el
+        cursor (distancia_km, id) de la última siembra de la página anterior.
+        La búsqueda empieza con un radio pequeño y lo duplica hasta reunir k
+        siembras o llegar a radio_km, para no leer todas las de zonas densas.
+        """
+        radio = min(radio_km, self.RADIO_INICIAL_KM + (despues[0] if despues else 0))
+        while True:
+            resultado = self._cercanas_en_radio(lat, lng, radio, k, despues)
+            if len(resultado) == k or radio >= radio_km:
+                return resultado
+            radio = min(radio * 2, radio_km)
+    
+    def _cercanas_en_radio(self, lat, lng, radio_km, k, despues):
+        """Prefiltro por celda y caja, distancia exacta y selección de las k menores"""
+        qs = self.en_caja(lat, lng, radio_km)
+        if despues is not None and despues[0] > 0:
+            # Las siembras dentro de la caja interior al cursor ya se mostraron
+            lat_min, lat_max, lng_min, lng_max = geo.caja_interior(lat, lng, despues[0])
+            qs = qs.exclude(
+                latitud__gt=lat_min, latitud__lt=lat_max,
+                longitud__gt=lng_min, longitud__lt=lng_max,
+            )
+        filas = qs.order_by().values_list(
+            'id', Cast('latitud', FloatField()), Cast('longitud', FloatField())
+        )
+        datos = np.array(list(filas), dtype=np.float64).reshape(-1, 3)
+        if not len(datos):
+            return []
+        
+        ids = datos[:, 0].astype(np.int64)
+        distancias = geo.distancias_km(lat, lng, datos[:, 1], datos[:, 2])
+        dentro = distancias <= radio_km
+        if despues is not None:
+            distancia_cursor, id_cursor = despues
+            dentro &= (distancias > distancia_cursor) | ((distancias == distancia_cursor) & (ids > id_cursor))
+        
+        indices = np.flatnonzero(dentro)
+        indices = indices[geo.indices_mas_cercanos(distancias[indices], ids[indices], k)]
+        return list(zip(ids[indices].tolist(), distancias[indices].tolist()))
+    
+    def cambiar_estado(self, estado, **campos):
+        """
+        Pasa las siembras a `estado` (y escribe `campos`) con UPDATE por lotes y
+        aplica a mano lo que haría Siembra.save(): índice de clusters, zonas,
+        estadísticas globales y caché de estadísticas de los dueños.
+        Retorna la cantidad de siembras que cambiaron.
+        """
+        from .estadisticas import EstadisticasUsuario
+        
+        with transaction.atomic():
+            filas = list(
+                self.exclude(estado=estado).select_for_update().order_by().values_list(
+                    'id', 'usuario_id', 'estado', 'latitud', 'longitud', 'oxigeno_generado', 'co2_absorbido'
+                )
+            )
+            if not filas:
+                return 0
+            
+            ahora = timezone.now()
+            for ids in lotes(fila[0] for fila in filas):
+                self.model.objects.filter(pk__in=ids).update(estado=estado, fecha_actualizacion=ahora, **campos)
+            
+            # update() no pasa por save() ni dispara señales
+            diferencias = Counter()
+            salen, entran = [], []
+            salen_zonas, entran_zonas = [], []
+            for pk, _, anterior, lat, lng, oxigeno_anterior, co2_anterior in filas:
+                antes = self.model.aporte_global({
+                    'estado': anterior, 'oxigeno_generado': oxigeno_anterior, 'co2_absorbido': co2_anterior,
+                })
+                despues = self.model.aporte_global({
+                    'estado': estado,
+                    'oxigeno_generado': campos.get('oxigeno_generado', oxigeno_anterior),
+                    'co2_absorbido': campos.get('co2_absorbido', co2_anterior),
+                })
+                for campo, valor_antes, valor_despues in zip(
+                    ['total_siembras', 'oxigeno_total', 'co2_total'], antes, despues
+                ):
+                    diferencias[campo] += valor_despues - valor_antes
+                if anterior == 'pendiente':
+                    salen.append((lat, lng))
+                elif estado == 'pendiente':
+                    entran.append((lat, lng))
+                if anterior == 'validada':
+                    salen_zonas.append(pk)
+                elif estado == 'validada':
+                    entran_zonas.append((pk, lat, lng))
+            
+            EstadisticasGlobales.aplicar(**diferencias)
+            for puntos, signo in ((salen, -1), (entran, 1)):
+                if puntos:
+                    lats, lngs = zip(*puntos)
+                    clusters.aplicar('pendiente', lats, lngs, signo)
+            zonas.quitar_siembras(salen_zonas)
+            zonas.agregar_siembras(entran_zonas)
+        
+        for usuario_id in {fila[1] for fila in filas}:
+            EstadisticasUsuario.invalidar(usuario_id)
+        return len(filas)
+    
+    def validar(self, admin_user):
+        """
+        Valida por lotes las siembras pendientes: un UPDATE por lote y valor de
+        oxígeno, un incremento de puntos por usuario y la revisión de zonas
+        automáticas una sola vez después del commit (ver Siembra.validar).
+        Retorna (cantidad validada, perfiles que subieron de nivel).
+        """
+        ahora = timezone.now()
+        with transaction.atomic():
+            filas = list(
+                self.filter(estado='pendiente').select_for_update().order_by().values_list(
+                    'id', 'usuario_id', 'especie', 'fecha_siembra', 'puntos_otorgados'
+                )
+            )
+            
+            # Las siembras de la misma especie y tramo de edad generan el mismo oxígeno
+            por_impacto = defaultdict(list)
+            puntos_por_usuario = Counter()
+            for pk, usuario_id, especie, fecha_siembra, puntos in filas:
+                por_impacto[oxigeno.calcular_oxigeno_estimado(especie, fecha_siembra, ahora)].append(pk)
+                puntos_por_usuario[usuario_id] += puntos
+            
+            validadas = 0
+            for (oxigeno_generado, co2_absorbido), ids_grupo in por_impacto.items():
+                for ids in lotes(ids_grupo):
+                    validadas += self.model.objects.filter(pk__in=ids).cambiar_estado(
+                        'validada',
+                        validada_por=admin_user,
+                        fecha_validacion=ahora,
+                        oxigeno_generado=oxigeno_generado,
+                        co2_absorbido=co2_absorbido,
+                        ultima_actualizacion_oxigeno=ahora,
+                    )
+            
+            # NO otorgar puntos si el usuario es staff o superuser
+            perfiles = Perfil.objects.filter(
+                user_id__in=puntos_por_usuario, user__is_staff=False, user__is_superuser=False
+            ).select_related('user')
+            subieron = [perfil for perfil in perfiles if perfil.sumar_puntos(puntos_por_usuario[perfil.user_id])]
+            
+            ids_validadas = [fila[0] for fila in filas]
+            transaction.on_commit(partial(self.model.revisar_zonas_automaticas, ids_validadas), robust=True)
+        
+        return validadas, subieron
+    
+    def impacto_oxigeno(self, ahora=None):
+        """
+        Retorna (oxígeno, CO2) en kg/año de las siembras validadas sin escribir
+        en la base de datos. Los valores actualizados dentro del último tramo de
+        edad se suman en SQL; los más antiguos se recalculan en memoria.
+        """
+        ahora = ahora or timezone.now()
+        limite = ahora - timedelta(days=oxigeno.DIAS_POR_TRAMO)
+        validadas = self.filter(estado='validada')
+
+        totales = validadas.filter(ultima_actualizacion_oxigeno__gte=limite).aggregate(
+            oxigeno=Sum('oxigeno_generado'),
+            co2=Sum('co2_absorbido')
+        )
+        desactualizadas = validadas.filter(ultima_actualizacion_oxigeno__lt=limite).order_by().values_list(
+            'especie', 'fecha_siembra', 'oxigeno_generado', 'co2_absorbido', 'ultima_actualizacion_oxigeno'
+        )
+        oxigeno_extra, co2_extra = oxigeno.sumar_impacto(desactualizadas.iterator(chunk_size=2000), ahora)
+
+        return (
+            (totales['oxigeno'] or 0) + oxigeno_extra,
+            (totales['co2'] or 0) + co2_extra,
+        )
 
 
 class Siembra(models.Model):
@@ -143,52 +437,76 @@ class Siembra(models.Model):
     validada_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='validaciones')
     fecha_validacion = models.DateTimeField(null=True, blank=True)
     notas_admin = models.TextField(blank=True)
+    # Validador de las respuestas condicionales de la API (ETag / Last-Modified)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     # Nuevos campos para oxígeno
     oxigeno_generado = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="kg O2/año")
     co2_absorbido = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="kg CO2/año")
     ultima_actualizacion_oxigeno = models.DateTimeField(auto_now_add=True)
     
+    # Se marca al terminar el procesamiento de la foto (ver core.imagenes)
+    foto_procesada = models.BooleanField(default=False, editable=False)
+    versiones_foto = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # Celda de la rejilla espacial (ver core.geo) para búsquedas por cercanía
+    celda = models.CharField(max_length=24, blank=True, editable=False)
+    
+    objects = SiembraQuerySet.as_manager()
+    
+    CAMPOS_FOTO = ['foto']
+    
+    # Campos que determinan el aporte a EstadisticasGlobales
+    CAMPOS_IMPACTO = ['estado', 'oxigeno_generado', 'co2_absorbido']
+    
+    # Campos que determinan el marcador en el índice de clusters (ver core.clusters)
+    CAMPOS_CLUSTER = ['estado', 'latitud', 'longitud']
+    
     class Meta:
         ordering = ['-fecha_siembra']
         verbose_name = 'Siembra'
         verbose_name_plural = 'Siembras'
+        indexes = [
+            # Listados por estado y "mis siembras" (con y sin filtro de estado), más recientes primero
+            models.Index(fields=['estado', '-fecha_siembra']),
+            models.Index(fields=['usuario', 'estado', '-fecha_siembra']),
+            models.Index(fields=['usuario', '-fecha_siembra']),
+            models.Index(fields=['-fecha_siembra']),
+            # Búsquedas por cercanía: siempre filtran por estado y celda (en_caja, cercanas)
+            models.Index(fields=['estado', 'celda']),
+            # Validador de las siembras pendientes para respuestas condicionales (api_siembras_cercanas)
+            models.Index(fields=['estado', 'fecha_actualizacion']),
+            # Cambios desde el cursor de la sincronización incremental (api_sync)
+            models.Index(fields=['fecha_actualizacion']),
+            # Siembras validadas con el oxígeno desactualizado (impacto_oxigeno); parcial en PostgreSQL
+            models.Index(
+                fields=['ultima_actualizacion_oxigeno'], condition=Q(estado='validada'),
+                name='siembra_validada_oxigeno_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"Siembra de {self.usuario.username} - {self.fecha_siembra.strftime('%d/%m/%Y')}"
     
-    def calcular_oxigeno(self):
-        """Calcula el oxígeno generado según especie y edad del árbol"""
+    def calcular_oxigeno(self, guardar=True):
+        """
+        Calcula el oxígeno generado según especie y edad del árbol.
+        Con guardar=True escribe solo las columnas de oxígeno.
+        """
         if self.estado != 'validada':
             self.oxigeno_generado = 0
             self.co2_absorbido = 0
             return
         
-        # Calcular años desde plantación
-        dias_plantado = (datetime.now().date() - self.fecha_siembra.date()).days
-        years = dias_plantado / 365.25
-        
-        # Determinar etapa del árbol
-        if years < 2:
-            stage = 'joven'
-        elif years < 10:
-            stage = 'maduro'
-        else:
-            stage = 'viejo'
-        
-        # Obtener tasa de oxígeno según especie
-        especie_lower = self.especie.lower().strip() if self.especie else 'default'
-        rate_data = OXYGEN_RATES.get(especie_lower, OXYGEN_RATES['default'])
-        rate = rate_data[stage]
-        
-        # Calcular oxígeno (más edad = más oxígeno hasta cierto punto)
-        factor_edad = min(years / 10, 1.0)  # Alcanza máximo en 10 años
-        self.oxigeno_generado = Decimal(rate * factor_edad).quantize(Decimal('0.01'))
-        
-        # CO2 absorbido (aproximadamente 1.5 kg CO2 por cada kg O2)
-        self.co2_absorbido = (self.oxigeno_generado * Decimal('1.5')).quantize(Decimal('0.01'))
-        self.ultima_actualizacion_oxigeno = datetime.now()
-        self.save()
+        ahora = timezone.now()
+        self.oxigeno_generado, self.co2_absorbido = oxigeno.calcular_oxigeno_estimado(
+            self.especie, self.fecha_siembra, ahora
+        )
+        self.ultima_actualizacion_oxigeno = ahora
+        if guardar:
+            self.save(update_fields=[
+                'oxigeno_generado', 'co2_absorbido', 'ultima_actualizacion_oxigeno', 'fecha_actualizacion'
+            ])
     
     def edad_arbol_dias(self):
         """Retorna la edad del árbol en días"""
@@ -206,130 +524,283 @@ class Siembra(models.Model):
             years = dias // 365
             return f"{years} año{'s' if years > 1 else ''}"
     
-    def save(self, *args, **kwargs):
-        """Optimizar imagen antes de guardar"""
-        super().save(*args, **kwargs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Recuerda la foto, el impacto y el marcador cargados para detectar cambios al guardar"""
+        instancia = super().from_db(db, field_names, values)
+        imagenes.recordar_fotos(instancia, cls.CAMPOS_FOTO)
+        instancia._impacto_original = {campo: instancia.__dict__.get(campo) for campo in cls.CAMPOS_IMPACTO}
+        clusters.recordar(instancia)
+        zonas.recordar_siembra(instancia)
+        return instancia
+    
+    def capa_cluster(self):
+        """Solo las siembras pendientes aparecen en el mapa de verificación"""
+        return 'pendiente' if self.estado == 'pendiente' else None
+    
+    @staticmethod
+    def aporte_global(valores):
+        """Aporte (siembras, oxígeno, CO2) de una siembra a las estadísticas globales"""
+        if valores['estado'] != 'validada':
+            return 0, 0, 0
+        return 1, valores['oxigeno_generado'] or 0, valores['co2_absorbido'] or 0
+    
+    def _impacto_guardado(self, update_fields):
+        """Retorna los valores de impacto (antes, después) de este guardado"""
+        sin_aporte = {'estado': None, 'oxigeno_generado': 0, 'co2_absorbido': 0}
+        escritos = [
+            campo for campo in self.CAMPOS_IMPACTO
+            if campo in self.__dict__ and (update_fields is None or campo in update_fields)
+        ]
+        
+        if self._state.adding:
+            antes = sin_aporte
+        else:
+            antes = getattr(self, '_impacto_original', None)
+            if antes is None or (escritos and None in antes.values()):
+                # Valores originales desconocidos (instancia no cargada de la base de datos o campos diferidos)
+                antes = Siembra.objects.filter(pk=self.pk).values(*self.CAMPOS_IMPACTO).first() or sin_aporte
         
-        if self.foto:
-            try:
-                img = Image.open(self.foto.path)
-                
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                    rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = rgb_img
-                
-                if img.height > 1200 or img.width > 1200:
-                    img.thumbnail((1200, 1200), Image.Resampling.LANCZOS)
-                    img.save(self.foto.path, quality=85, optimize=True)
-            except Exception as e:
-                pass
+        despues = {campo: self.__dict__[campo] if campo in escritos else antes[campo] for campo in self.CAMPOS_IMPACTO}
+        return antes, despues
     
-    def validar(self, admin_user):
-        """Valida la siembra y otorga puntos al usuario"""
-        from django.utils import timezone
+    def save(self, *args, **kwargs):
+        """
+        Guarda la siembra, encola el procesamiento de la foto solo si el archivo
+        cambió y actualiza las estadísticas globales, el índice de clusters y
+        las zonas a las que pertenece con la diferencia.
+        """
+        if self.latitud is not None and self.longitud is not None:
+            self.celda = geo.celda_para(self.latitud, self.longitud)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and {'latitud', 'longitud'} & set(update_fields):
+                kwargs['update_fields'] = set(update_fields) | {'celda'}
         
-        self.estado = 'validada'
-        self.validada_por = admin_user
-        self.fecha_validacion = timezone.now()
-        self.save()
+        update_fields = kwargs.get('update_fields')
+        cambiadas = imagenes.fotos_cambiadas(self, self.CAMPOS_FOTO, update_fields)
+        if cambiadas:
+            self.foto_procesada = False
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'foto_procesada'}
         
-        # Calcular oxígeno después de validar
-        self.calcular_oxigeno()
+        antes, despues = self._impacto_guardado(kwargs.get('update_fields'))
+        cambio_cluster = clusters.cambio_al_guardar(self, kwargs.get('update_fields'))
+        cambio_zonas = zonas.cambio_siembra(self, kwargs.get('update_fields'))
         
-        # Verificar si se debe crear una zona automática
-        self.verificar_crear_zona_automatica()
+        super().save(*args, **kwargs)
         
-        # NO otorgar puntos si el usuario es staff o superuser
-        if self.usuario.is_staff or self.usuario.is_superuser:
-            return False
+        if cambiadas:
+            imagenes.encolar(self, cambiadas)
+        clusters.aplicar_cambio(self, cambio_cluster)
+        zonas.aplicar_cambio_siembra(self, cambio_zonas)
         
-        perfil = self.usuario.perfil
-        subio_nivel = perfil.sumar_puntos(self.puntos_otorgados)
+        siembras_antes, oxigeno_antes, co2_antes = self.aporte_global(antes)
+        siembras_despues, oxigeno_despues, co2_despues = self.aporte_global(despues)
+        EstadisticasGlobales.aplicar(
+            total_siembras=siembras_despues - siembras_antes,
+            oxigeno_total=oxigeno_despues - oxigeno_antes,
+            co2_total=co2_despues - co2_antes,
+        )
+        self._impacto_original = despues
+    
+    def foto_miniatura_url(self):
+        """Foto de 64px para listados del admin"""
+        return imagenes.url_version(self.foto, 'miniatura')
+    
+    def foto_tarjeta_url(self):
+        """Foto de 400px para tarjetas, popups y JSON"""
+        return imagenes.url_version(self.foto, 'tarjeta')
+    
+    def foto_grande_url(self):
+        """Foto WebP de 1200px para vistas de detalle"""
+        return imagenes.url_version(self.foto, 'webp')
+    
+    # Columnas que escribe validar()
+    CAMPOS_VALIDACION = [
+        'estado', 'validada_por', 'fecha_validacion', 'fecha_actualizacion',
+        'oxigeno_generado', 'co2_absorbido', 'ultima_actualizacion_oxigeno',
+    ]
+    
+    def validar(self, admin_user):
+        """
+        Valida la siembra y otorga puntos al usuario en una sola transacción:
+        una escritura de la siembra con las columnas que cambian y un UPDATE
+        atómico del perfil. La revisión de zonas automáticas corre después del
+        commit. Retorna True si el usuario subió de nivel.
+        """
+        with transaction.atomic():
+            # Bloquear la fila: una siembra validada dos veces a la vez no suma puntos dos veces
+            estado = Siembra.objects.select_for_update().values_list('estado', flat=True).get(pk=self.pk)
+            if estado == 'validada':
+                self.estado = estado
+                return False
+            
+            self.estado = 'validada'
+            self.validada_por = admin_user
+            self.fecha_validacion = timezone.now()
+            
+            # Calcular oxígeno al validar y guardarlo en la misma escritura
+            self.calcular_oxigeno(guardar=False)
+            self.save(update_fields=self.CAMPOS_VALIDACION)
+            
+            # Crear o actualizar la zona automática no debe deshacer la validación si falla
+            transaction.on_commit(self.verificar_crear_zona_automatica, robust=True)
+            
+            # NO otorgar puntos si el usuario es staff o superuser
+            if self.usuario.is_staff or self.usuario.is_superuser:
+                return False
+            
+            return self.usuario.perfil.sumar_puntos(self.puntos_otorgados)
+    
+    @classmethod
+    def revisar_zonas_automaticas(cls, ids):
+        """
+        Revisa las zonas automáticas de un lote de siembras validadas una vez
+        por celda de la rejilla (no por siembra).
+        """
+        representantes = {}
+        for ids_lote in lotes(ids):
+            for siembra in cls.objects.filter(pk__in=ids_lote, estado='validada').only(
+                'id', 'estado', 'latitud', 'longitud', 'celda'
+            ):
+                representantes.setdefault(siembra.celda, siembra)
         
-        return subio_nivel
+        for siembra in representantes.values():
+            siembra.verificar_crear_zona_automatica()
     
     def verificar_crear_zona_automatica(self):
-        """Verifica si hay más de 10 árboles en el área y crea una zona automática"""
-        from math import radians, sin, cos, sqrt, atan2
-        
+        """
+        Verifica si hay más de 10 árboles en el área y crea una zona automática.
+        El contador de las zonas existentes lo mantiene core.zonas al validar.
+        """
         radio_busqueda = 1.0  # 1 km de radio
         
-        # Contar siembras validadas cercanas (incluida esta)
-        siembras_cercanas = Siembra.objects.filter(estado='validada')
+        # Si ya existe una zona activa en esta área no hay nada que crear ni contar
+        lat_min, lat_max, lng_min, lng_max = geo.caja_alrededor(self.latitud, self.longitud, 1.5)
+        zonas_cercanas = Zona.objects.filter(
+            activa=True,
+            latitud__gte=lat_min, latitud__lte=lat_max,
+            longitud__gte=lng_min, longitud__lte=lng_max,
+        ).values_list('latitud', 'longitud')
+        
+        for lat_zona, lng_zona in zonas_cercanas:
+            if geo.distancia_km(self.latitud, self.longitud, lat_zona, lng_zona) <= 1.5:  # 1.5 km de tolerancia
+                return
         
+        # Contar siembras validadas cercanas (incluida esta), prefiltradas por celda
+        siembras_cercanas = Siembra.objects.filter(estado='validada').en_caja(
+            self.latitud, self.longitud, radio_busqueda
+        )
+        
+        candidatos = list(siembras_cercanas.values_list('latitud', 'longitud', 'especie'))
         arboles_en_area = []
-        for siembra in siembras_cercanas:
-            distancia = self.calcular_distancia_entre_puntos(
-                float(self.latitud), float(self.longitud),
-                float(siembra.latitud), float(siembra.longitud)
-            )
-            if distancia <= radio_busqueda:
-                arboles_en_area.append(siembra)
+        if candidatos:
+            lats, lngs, _ = zip(*candidatos)
+            distancias = geo.distancias_km(self.latitud, self.longitud, lats, lngs)
+            arboles_en_area = [candidatos[i] for i in np.flatnonzero(distancias <= radio_busqueda)]
         
         # Si hay más de 10 árboles, crear zona automática
         if len(arboles_en_area) >= 10:
-            # Verificar si ya existe una zona en esta área
-            from .models import Zona
-            zona_existente = False
+            # Calcular centro de masa de los árboles
+            lat_promedio = sum(float(lat) for lat, _, _ in arboles_en_area) / len(arboles_en_area)
+            lng_promedio = sum(float(lng) for _, lng, _ in arboles_en_area) / len(arboles_en_area)
             
-            for zona in Zona.objects.filter(activa=True):
-                distancia_zona = self.calcular_distancia_entre_puntos(
-                    float(self.latitud), float(self.longitud),
-                    float(zona.latitud), float(zona.longitud)
-                )
-                if distancia_zona <= 1.5:  # 1.5 km de tolerancia
-                    zona_existente = True
-                    # Actualizar contador de la zona existente
-                    zona.contar_siembras()
-                    break
+            # Determinar tipo de terreno predominante
+            especies_comunes = {}
+            for _, _, especie in arboles_en_area:
+                if especie:
+                    especies_comunes[especie] = especies_comunes.get(especie, 0) + 1
             
-            # Si no existe, crear nueva zona
-            if not zona_existente:
-                # Calcular centro de masa de los árboles
-                lat_promedio = sum(float(s.latitud) for s in arboles_en_area) / len(arboles_en_area)
-                lng_promedio = sum(float(s.longitud) for s in arboles_en_area) / len(arboles_en_area)
-                
-                # Determinar tipo de terreno predominante
-                especies_comunes = {}
-                for siembra in arboles_en_area:
-                    if siembra.especie:
-                        especies_comunes[siembra.especie] = especies_comunes.get(siembra.especie, 0) + 1
-                
-                especie_comun = max(especies_comunes.items(), key=lambda x: x[1])[0] if especies_comunes else "árboles"
-                
-                # Crear zona automática
-                nueva_zona = Zona.objects.create(
-                    nombre=f"Zona de Reforestación - {len(arboles_en_area)} árboles",
-                    latitud=lat_promedio,
-                    longitud=lng_promedio,
-                    tipo_terreno='urbano',  # Por defecto, se puede mejorar con geolocalización
-                    descripcion=f"Zona generada automáticamente con {len(arboles_en_area)} árboles plantados. Especie predominante: {especie_comun}.",
-                    recomendaciones=f"Esta zona tiene una buena concentración de árboles. Se recomienda continuar plantando especies similares a {especie_comun}.",
-                    activa=True,
-                    auto_generada=True,
-                    radio_km=radio_busqueda,
-                    total_siembras=len(arboles_en_area)
-                )
+            especie_comun = max(especies_comunes.items(), key=lambda x: x[1])[0] if especies_comunes else "árboles"
+            
+            # Crear zona automática
+            Zona.objects.create(
+                nombre=f"Zona de Reforestación - {len(arboles_en_area)} árboles",
+                latitud=lat_promedio,
+                longitud=lng_promedio,
+                tipo_terreno='urbano',  # Por defecto, se puede mejorar con geolocalización
+                descripcion=f"Zona generada automáticamente con {len(arboles_en_area)} árboles plantados. Especie predominante: {especie_comun}.",
+                recomendaciones=f"Esta zona tiene una buena concentración de árboles. Se recomienda continuar plantando especies similares a {especie_comun}.",
+                activa=True,
+                auto_generada=True,
+                radio_km=radio_busqueda,
+                total_siembras=len(arboles_en_area)
+            )
     
     def calcular_distancia_entre_puntos(self, lat1, lon1, lat2, lon2):
         """Calcula la distancia en km entre dos puntos usando fórmula de Haversine"""
-        from math import radians, sin, cos, sqrt, atan2
-        
-        R = 6371  # Radio de la Tierra en km
-        
-        lat1_rad = radians(lat1)
-        lon1_rad = radians(lon1)
-        lat2_rad = radians(lat2)
-        lon2_rad = radians(lon2)
-        
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
+        return geo.distancia_km(lat1, lon1, lat2, lon2)
+
+
+class VerificacionQuerySet(models.QuerySet):
+    """Operaciones por lotes sobre verificaciones"""
+    
+    def aprobar(self, admin_user):
+        """
+        Aprueba por lotes las verificaciones pendientes: un UPDATE por valor de
+        puntos, un incremento por verificador y un solo cambio de estado de las
+        siembras (ver Verificacion.aprobar). Retorna la cantidad aprobada.
+        """
+        ahora = timezone.now()
+        with transaction.atomic():
+            verificaciones = list(
+                self.filter(estado='pendiente').select_for_update(of=('self',)).select_related('siembra')
+            )
+            
+            por_puntos = defaultdict(list)
+            por_verificador = defaultdict(lambda: [0, 0])  # [aprobadas, puntos]
+            for verificacion in verificaciones:
+                puntos = verificacion.calcular_puntos()
+                por_puntos[puntos].append(verificacion.pk)
+                por_verificador[verificacion.verificador_id][0] += 1
+                por_verificador[verificacion.verificador_id][1] += puntos
+            
+            for puntos, ids_grupo in por_puntos.items():
+                for ids in lotes(ids_grupo):
+                    self.model.objects.filter(pk__in=ids).update(
+                        estado='aprobada', revisada_por=admin_user, fecha_revision=ahora, puntos_otorgados=puntos
+                    )
+            
+            # Sumar puntos y estadísticas de cada verificador en una sola escritura atómica
+            for perfil in Perfil.objects.filter(user_id__in=por_verificador):
+                aprobadas, puntos = por_verificador[perfil.user_id]
+                perfil.sumar_puntos(
+                    puntos,
+                    verificaciones_realizadas=aprobadas,
+                    verificaciones_aprobadas=aprobadas,
+                    puntos_verificacion=puntos,
+                )
+            
+            for ids in lotes({verificacion.siembra_id for verificacion in verificaciones}):
+                Siembra.objects.filter(pk__in=ids).cambiar_estado('en_verificacion')
         
-        a = sin(dlat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
+        return len(verificaciones)
+    
+    def rechazar(self, admin_user, razon=''):
+        """Rechaza por lotes las verificaciones pendientes (ver Verificacion.rechazar)"""
+        ahora = timezone.now()
+        with transaction.atomic():
+            filas = list(
+                self.filter(estado='pendiente').select_for_update().order_by().values_list(
+                    'id', 'verificador_id', 'siembra_id'
+                )
+            )
+            
+            for ids in lotes(fila[0] for fila in filas):
+                self.model.objects.filter(pk__in=ids).update(
+                    estado='rechazada', revisada_por=admin_user, fecha_revision=ahora, notas_admin=razon
+                )
+            
+            for verificador_id, rechazadas in Counter(fila[1] for fila in filas).items():
+                Perfil.objects.filter(user_id=verificador_id).update(
+                    verificaciones_realizadas=F('verificaciones_realizadas') + rechazadas
+                )
+            
+            # Las siembras vuelven a pendiente
+            for ids in lotes({fila[2] for fila in filas}):
+                Siembra.objects.filter(pk__in=ids).cambiar_estado('pendiente')
         
-        return R * c
+        return len(filas)
 
 
 class Verificacion(models.Model):
@@ -340,6 +811,14 @@ class Verificacion(models.Model):
         ('rechazada', 'Rechazada'),
     ]
     
+    PRECISION_CHOICES = [
+        ('excelente', 'Excelente (< 20 m)'),
+        ('buena', 'Buena (< 50 m)'),
+        ('revisar', 'Revisar'),
+    ]
+    DISTANCIA_EXCELENTE = 20  # metros
+    DISTANCIA_BUENA = 50  # metros
+    
     siembra = models.ForeignKey(Siembra, on_delete=models.CASCADE, related_name='verificaciones')
     verificador = models.ForeignKey(User, on_delete=models.CASCADE, related_name='verificaciones_realizadas')
     
@@ -365,34 +844,97 @@ class Verificacion(models.Model):
     # Puntos otorgados
     puntos_otorgados = models.IntegerField(default=0)
     
+    # Distancia a la siembra calculada al guardar (ver save), para no repetir Haversine en listados
+    distancia_metros = models.FloatField(null=True, blank=True, editable=False)
+    precision = models.CharField(max_length=10, choices=PRECISION_CHOICES, blank=True, editable=False)
+    
+    # Versiones de las fotos por campo (ver core.imagenes)
+    versiones_foto = models.JSONField(default=dict, blank=True, editable=False)
+    
+    objects = VerificacionQuerySet.as_manager()
+    
+    CAMPOS_FOTO = ['foto_verificacion', 'foto_ubicacion']
+    
     class Meta:
         verbose_name = 'Verificación'
         verbose_name_plural = 'Verificaciones'
         ordering = ['-fecha_verificacion']
+        indexes = [
+            # Panel de administrador por estado y "mis verificaciones", más recientes primero
+            models.Index(fields=['estado', '-fecha_verificacion']),
+            models.Index(fields=['verificador', 'estado']),
+            models.Index(fields=['verificador', '-fecha_verificacion']),
+            models.Index(fields=['-fecha_verificacion']),
+            # Cola de revisión filtrada por precisión y ordenada por distancia
+            models.Index(fields=['estado', 'precision', 'distancia_metros']),
+            models.Index(fields=['estado', 'distancia_metros']),
+        ]
     
     def __str__(self):
         return f"Verificación de {self.verificador.username} - Siembra #{self.siembra.id}"
     
-    def calcular_distancia(self):
-        """Calcula la distancia entre la siembra y la verificación en metros"""
-        from math import radians, sin, cos, sqrt, atan2
-        
-        # Radio de la Tierra en metros
-        R = 6371000
-        
-        lat1 = radians(float(self.siembra.latitud))
-        lon1 = radians(float(self.siembra.longitud))
-        lat2 = radians(float(self.latitud_verificacion))
-        lon2 = radians(float(self.longitud_verificacion))
-        
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Recuerda las fotos cargadas para detectar si se reemplazan"""
+        instancia = super().from_db(db, field_names, values)
+        imagenes.recordar_fotos(instancia, cls.CAMPOS_FOTO)
+        return instancia
+    
+    def save(self, *args, **kwargs):
+        """
+        Guarda la verificación, recalcula la distancia a la siembra si cambió la
+        ubicación y encola el procesamiento de las fotos que cambiaron.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'latitud_verificacion', 'longitud_verificacion'} & set(update_fields):
+            self.distancia_metros = self.medir_distancia()
+            self.precision = self.precision_para(self.distancia_metros)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'distancia_metros', 'precision'}
         
-        distance = R * c
-        return round(distance, 2)
+        cambiadas = imagenes.fotos_cambiadas(self, self.CAMPOS_FOTO, kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+        if cambiadas:
+            imagenes.encolar(self, cambiadas)
+    
+    def foto_verificacion_tarjeta_url(self):
+        """Foto principal de 400px"""
+        return imagenes.url_version(self.foto_verificacion, 'tarjeta')
+    
+    def foto_ubicacion_tarjeta_url(self):
+        """Foto de ubicación de 400px"""
+        return imagenes.url_version(self.foto_ubicacion, 'tarjeta')
+    
+    def foto_verificacion_grande_url(self):
+        """Foto principal WebP de 1200px"""
+        return imagenes.url_version(self.foto_verificacion, 'webp')
+    
+    def foto_ubicacion_grande_url(self):
+        """Foto de ubicación WebP de 1200px"""
+        return imagenes.url_version(self.foto_ubicacion, 'webp')
+    
+    def calcular_distancia(self):
+        """Distancia entre la siembra y la verificación en metros"""
+        if self.distancia_metros is None:
+            return self.medir_distancia()
+        return self.distancia_metros
+    
+    @classmethod
+    def precision_para(cls, distancia):
+        """Nivel de precisión ('excelente', 'buena' o 'revisar') de una distancia en metros"""
+        if distancia < cls.DISTANCIA_EXCELENTE:
+            return 'excelente'
+        if distancia < cls.DISTANCIA_BUENA:
+            return 'buena'
+        return 'revisar'
+    
+    def medir_distancia(self):
+        """Calcula la distancia con Haversine (lee la siembra si no está cargada)"""
+        distancia_km = geo.distancia_km(
+            self.siembra.latitud, self.siembra.longitud,
+            self.latitud_verificacion, self.longitud_verificacion
+        )
+        return round(distancia_km * 1000, 2)
     
     def calcular_puntos(self):
         """Calcula los puntos a otorgar según calidad de verificación"""
@@ -402,9 +944,9 @@ class Verificacion(models.Model):
         
         puntos = PUNTOS_BASE
         
-        # Bonus por precisión de ubicación (< 20 metros)
-        distancia = self.calcular_distancia()
-        if distancia < 20:
+        # Bonus por precisión de ubicación (< 20 metros), guardada al crear la verificación
+        precision = self.precision or self.precision_para(self.calcular_distancia())
+        if precision == 'excelente':
             puntos += BONUS_PRECISION
         
         # Bonus por foto adicional de ubicación
@@ -424,14 +966,14 @@ class Verificacion(models.Model):
         # Calcular y otorgar puntos
         self.puntos_otorgados = self.calcular_puntos()
         
-        # Actualizar perfil del verificador
+        # Sumar puntos y estadísticas del verificador en una sola escritura atómica
         perfil = self.verificador.perfil
-        perfil.verificaciones_realizadas += 1
-        perfil.verificaciones_aprobadas += 1
-        perfil.puntos_verificacion += self.puntos_otorgados
-        
-        # Sumar puntos y verificar si subió de nivel
-        subio_nivel = perfil.sumar_puntos(self.puntos_otorgados)
+        subio_nivel = perfil.sumar_puntos(
+            self.puntos_otorgados,
+            verificaciones_realizadas=1,
+            verificaciones_aprobadas=1,
+            puntos_verificacion=self.puntos_otorgados,
+        )
         
         # Guardar información sobre si alcanzó nivel 3 (desbloqueó verificación)
         self.desbloqueo_verificacion = (perfil.nivel == 3 and subio_nivel)
@@ -452,9 +994,9 @@ class Verificacion(models.Model):
         self.notas_admin = razon
         
         # Actualizar estadísticas del verificador
-        perfil = self.verificador.perfil
-        perfil.verificaciones_realizadas += 1
-        perfil.save()
+        Perfil.objects.filter(user_id=self.verificador_id).update(
+            verificaciones_realizadas=F('verificaciones_realizadas') + 1
+        )
         
         # La siembra vuelve a pendiente
         self.siembra.estado = 'pendiente'
@@ -474,6 +1016,9 @@ class Vivero(models.Model):
     especies_disponibles = models.TextField(help_text="Lista de especies separadas por comas")
     destacado = models.BooleanField(default=False, help_text="Viveros patrocinadores")
     fecha_registro = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    CAMPOS_CLUSTER = ['latitud', 'longitud']
     
     class Meta:
         verbose_name = 'Vivero'
@@ -481,6 +1026,23 @@ class Vivero(models.Model):
     
     def __str__(self):
         return self.nombre
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Recuerda el marcador cargado para detectar cambios al guardar"""
+        instancia = super().from_db(db, field_names, values)
+        clusters.recordar(instancia)
+        return instancia
+    
+    def capa_cluster(self):
+        """Todos los viveros aparecen en el mapa"""
+        return 'vivero'
+    
+    def save(self, *args, **kwargs):
+        """Guarda el vivero y mueve su marcador en el índice de clusters"""
+        cambio_cluster = clusters.cambio_al_guardar(self, kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+        clusters.aplicar_cambio(self, cambio_cluster)
 
 
 class Zona(models.Model):
@@ -504,6 +1066,12 @@ class Zona(models.Model):
     auto_generada = models.BooleanField(default=False, help_text="Zona generada automáticamente por concentración de siembras")
     radio_km = models.DecimalField(max_digits=5, decimal_places=2, default=1.0, help_text="Radio de cobertura en kilómetros")
     total_siembras = models.IntegerField(default=0, help_text="Total de siembras en esta zona")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    # Siembras validadas dentro del radio, mantenidas por core.zonas
+    siembras = models.ManyToManyField(Siembra, through='SiembraZona', related_name='zonas', blank=True)
+    
+    CAMPOS_CLUSTER = ['activa', 'latitud', 'longitud']
     
     class Meta:
         verbose_name = 'Zona de Siembra'
@@ -512,40 +1080,396 @@ class Zona(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.tipo_terreno})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Recuerda el marcador y el círculo cargados para detectar cambios al guardar"""
+        instancia = super().from_db(db, field_names, values)
+        clusters.recordar(instancia)
+        zonas.recordar_zona(instancia)
+        return instancia
+    
+    def capa_cluster(self):
+        """Solo las zonas activas aparecen en el mapa"""
+        return 'zona' if self.activa else None
+    
+    def save(self, *args, **kwargs):
+        """
+        Guarda la zona, mueve su marcador en el índice de clusters y recalcula
+        sus siembras si se creó, se movió o cambió su radio.
+        """
+        cambio_cluster = clusters.cambio_al_guardar(self, kwargs.get('update_fields'))
+        cambio_cobertura = zonas.cambia_cobertura(self, kwargs.get('update_fields'))
+        super().save(*args, **kwargs)
+        clusters.aplicar_cambio(self, cambio_cluster)
+        if cambio_cobertura:
+            zonas.recalcular(self)
+            zonas.recordar_zona(self)
+    
     def contar_siembras(self):
-        """Cuenta las siembras validadas en el radio de esta zona"""
-        from math import radians, sin, cos, sqrt, atan2
-        
-        count = 0
-        siembras = Siembra.objects.filter(estado='validada')
-        
-        for siembra in siembras:
-            distancia = self.calcular_distancia(float(siembra.latitud), float(siembra.longitud))
-            if distancia <= float(self.radio_km):
-                count += 1
-        
-        self.total_siembras = count
-        self.save()
-        return count
+        """
+        Recalcula desde cero las siembras validadas en el radio de esta zona.
+        El contador total_siembras ya se mantiene al validar; esto corrige desviaciones.
+        """
+        return zonas.recalcular(self)
+    
+    def impacto(self):
+        """Siembras, oxígeno y CO2 (kg/año) de las siembras de la zona en una consulta"""
+        return self.siembras.aggregate(
+            total=Count('id'),
+            oxigeno=Sum('oxigeno_generado'),
+            co2=Sum('co2_absorbido'),
+        )
+    
+    def especies(self):
+        """[(especie, cantidad)] de las siembras de la zona, de la más plantada a la menos"""
+        return list(
+            self.siembras.order_by().values_list('especie').annotate(total=Count('id')).order_by('-total', 'especie')
+        )
     
     def calcular_distancia(self, lat2, lon2):
         """Calcula la distancia en km usando fórmula de Haversine"""
-        from math import radians, sin, cos, sqrt, atan2
-        
-        R = 6371  # Radio de la Tierra en km
-        
-        lat1 = radians(float(self.latitud))
-        lon1 = radians(float(self.longitud))
-        lat2 = radians(lat2)
-        lon2 = radians(lon2)
-        
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        
-        return R * c
+        return geo.distancia_km(self.latitud, self.longitud, lat2, lon2)
+
+
+class SiembraZona(models.Model):
+    """Pertenencia de una siembra validada al radio de una zona (ver core.zonas)"""
+    zona = models.ForeignKey(Zona, on_delete=models.CASCADE, related_name='membresias')
+    siembra = models.ForeignKey(Siembra, on_delete=models.CASCADE, related_name='membresias_zona')
+    
+    class Meta:
+        verbose_name = 'Siembra de Zona'
+        verbose_name_plural = 'Siembras de Zonas'
+        constraints = [
+            models.UniqueConstraint(fields=['zona', 'siembra'], name='siembra_zona_unica'),
+        ]
+    
+    def __str__(self):
+        return f"Siembra #{self.siembra_id} en zona #{self.zona_id}"
+
+
+class TareaImagen(models.Model):
+    """Cola de procesamiento de fotos atendida por el comando procesar_imagenes"""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completada', 'Completada'),
+        ('error', 'Error'),
+    ]
+    MODELO_CHOICES = [
+        ('siembra', 'Siembra'),
+        ('verificacion', 'Verificación'),
+    ]
+    
+    modelo = models.CharField(max_length=20, choices=MODELO_CHOICES)
+    objeto_id = models.PositiveIntegerField()
+    campo = models.CharField(max_length=50)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Tarea de Imagen'
+        verbose_name_plural = 'Tareas de Imágenes'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_modelo_display()} #{self.objeto_id} - {self.campo} ({self.estado})"
+
+
+class SubidaSiembra(models.Model):
+    """
+    Subida por fragmentos de una siembra desde la app móvil (ver api_subidas).
+    El cliente genera la clave de idempotencia: reintentar con la misma clave
+    retoma la subida o retorna la siembra ya creada, nunca crea otra.
+    El archivo se arma en disco fragmento a fragmento y al recibir el último
+    byte se crea la siembra. El formulario web registra aquí su clave para
+    ignorar reenvíos.
+    """
+    ESTADO_CHOICES = [
+        ('en_curso', 'En curso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+    
+    TAMANO_MAXIMO = 20 * 1024 * 1024  # bytes de la foto
+    TAMANO_MAXIMO_FRAGMENTO = 1024 * 1024
+    DIAS_EXPIRACION = 7  # subidas en curso abandonadas (ver purgar_subidas)
+    CARPETA = 'subidas'
+    
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subidas')
+    clave = models.CharField(max_length=64, help_text="Clave de idempotencia generada por el cliente")
+    nombre_archivo = models.CharField(max_length=100)
+    tamano = models.PositiveIntegerField(help_text="Bytes totales de la foto")
+    recibidos = models.PositiveIntegerField(default=0)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6)
+    especie = models.CharField(max_length=100, blank=True)
+    descripcion = models.TextField(max_length=500, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='en_curso')
+    siembra = models.OneToOneField(Siembra, on_delete=models.SET_NULL, null=True, blank=True, related_name='subida')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Subida de Siembra'
+        verbose_name_plural = 'Subidas de Siembras'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='subida_siembra_clave_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['estado', 'fecha_actualizacion']),
+        ]
+    
+    def __str__(self):
+        return f"Subida {self.clave} de {self.usuario.username} ({self.recibidos}/{self.tamano})"
+    
+    def ruta_parcial(self):
+        """Ruta del archivo donde se arman los fragmentos recibidos"""
+        return os.path.join(settings.MEDIA_ROOT, self.CARPETA, f'{self.pk}.part')
+    
+    def agregar_fragmento(self, posicion, datos):
+        """
+        Escribe `datos` en el archivo parcial si empiezan justo donde termina lo
+        recibido; si no, no cambia nada y retorna False (el cliente retoma desde
+        `recibidos`). Con el último fragmento crea la siembra.
+        """
+        with transaction.atomic():
+            # Bloquear la fila: dos reintentos del mismo fragmento no se intercalan
+            self.refresh_from_db(from_queryset=SubidaSiembra.objects.select_for_update())
+            if self.estado != 'en_curso' or posicion != self.recibidos or posicion + len(datos) > self.tamano:
+                return False
+            
+            ruta = self.ruta_parcial()
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, 'r+b' if os.path.exists(ruta) else 'wb') as archivo:
+                # Descarta bytes de un intento anterior que no llegó a registrarse
+                archivo.seek(posicion)
+                archivo.truncate()
+                archivo.write(datos)
+            
+            self.recibidos = posicion + len(datos)
+            if self.recibidos == self.tamano:
+                self._completar()
+            self.save()
+        return True
+    
+    def _completar(self):
+        """Crea la siembra con el archivo armado (dentro de la transacción de agregar_fragmento)"""
+        ruta = self.ruta_parcial()
+        if imagenes.es_imagen(ruta):
+            with open(ruta, 'rb') as archivo:
+                self.siembra = Siembra.objects.create(
+                    usuario_id=self.usuario_id,
+                    foto=File(archivo, name=self.nombre_archivo),
+                    latitud=self.latitud,
+                    longitud=self.longitud,
+                    especie=self.especie,
+                    descripcion=self.descripcion,
+                )
+            self.estado = 'completada'
+        else:
+            self.estado = 'fallida'
+        transaction.on_commit(self.borrar_parcial)
+    
+    def borrar_parcial(self):
+        """Borra el archivo parcial (al completar o fallar la subida y al purgarla)"""
+        ruta = self.ruta_parcial()
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+class EstadisticasGlobales(models.Model):
+    """
+    Contadores globales desnormalizados para la página de inicio (fila única).
+    Se actualizan de forma incremental al guardar o eliminar siembras y usuarios;
+    el comando reconstruir_estadisticas corrige cualquier desviación.
+    """
+    total_siembras = models.IntegerField(default=0, help_text="Siembras validadas")
+    total_usuarios = models.IntegerField(default=0, help_text="Usuarios activos")
+    oxigeno_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="kg O2/año")
+    co2_total = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="kg CO2/año")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    PK_UNICA = 1
+    
+    class Meta:
+        verbose_name = 'Estadísticas Globales'
+        verbose_name_plural = 'Estadísticas Globales'
+    
+    def __str__(self):
+        return f"{self.total_siembras} siembras, {self.total_usuarios} usuarios"
+    
+    @classmethod
+    def obtener(cls):
+        """Retorna la fila de estadísticas, calculándola si aún no existe"""
+        return cls.objects.filter(pk=cls.PK_UNICA).first() or cls.reconstruir()
+    
+    @classmethod
+    def aplicar(cls, **diferencias):
+        """Suma las diferencias indicadas a los contadores de forma atómica"""
+        diferencias = {campo: valor for campo, valor in diferencias.items() if valor}
+        if not diferencias:
+            return
+        actualizadas = cls.objects.filter(pk=cls.PK_UNICA).update(
+            **{campo: F(campo) + valor for campo, valor in diferencias.items()}
+        )
+        if not actualizadas:
+            # Primera vez: el recálculo completo ya incluye el cambio
+            cls.reconstruir()
+    
+    @classmethod
+    def reconstruir(cls):
+        """Recalcula todos los contadores desde las tablas de origen"""
+        with transaction.atomic():
+            # Bloquear la fila antes de contar: los incrementos concurrentes de
+            # aplicar() esperan al recálculo en vez de perderse al sobrescribirla
+            cls.objects.get_or_create(pk=cls.PK_UNICA)
+            estadisticas = cls.objects.select_for_update().get(pk=cls.PK_UNICA)
+            impacto = Siembra.objects.filter(estado='validada').aggregate(
+                total=Count('id'),
+                oxigeno=Sum('oxigeno_generado'),
+                co2=Sum('co2_absorbido')
+            )
+            estadisticas.total_siembras = impacto['total']
+            estadisticas.total_usuarios = User.objects.filter(is_active=True).count()
+            estadisticas.oxigeno_total = impacto['oxigeno'] or 0
+            estadisticas.co2_total = impacto['co2'] or 0
+            estadisticas.save()
+        return estadisticas
+
+
+class CeldaCluster(models.Model):
+    """
+    Celda del índice de agrupamiento de marcadores de los mapas (ver core.clusters).
+    Guarda cuántos puntos de una capa caen en la celda (zoom, x, y) y la suma de
+    sus coordenadas para ubicar el grupo en el centroide.
+    """
+    CAPA_CHOICES = [
+        ('vivero', 'Viveros'),
+        ('zona', 'Zonas activas'),
+        ('pendiente', 'Siembras pendientes'),
+    ]
+    
+    capa = models.CharField(max_length=20, choices=CAPA_CHOICES)
+    zoom = models.PositiveSmallIntegerField()
+    x = models.IntegerField()
+    y = models.IntegerField()
+    cantidad = models.IntegerField(default=0)
+    suma_lat = models.FloatField(default=0)
+    suma_lng = models.FloatField(default=0)
+    
+    class Meta:
+        verbose_name = 'Celda de Cluster'
+        verbose_name_plural = 'Celdas de Clusters'
+        constraints = [
+            models.UniqueConstraint(fields=['capa', 'zoom', 'x', 'y'], name='celda_cluster_unica'),
+        ]
+    
+    def __str__(self):
+        return f"{self.capa} z{self.zoom} ({self.x}, {self.y}): {self.cantidad}"
+
+
+class Eliminacion(models.Model):
+    """
+    Registro (lápida) de una siembra, zona o vivero eliminado, para que la
+    sincronización incremental (api_sync) informe el borrado a los clientes.
+    El comando purgar_eliminaciones borra los registros viejos.
+    """
+    MODELO_CHOICES = [
+        ('siembra', 'Siembra'),
+        ('zona', 'Zona'),
+        ('vivero', 'Vivero'),
+    ]
+    
+    # Días que se conservan los registros; un cursor más antiguo exige sincronización completa
+    DIAS_RETENCION = 30
+    
+    modelo = models.CharField(max_length=20, choices=MODELO_CHOICES)
+    objeto_id = models.PositiveIntegerField()
+    fecha_eliminacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Eliminación'
+        verbose_name_plural = 'Eliminaciones'
+        indexes = [
+            models.Index(fields=['fecha_eliminacion']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_modelo_display()} #{self.objeto_id} ({self.fecha_eliminacion:%d/%m/%Y})"
+
+
+@receiver([post_save, post_delete], sender=Avatar)
+def invalidar_avatares_por_nivel(sender, **kwargs):
+    """Descarta la tabla de avatares por nivel cuando cambian los avatares"""
+    cache.delete(Avatar.CLAVE_CACHE_POR_NIVEL)
+
+
+@receiver(post_delete, sender=Siembra)
+def descontar_siembra_eliminada(sender, instance, **kwargs):
+    """Resta de las estadísticas globales el aporte de una siembra eliminada"""
+    valores = getattr(instance, '_impacto_original', None) or {
+        campo: getattr(instance, campo) for campo in Siembra.CAMPOS_IMPACTO
+    }
+    siembras, oxigeno_generado, co2_absorbido = Siembra.aporte_global(valores)
+    EstadisticasGlobales.aplicar(
+        total_siembras=-siembras,
+        oxigeno_total=-oxigeno_generado,
+        co2_total=-co2_absorbido,
+    )
+
+
+@receiver(pre_delete, sender=Siembra)
+def sacar_siembra_de_zonas(sender, instance, **kwargs):
+    """Descuenta de sus zonas una siembra antes de que el borrado en cascada quite sus filas"""
+    zonas.quitar_siembra_eliminada(instance)
+
+
+@receiver(post_delete, sender=Siembra)
+@receiver(post_delete, sender=Zona)
+@receiver(post_delete, sender=Vivero)
+def quitar_marcador_eliminado(sender, instance, **kwargs):
+    """Descuenta del índice de clusters el marcador de una fila eliminada"""
+    clusters.quitar(instance)
+
+
+@receiver(post_delete, sender=Siembra)
+@receiver(post_delete, sender=Zona)
+@receiver(post_delete, sender=Vivero)
+def registrar_eliminacion(sender, instance, **kwargs):
+    """Deja la lápida de la fila eliminada para la sincronización incremental"""
+    Eliminacion.objects.create(modelo=sender._meta.model_name, objeto_id=instance.pk)
+
+
+@receiver(post_init, sender=User)
+def recordar_usuario_activo(sender, instance, **kwargs):
+    """Recuerda el estado activo cargado para detectar (des)activaciones sin releer el usuario"""
+    instance._era_activo = instance.__dict__.get('is_active')
+
+
+@receiver(post_save, sender=User)
+def contar_usuario_activo(sender, instance, created, update_fields=None, **kwargs):
+    """Actualiza el total de usuarios activos al crear o (des)activar usuarios"""
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+    antes = False if created else instance._era_activo
+    instance._era_activo = instance.is_active
+    if antes is None:
+        # Cargado con is_active diferido: reconstruir_estadisticas corrige el total
+        return
+    EstadisticasGlobales.aplicar(total_usuarios=int(instance.is_active) - int(antes))
+
+
+@receiver(post_delete, sender=User)
+def descontar_usuario_eliminado(sender, instance, **kwargs):
+    """Resta un usuario activo eliminado"""
+    if instance.is_active:
+        EstadisticasGlobales.aplicar(total_usuarios=-1)
 
 
 # Señal para crear perfil automáticamente
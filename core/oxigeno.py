@@ -0,0 +1,180 @@
+"""
+Cálculo del oxígeno generado y el CO2 absorbido por las siembras.
+Funciones puras: no consultan ni escriben en la base de datos.
+"""
+from decimal import Decimal
+
+from django.utils import timezone
+
+# Datos de oxígeno por especie (kg O2/año según edad)
+OXYGEN_RATES = {
+    'ceiba': {'joven': 12, 'maduro': 30, 'viejo': 25},
+    'guayacan': {'joven': 10, 'maduro': 25, 'viejo': 22},
+    'roble': {'joven': 15, 'maduro': 35, 'viejo': 30},
+    'saman': {'joven': 18, 'maduro': 40, 'viejo': 35},
+    'caracoli': {'joven': 11, 'maduro': 28, 'viejo': 24},
+    'pino': {'joven': 10, 'maduro': 22, 'viejo': 18},
+    'default': {'joven': 12, 'maduro': 28, 'viejo': 25}
+}
+
+# Kg de CO2 absorbidos por cada kg de O2 generado (aproximación)
+FACTOR_CO2 = Decimal('1.5')
+
+# Días de cada tramo de edad: el valor guardado se considera vigente
+# mientras el árbol no cambie de tramo
+DIAS_POR_TRAMO = 30
+
+CERO = Decimal('0.00')
+
+
+def dias_plantado(fecha_siembra, ahora=None):
+    """Días transcurridos desde la siembra"""
+    ahora = ahora or timezone.now()
+    return (ahora.date() - fecha_siembra.date()).days
+
+
+def tramo_edad(fecha_siembra, fecha):
+    """Tramo de edad (meses de 30 días) del árbol en una fecha dada"""
+    return dias_plantado(fecha_siembra, fecha) // DIAS_POR_TRAMO
+
+
+def esta_vigente(fecha_siembra, ultima_actualizacion, ahora=None):
+    """Indica si el valor calculado en ultima_actualizacion sigue en el mismo tramo de edad"""
+    if ultima_actualizacion is None:
+        return False
+    ahora = ahora or timezone.now()
+    return tramo_edad(fecha_siembra, ultima_actualizacion) == tramo_edad(fecha_siembra, ahora)
+
+
+def calcular_oxigeno_estimado(especie, fecha_siembra, ahora=None):
+    """
+    Calcula (oxígeno kg/año, CO2 kg/año) de un árbol validado según su
+    especie y edad.
+    """
+    # Calcular años desde plantación
+    years = dias_plantado(fecha_siembra, ahora) / 365.25
+
+    # Determinar etapa del árbol
+    if years < 2:
+        stage = 'joven'
+    elif years < 10:
+        stage = 'maduro'
+    else:
+        stage = 'viejo'
+
+    # Obtener tasa de oxígeno según especie
+    especie_lower = especie.lower().strip() if especie else 'default'
+    rate = OXYGEN_RATES.get(especie_lower, OXYGEN_RATES['default'])[stage]
+
+    # Más edad = más oxígeno, hasta alcanzar el máximo en 10 años
+    factor_edad = min(years / 10, 1.0)
+    oxigeno = Decimal(rate * factor_edad).quantize(Decimal('0.01'))
+    co2 = (oxigeno * FACTOR_CO2).quantize(Decimal('0.01'))
+    return oxigeno, co2
+
+
+def sumar_impacto(filas, ahora=None):
+    """
+    Suma (oxígeno, CO2) de filas (especie, fecha_siembra, oxigeno_generado,
+    co2_absorbido, ultima_actualizacion_oxigeno) de siembras validadas.
+    Usa el valor guardado si está vigente y lo recalcula en memoria si no.
+    """
+    ahora = ahora or timezone.now()
+    oxigeno_total = CERO
+    co2_total = CERO
+    for especie, fecha_siembra, oxigeno, co2, ultima in filas:
+        if not esta_vigente(fecha_siembra, ultima, ahora):
+            oxigeno, co2 = calcular_oxigeno_estimado(especie, fecha_siembra, ahora)
+        oxigeno_total += oxigeno
+        co2_total += co2
+    return oxigeno_total, co2_total
+
+
+# ========== ACTUALIZACIÓN MASIVA ==========
+
+def actualizar_rango(id_desde, id_hasta, tamano_lote=2000, solo_desactualizadas=False, ahora=None, queryset=None):
+    """
+    Recalcula el oxígeno de las siembras validadas con id en [id_desde, id_hasta)
+    por lotes, escribiendo cada lote en su propia transacción. `queryset`
+    restringe las siembras (p. ej. la selección de una acción del admin).
+    Como Siembra.save(), toca fecha_actualizacion (sincronización y ETags) e
+    invalida la caché de estadísticas de los dueños.
+    Retorna (revisadas, actualizadas).
+    """
+    from django.db import connection, transaction
+    from .estadisticas import EstadisticasUsuario
+    from .models import EstadisticasGlobales, Siembra
+
+    ahora = ahora or timezone.now()
+    opts = Siembra._meta
+
+    def columna(nombre):
+        return connection.ops.quote_name(opts.get_field(nombre).column)
+
+    sql = (
+        f'UPDATE {connection.ops.quote_name(opts.db_table)} SET '
+        f'{columna("oxigeno_generado")} = %s, {columna("co2_absorbido")} = %s, '
+        f'{columna("ultima_actualizacion_oxigeno")} = %s, {columna("fecha_actualizacion")} = %s '
+        f'WHERE {columna("id")} = %s'
+    )
+    fecha_bd = opts.get_field('ultima_actualizacion_oxigeno').get_db_prep_value(ahora, connection)
+    revisadas = actualizadas = 0
+    ultimo_id = id_desde - 1
+
+    while True:
+        filas = list(
+            (Siembra.objects.all() if queryset is None else queryset)
+            .filter(estado='validada', id__gt=ultimo_id, id__lt=id_hasta)
+            .order_by('id')
+            .values_list(
+                'id', 'usuario_id', 'especie', 'fecha_siembra', 'ultima_actualizacion_oxigeno',
+                'oxigeno_generado', 'co2_absorbido'
+            )[:tamano_lote]
+        )
+        if not filas:
+            break
+        ultimo_id = filas[-1][0]
+        revisadas += len(filas)
+
+        cambios = []
+        usuarios = set()
+        diferencia_oxigeno = diferencia_co2 = CERO
+        for pk, usuario_id, especie, fecha_siembra, ultima, oxigeno_anterior, co2_anterior in filas:
+            if solo_desactualizadas and esta_vigente(fecha_siembra, ultima, ahora):
+                continue
+            oxigeno, co2 = calcular_oxigeno_estimado(especie, fecha_siembra, ahora)
+            cambios.append((oxigeno, co2, fecha_bd, fecha_bd, pk))
+            usuarios.add(usuario_id)
+            diferencia_oxigeno += oxigeno - oxigeno_anterior
+            diferencia_co2 += co2 - co2_anterior
+
+        # Un UPDATE por fila con executemany: bulk_update arma un CASE por
+        # fila y su costo crece con el cuadrado del tamaño del lote
+        if cambios:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.executemany(sql, cambios)
+                EstadisticasGlobales.aplicar(oxigeno_total=diferencia_oxigeno, co2_total=diferencia_co2)
+            for usuario_id in usuarios:
+                EstadisticasUsuario.invalidar(usuario_id)
+            actualizadas += len(cambios)
+
+    return revisadas, actualizadas
+
+
+def actualizar_rango_en_proceso(id_desde, id_hasta, tamano_lote, solo_desactualizadas, ahora):
+    """Punto de entrada de actualizar_rango para procesos hijos"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    from django.db import connections
+
+    # Cada proceso abre su propia conexión
+    connections.close_all()
+    try:
+        return actualizar_rango(id_desde, id_hasta, tamano_lote, solo_desactualizadas, ahora)
+    finally:
+        connections.close_all()
@@ -0,0 +1,36 @@
+"""
+Señales que mantienen las cachés de estadísticas por usuario y del catálogo del mapa.
+Se importan desde CoreConfig.ready().
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalogo import CatalogoMapa
+from .estadisticas import EstadisticasUsuario
+from .models import Siembra, Verificacion, Vivero, Zona
+
+
+@receiver([post_save, post_delete], sender=Siembra)
+def invalidar_estadisticas_siembra(sender, instance, **kwargs):
+    """Una siembra creada, modificada o eliminada cambia las estadísticas de su dueño"""
+    EstadisticasUsuario.invalidar(instance.usuario_id)
+
+
+@receiver([post_save, post_delete], sender=Verificacion)
+def invalidar_estadisticas_verificacion(sender, instance, **kwargs):
+    """Una verificación cambia el estado de la siembra verificada"""
+    if Verificacion.siembra.is_cached(instance):
+        usuario_id = instance.siembra.usuario_id
+    else:
+        usuario_id = Siembra.objects.filter(pk=instance.siembra_id).values_list('usuario_id', flat=True).first()
+    if usuario_id is not None:
+        EstadisticasUsuario.invalidar(usuario_id)
+
+
+@receiver([post_save, post_delete], sender=Vivero)
+@receiver([post_save, post_delete], sender=Zona)
+def invalidar_catalogo_mapa(sender, instance, **kwargs):
+    """Un vivero o una zona cambiados publican una nueva versión del catálogo"""
+    # Tras el commit, para que ninguna petición guarde datos viejos bajo la versión nueva
+    transaction.on_commit(CatalogoMapa.invalidar)
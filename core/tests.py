@@ -1,3 +1,1005 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import agrupamiento, clusters, geo, views, zonas
+from .catalogo import CatalogoMapa
+from .models import (
+    Avatar, CeldaCluster, EstadisticasGlobales, Perfil, Siembra, SiembraZona, SubidaSiembra, Verificacion, Vivero, Zona,
+)
+from .views import EPOCA
+
+MEDIA_PRUEBAS = tempfile.mkdtemp(prefix='reforestgo-tests-')
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_PRUEBAS, ignore_errors=True)
+
+
+def imagen_png():
+    """Bytes de una imagen PNG pequeña"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 40), 'green').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def archivo_png(nombre='foto.png'):
+    """Imagen PNG como archivo subido"""
+    return SimpleUploadedFile(nombre, imagen_png(), content_type='image/png')
+
+
+def crear_siembras(usuario, puntos, estado='pendiente'):
+    """Crea siembras en [(lat, lng)] sin foto ni señales; retorna sus ids"""
+    siembras = Siembra.objects.bulk_create([
+        Siembra(usuario=usuario, foto='siembras/prueba.jpg', latitud=lat, longitud=lng,
+                estado=estado, celda=geo.celda_para(lat, lng))
+        for lat, lng in puntos
+    ])
+    return [siembra.pk for siembra in siembras]
+
+
+# ========== BÚSQUEDA POR CERCANÍA ==========
+
+class CercanasTests(TestCase):
+    """Siembra.objects.cercanas y su cursor (distancia_km, id)"""
+    LAT = 7.0
+    LNG = -73.85
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = User.objects.create_user('sembrador')
+        # Rejilla de 15 x 15 puntos cada ~220 m más dos siembras en el mismo
+        # punto del centro (empate de distancia que se resuelve por id)
+        puntos = [
+            (round(cls.LAT + i * 0.002, 6), round(cls.LNG + j * 0.002, 6))
+            for i in range(-7, 8) for j in range(-7, 8)
+        ]
+        crear_siembras(usuario, puntos + [(cls.LAT, cls.LNG)])
+
+    def ordenadas(self, radio_km):
+        """[(id, distancia)] de todas las siembras dentro del radio, calculadas sin prefiltros"""
+        filas = list(Siembra.objects.values_list('id', 'latitud', 'longitud'))
+        ids, lats, lngs = zip(*filas)
+        distancias = geo.distancias_km(self.LAT, self.LNG, lats, lngs).tolist()
+        return sorted(
+            ((siembra_id, distancia) for siembra_id, distancia in zip(ids, distancias) if distancia <= radio_km),
+            key=lambda fila: (fila[1], fila[0]),
+        )
+
+    def test_k_mas_cercanas(self):
+        esperadas = self.ordenadas(100)[:10]
+        resultado = Siembra.objects.cercanas(self.LAT, self.LNG, 100, 10)
+
+        self.assertEqual([fila[0] for fila in resultado], [fila[0] for fila in esperadas])
+        for (_, distancia), (_, esperada) in zip(resultado, esperadas):
+            self.assertAlmostEqual(distancia, esperada, places=9)
+        # Las dos siembras del centro empatan en distancia 0: primero el id menor
+        self.assertEqual(resultado[0][1], 0)
+        self.assertEqual(resultado[1][1], 0)
+        self.assertLess(resultado[0][0], resultado[1][0])
+
+    def test_respeta_el_radio(self):
+        resultado = Siembra.objects.cercanas(self.LAT, self.LNG, 0.5, 1000)
+
+        self.assertEqual([fila[0] for fila in resultado], [fila[0] for fila in self.ordenadas(0.5)])
+        self.assertTrue(all(distancia <= 0.5 for _, distancia in resultado))
+
+    def test_cursor_recorre_todas_sin_repetir(self):
+        vistas = []
+        cursor = None
+        while True:
+            pagina = Siembra.objects.cercanas(self.LAT, self.LNG, 1.5, 17, despues=cursor)
+            vistas += [fila[0] for fila in pagina]
+            if len(pagina) < 17:
+                break
+            cursor = (pagina[-1][1], pagina[-1][0])
+
+        self.assertEqual(vistas, [fila[0] for fila in self.ordenadas(1.5)])
+
+    def test_cursor_en_un_empate(self):
+        primera = Siembra.objects.cercanas(self.LAT, self.LNG, 1, 1)
+        segunda = Siembra.objects.cercanas(self.LAT, self.LNG, 1, 1, despues=(primera[0][1], primera[0][0]))
+
+        self.assertEqual(segunda[0][1], 0)
+        self.assertGreater(segunda[0][0], primera[0][0])
+
+
+# ========== PUNTOS Y NIVELES ==========
+
+class SumarPuntosTests(TestCase):
+    """Perfil.sumar_puntos: nivel, avatar y contadores en un único UPDATE"""
+
+    def setUp(self):
+        self.semilla = Avatar.objects.create(nombre='Semilla', nivel_requerido=1)
+        self.arbol = Avatar.objects.create(nombre='Árbol', nivel_requerido=3)
+        self.perfil = User.objects.create_user('sembrador').perfil
+
+    def test_sin_cambio_de_nivel(self):
+        subio = self.perfil.sumar_puntos(50)
+
+        self.assertFalse(subio)
+        self.perfil.refresh_from_db()
+        self.assertEqual((self.perfil.puntos, self.perfil.nivel), (50, 1))
+        self.assertEqual(self.perfil.avatar_actual, self.semilla)
+
+    def test_sube_de_nivel_en_el_umbral(self):
+        self.perfil.sumar_puntos(99)
+
+        self.assertTrue(self.perfil.sumar_puntos(1))
+        self.perfil.refresh_from_db()
+        self.assertEqual((self.perfil.puntos, self.perfil.nivel), (100, 2))
+        # El nivel 2 no tiene avatar: se conserva el actual
+        self.assertEqual(self.perfil.avatar_actual, self.semilla)
+
+    def test_salta_niveles_y_cambia_avatar(self):
+        self.assertTrue(self.perfil.sumar_puntos(300))
+
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.nivel, 3)
+        self.assertEqual(self.perfil.avatar_actual, self.arbol)
+
+    def test_no_cambia_avatar_sin_subir_de_nivel(self):
+        self.perfil.sumar_puntos(300)
+        Perfil.objects.filter(pk=self.perfil.pk).update(avatar_actual=self.semilla)
+
+        self.assertFalse(self.perfil.sumar_puntos(10))
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.avatar_actual, self.semilla)
+
+    def test_puntos_concurrentes_no_se_pierden(self):
+        # Otra instancia del mismo perfil con los puntos desactualizados
+        otra = Perfil.objects.get(pk=self.perfil.pk)
+        self.perfil.sumar_puntos(60)
+        otra.sumar_puntos(60)
+
+        self.perfil.refresh_from_db()
+        self.assertEqual((self.perfil.puntos, self.perfil.nivel), (120, 2))
+
+    def test_contadores_en_la_misma_escritura(self):
+        Avatar.por_nivel()  # Tabla de avatares ya en caché
+        with CaptureQueriesContext(connection) as consultas:
+            self.perfil.sumar_puntos(5, verificaciones_realizadas=1)
+
+        escrituras = [c['sql'] for c in consultas.captured_queries if c['sql'].startswith('UPDATE')]
+        self.assertEqual(len(escrituras), 1)
+        self.assertEqual(self.perfil.verificaciones_realizadas, 1)
+        self.assertEqual(self.perfil.puntos, 5)
+
+    def test_nivel_previo_con_un_incremento_intercalado(self):
+        self.perfil.sumar_puntos(90)
+        recargar = Perfil.refresh_from_db
+
+        def recargar_tras_otra_aprobacion(perfil, *args, **kwargs):
+            # Otra aprobación suma puntos entre el UPDATE y la recarga
+            Perfil.objects.filter(pk=perfil.pk).update(puntos=F('puntos') + 50)
+            recargar(perfil, *args, **kwargs)
+
+        with mock.patch.object(Perfil, 'refresh_from_db', recargar_tras_otra_aprobacion):
+            subio = self.perfil.sumar_puntos(20)
+
+        # 90 -> 110 cruza el umbral del nivel 2 aunque la recarga lea 160 puntos
+        self.assertTrue(subio)
+        self.assertEqual(self.perfil.puntos, 160)
+
+    def test_avatar_eliminado_en_otro_proceso(self):
+        tabla_vieja = Avatar.por_nivel()
+        self.arbol.delete()
+        # La caché de otro proceso conserva el id del avatar eliminado
+        cache.set(Avatar.CLAVE_CACHE_POR_NIVEL, tabla_vieja)
+
+        self.assertTrue(self.perfil.sumar_puntos(300))
+
+        self.perfil.refresh_from_db()
+        self.assertEqual(self.perfil.nivel, 3)
+        self.assertEqual(self.perfil.avatar_actual, self.semilla)
+
+
+# ========== SUBIDAS POR FRAGMENTOS ==========
+
+@override_settings(MEDIA_ROOT=MEDIA_PRUEBAS)
+class SubidaSiembraTests(TestCase):
+    """SubidaSiembra.agregar_fragmento y claves de idempotencia"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('sembrador', password='clave')
+        self.datos = imagen_png()
+
+    def nueva_subida(self, clave='subida-0001', **campos):
+        campos.setdefault('tamano', len(self.datos))
+        return SubidaSiembra.objects.create(
+            usuario=self.usuario, clave=clave, nombre_archivo='arbol.png',
+            latitud=7, longitud=-73.85, especie='Ceiba', **campos
+        )
+
+    def test_completa_y_crea_la_siembra(self):
+        subida = self.nueva_subida()
+        mitad = len(self.datos) // 2
+
+        self.assertTrue(subida.agregar_fragmento(0, self.datos[:mitad]))
+        self.assertEqual((subida.estado, subida.recibidos), ('en_curso', mitad))
+        self.assertTrue(os.path.exists(subida.ruta_parcial()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(subida.agregar_fragmento(mitad, self.datos[mitad:]))
+
+        subida.refresh_from_db()
+        self.assertEqual((subida.estado, subida.recibidos), ('completada', len(self.datos)))
+        self.assertEqual(subida.siembra.usuario, self.usuario)
+        self.assertEqual(subida.siembra.especie, 'Ceiba')
+        self.assertEqual(subida.siembra.estado, 'pendiente')
+        self.assertFalse(os.path.exists(subida.ruta_parcial()))
+        with subida.siembra.foto.open('rb') as foto:
+            self.assertEqual(foto.read(), self.datos)
+
+    def test_fragmento_repetido_o_fuera_de_orden(self):
+        subida = self.nueva_subida()
+        self.assertTrue(subida.agregar_fragmento(0, self.datos[:10]))
+
+        # Reintento del mismo fragmento, hueco y exceso del tamaño declarado
+        self.assertFalse(subida.agregar_fragmento(0, self.datos[:10]))
+        self.assertFalse(subida.agregar_fragmento(20, self.datos[20:30]))
+        self.assertFalse(subida.agregar_fragmento(10, self.datos[10:] + b'extra'))
+
+        subida.refresh_from_db()
+        self.assertEqual(subida.recibidos, 10)
+        self.assertEqual(os.path.getsize(subida.ruta_parcial()), 10)
+        subida.borrar_parcial()
+
+    def test_no_acepta_fragmentos_despues_de_completar(self):
+        subida = self.nueva_subida()
+        with self.captureOnCommitCallbacks(execute=True):
+            subida.agregar_fragmento(0, self.datos)
+
+        self.assertFalse(subida.agregar_fragmento(0, self.datos))
+        self.assertEqual(Siembra.objects.count(), 1)
+
+    def test_archivo_que_no_es_imagen(self):
+        subida = self.nueva_subida(tamano=12)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(subida.agregar_fragmento(0, b'no es imagen'))
+
+        subida.refresh_from_db()
+        self.assertEqual(subida.estado, 'fallida')
+        self.assertIsNone(subida.siembra)
+        self.assertFalse(os.path.exists(subida.ruta_parcial()))
+
+    def test_clave_repetida(self):
+        self.nueva_subida()
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.nueva_subida()
+        # La misma clave de otro usuario es otra subida
+        otro = User.objects.create_user('otro')
+        SubidaSiembra.objects.create(
+            usuario=otro, clave='subida-0001', nombre_archivo='a.png', tamano=1, latitud=7, longitud=-73
+        )
+
+    def test_api_reanuda_la_subida_con_la_misma_clave(self):
+        self.client.login(username='sembrador', password='clave')
+        datos = {'clave': 'subida-0002', 'tamano': len(self.datos), 'latitud': 7, 'longitud': -73.85}
+
+        creada = self.client.post('/api/subidas/', datos)
+        repetida = self.client.post('/api/subidas/', datos)
+        otro_archivo = self.client.post('/api/subidas/', dict(datos, tamano=5))
+
+        self.assertEqual(creada.status_code, 201)
+        self.assertEqual(repetida.status_code, 200)
+        self.assertEqual(repetida.json()['id'], creada.json()['id'])
+        self.assertEqual(otro_archivo.status_code, 409)
+        self.assertEqual(SubidaSiembra.objects.count(), 1)
+
+
+    def fotos_en_disco(self):
+        carpeta = os.path.join(MEDIA_PRUEBAS, 'siembras')
+        return sorted(
+            os.path.join(raiz, nombre) for raiz, _, nombres in os.walk(carpeta) for nombre in nombres
+        )
+
+    def registrar(self, clave):
+        return self.client.post('/registrar-siembra/', {
+            'clave': clave, 'foto': archivo_png('arbol.png'), 'latitud': '7.0', 'longitud': '-73.85',
+        })
+
+    def test_formulario_reenviado_no_duplica_la_foto(self):
+        self.client.login(username='sembrador', password='clave')
+        antes = self.fotos_en_disco()
+
+        self.assertEqual(self.registrar('formulario-1').status_code, 302)
+        self.assertEqual(self.registrar('formulario-1').status_code, 302)
+
+        self.assertEqual(Siembra.objects.count(), 1)
+        self.assertEqual(len(self.fotos_en_disco()), len(antes) + 1)
+        self.assertEqual(SubidaSiembra.objects.get(clave='formulario-1').estado, 'completada')
+
+    def test_error_tras_escribir_la_foto_no_deja_archivo(self):
+        self.client.login(username='sembrador', password='clave')
+        antes = self.fotos_en_disco()
+
+        guardar = SubidaSiembra.save
+
+        def fallar_al_completar(subida, *args, **kwargs):
+            # La reserva de la clave se guarda; falla al marcarla completada, con la foto ya escrita
+            if subida.pk:
+                raise RuntimeError('sin conexión')
+            guardar(subida, *args, **kwargs)
+
+        with mock.patch.object(SubidaSiembra, 'save', fallar_al_completar):
+            respuesta = self.registrar('formulario-2')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(Siembra.objects.exists())
+        self.assertEqual(self.fotos_en_disco(), antes)
+        # La clave queda libre para reintentar el mismo formulario
+        self.assertFalse(SubidaSiembra.objects.filter(clave='formulario-2').exists())
+        self.assertEqual(self.registrar('formulario-2').status_code, 302)
+        self.assertEqual(Siembra.objects.count(), 1)
+
+
+# ========== PERTENENCIA A ZONAS ==========
+
+class ZonasTests(TestCase):
+    """zonas.agregar_siembras y quitar_siembras mantienen total_siembras"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('sembrador')
+        datos = {'tipo_terreno': 'urbano', 'descripcion': 'd', 'recomendaciones': 'r'}
+        cls.centro = Zona.objects.create(nombre='Centro', latitud=7.0, longitud=-73.0, radio_km=1, **datos)
+        cls.amplia = Zona.objects.create(nombre='Amplia', latitud=7.005, longitud=-73.0, radio_km=2, **datos)
+        cls.lejana = Zona.objects.create(nombre='Lejana', latitud=8.0, longitud=-73.0, radio_km=1, **datos)
+
+    def quitar(self, ids):
+        """Saca las siembras de las validadas (sin señales) y de sus zonas"""
+        Siembra.objects.filter(pk__in=ids).update(estado='pendiente')
+        zonas.quitar_siembras(ids)
+
+    def filas(self, ids):
+        return list(Siembra.objects.filter(pk__in=ids).order_by('id').values_list('id', 'latitud', 'longitud'))
+
+    def assertConsistente(self):
+        for zona in Zona.objects.all():
+            total = zona.total_siembras
+            self.assertEqual(total, SiembraZona.objects.filter(zona=zona).count(), zona.nombre)
+            self.assertEqual(zonas.recalcular(zona), total, zona.nombre)
+
+    def totales(self):
+        return list(Zona.objects.order_by('id').values_list('total_siembras', flat=True))
+
+    def test_agregar_y_quitar(self):
+        # Cuatro en ambas zonas, una solo en la amplia (~1.7 km del centro) y una fuera de todas
+        ids = crear_siembras(
+            self.usuario,
+            [(7.0 + i * 0.001, -73.0) for i in range(4)] + [(7.015, -73.0), (7.5, -73.0)],
+            estado='validada',
+        )
+        self.assertEqual(self.totales(), [0, 0, 0])
+
+        zonas.agregar_siembras(self.filas(ids))
+        self.assertEqual(self.totales(), [4, 5, 0])
+        self.assertConsistente()
+
+        self.quitar([ids[0], ids[4], ids[5]])
+        self.assertEqual(self.totales(), [3, 3, 0])
+        self.assertConsistente()
+
+        # Quitar siembras que no están en ninguna zona no cambia los contadores
+        self.quitar([ids[0], ids[5]])
+        self.assertEqual(self.totales(), [3, 3, 0])
+
+        self.quitar(ids)
+        self.assertEqual(self.totales(), [0, 0, 0])
+        self.assertFalse(SiembraZona.objects.exists())
+
+    def test_lotes_con_distintas_cantidades_por_zona(self):
+        ids = crear_siembras(
+            self.usuario,
+            [(7.0 + i * 0.0005, -73.0) for i in range(7)] + [(8.0 + i * 0.0005, -73.0) for i in range(3)],
+            estado='validada',
+        )
+
+        zonas.agregar_siembras(self.filas(ids[:5]))
+        zonas.agregar_siembras(self.filas(ids[5:]))
+
+        self.assertEqual(self.totales(), [7, 7, 3])
+        self.assertConsistente()
+
+    def test_sin_zonas_cercanas(self):
+        ids = crear_siembras(self.usuario, [(-30.0, 20.0)], estado='validada')
+
+        zonas.agregar_siembras(self.filas(ids))
+
+        self.assertEqual(self.totales(), [0, 0, 0])
+        self.assertFalse(SiembraZona.objects.exists())
+
+
+# ========== SINCRONIZACIÓN ==========
+
+def cursor_actual():
+    """Cursor de api_sync para el instante actual (sin el margen de la respuesta)"""
+    return str((timezone.now() - EPOCA) // timedelta(microseconds=1))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_PRUEBAS)
+class SincronizacionTests(TestCase):
+    """api_sync: cambios, salidas y eliminaciones desde el cursor"""
+
+    def setUp(self):
+        self.verificador = User.objects.create_user('verificador', password='clave', is_staff=True)
+        self.sembrador = User.objects.create_user('sembrador')
+        self.pendiente, self.otra = crear_siembras(self.sembrador, [(7.0, -73.85), (7.001, -73.85)])
+        self.client.login(username='verificador', password='clave')
+
+    def sincronizar(self, cursor):
+        respuesta = self.client.get('/api/sync/', {'since': cursor})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_completa_sin_cursor(self):
+        propia, = crear_siembras(self.verificador, [(7.0, -73.0)])
+        datos = self.client.get('/api/sync/').json()
+
+        self.assertTrue(datos['completa'])
+        self.assertEqual([fila['id'] for fila in datos['siembras']['actualizados']], [self.pendiente, self.otra])
+        self.assertNotIn(propia, [fila['id'] for fila in datos['siembras']['actualizados']])
+
+    def test_salida_por_verificacion(self):
+        cursor = cursor_actual()
+
+        respuesta = self.client.post(f'/verificacion/arbol/{self.pendiente}/', {
+            'foto_verificacion': archivo_png(), 'latitud': '7.0', 'longitud': '-73.85',
+        })
+
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(Siembra.objects.get(pk=self.pendiente).estado, 'en_verificacion')
+        datos = self.sincronizar(cursor)
+        self.assertEqual(datos['siembras'], {'actualizados': [], 'eliminados': [self.pendiente]})
+
+    def test_salidas_por_validacion_y_eliminacion(self):
+        cursor = cursor_actual()
+        Siembra.objects.get(pk=self.pendiente).validar(self.verificador)
+        Siembra.objects.get(pk=self.otra).delete()
+        nueva, = crear_siembras(self.sembrador, [(7.002, -73.85)])
+
+        datos = self.sincronizar(cursor)
+
+        self.assertEqual(datos['siembras']['eliminados'], [self.pendiente, self.otra])
+        self.assertEqual([fila['id'] for fila in datos['siembras']['actualizados']], [nueva])
+
+    def test_siembras_propias_no_se_reportan(self):
+        propia, = crear_siembras(self.verificador, [(7.0, -73.0)])
+        cursor = cursor_actual()
+        Siembra.objects.filter(pk=propia).update(estado='rechazada', fecha_actualizacion=timezone.now())
+
+        self.assertEqual(self.sincronizar(cursor)['siembras'], {'actualizados': [], 'eliminados': []})
+
+    def test_viveros_y_zonas(self):
+        vivero = Vivero.objects.create(
+            nombre='Vivero', direccion='d', latitud=7, longitud=-73, especies_disponibles='Ceiba'
+        )
+        zona = Zona.objects.create(
+            nombre='Zona', latitud=7, longitud=-73, tipo_terreno='urbano', descripcion='d', recomendaciones='r'
+        )
+        cursor = cursor_actual()
+        vivero.nombre = 'Vivero municipal'
+        vivero.save()
+        zona.activa = False
+        zona.save()
+
+        datos = self.sincronizar(cursor)
+
+        self.assertEqual([fila['id'] for fila in datos['viveros']['actualizados']], [vivero.pk])
+        self.assertEqual(datos['viveros']['eliminados'], [])
+        self.assertEqual(datos['zonas'], {'actualizados': [], 'eliminados': [zona.pk]})
+
+        cursor = cursor_actual()
+        vivero_id = vivero.pk
+        vivero.delete()
+        self.assertEqual(self.sincronizar(cursor)['viveros'], {'actualizados': [], 'eliminados': [vivero_id]})
+
+    def test_cursor_invalido_o_vencido(self):
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'x'}).status_code, 400)
+        self.assertTrue(self.sincronizar('1')['completa'])
+
+
+# ========== ZONAS AUTOMÁTICAS ==========
+
+class GenerarZonasTests(TestCase):
+    """Comando generar_zonas_automaticas y agrupamiento por densidad"""
+
+    def generar(self, *argumentos):
+        call_command('generar_zonas_automaticas', *argumentos, stdout=io.StringIO())
+
+    def test_parametros_invalidos(self):
+        for argumentos in (['--radio', '0'], ['--radio', '-1'], ['--minimo', '0']):
+            with self.subTest(argumentos=argumentos), self.assertRaises(CommandError):
+                self.generar(*argumentos)
+        with self.assertRaises(ValueError):
+            agrupamiento.agrupar_por_radio([7.0], [-73.0], 0, 1)
+
+    def test_la_zona_cubre_todo_el_grupo(self):
+        # Una hilera de 12 árboles cada ~220 m: un solo grupo de ~2.4 km
+        usuario = User.objects.create_user('sembrador')
+        crear_siembras(usuario, [(7.0 + i * 0.002, -73.0) for i in range(12)], estado='validada')
+
+        self.generar('--radio', '0.5', '--minimo', '3')
+
+        zona = Zona.objects.get(auto_generada=True)
+        lats, lngs = zip(*Siembra.objects.values_list('latitud', 'longitud'))
+        alcance = geo.distancias_km(zona.latitud, zona.longitud, lats, lngs).max()
+        self.assertGreater(zona.radio_km, 0.5)
+        self.assertGreaterEqual(float(zona.radio_km), alcance)
+        self.assertEqual(zona.total_siembras, 12)
+
+
+# ========== ESTADÍSTICAS GLOBALES ==========
+
+class EstadisticasGlobalesTests(TestCase):
+    """Contadores globales incrementales y su recálculo"""
+
+    def total_usuarios(self):
+        return EstadisticasGlobales.obtener().total_usuarios
+
+    def test_desactivar_usuario_no_relee_la_fila(self):
+        User.objects.create_user('sembrador')
+        usuario = User.objects.get(username='sembrador')
+        self.assertEqual(self.total_usuarios(), 1)
+
+        usuario.is_active = False
+        with CaptureQueriesContext(connection) as consultas:
+            usuario.save()
+        lecturas = [q['sql'] for q in consultas.captured_queries
+                    if q['sql'].startswith('SELECT') and 'auth_user' in q['sql']]
+        self.assertEqual(lecturas, [])
+        self.assertEqual(self.total_usuarios(), 0)
+
+        usuario.is_active = True
+        usuario.save()
+        usuario.save()
+        self.assertEqual(self.total_usuarios(), 1)
+
+    def test_guardar_otros_campos_no_cambia_el_total(self):
+        usuario = User.objects.create_user('sembrador')
+        usuario.is_active = False
+        usuario.save(update_fields=['email'])
+        self.assertEqual(self.total_usuarios(), 1)
+
+    def test_reconstruir_crea_y_bloquea_la_fila(self):
+        User.objects.create_user('sembrador')
+        EstadisticasGlobales.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as consultas:
+            estadisticas = EstadisticasGlobales.reconstruir()
+        self.assertEqual(estadisticas.total_usuarios, 1)
+        self.assertEqual(EstadisticasGlobales.objects.get().total_usuarios, 1)
+        if connection.features.has_select_for_update:
+            self.assertTrue(any('FOR UPDATE' in q['sql'] for q in consultas.captured_queries))
+
+
+# ========== ÍNDICE DE CLUSTERS ==========
+
+class ClustersTests(TestCase):
+    """El índice mantenido al guardar coincide con clusters.reconstruir"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.sembrador = User.objects.create_user('sembrador')
+
+    def indice(self, capa):
+        return {
+            (zoom, x, y): (cantidad, round(suma_lat, 6), round(suma_lng, 6))
+            for zoom, x, y, cantidad, suma_lat, suma_lng in CeldaCluster.objects.filter(capa=capa)
+            .values_list('zoom', 'x', 'y', 'cantidad', 'suma_lat', 'suma_lng')
+        }
+
+    def assertIgualAReconstruir(self, capa):
+        incremental = self.indice(capa)
+        clusters.reconstruir(capa)
+        self.assertEqual(incremental, self.indice(capa), capa)
+
+    def test_viveros_creados_movidos_y_eliminados(self):
+        datos = {'direccion': 'd', 'especies_disponibles': 'Ceiba'}
+        viveros = [
+            Vivero.objects.create(nombre=f'Vivero {i}', latitud=7 + i * 0.01, longitud=-73, **datos)
+            for i in range(3)
+        ]
+        viveros[0].latitud = 7.5
+        viveros[0].save()
+        viveros[1].nombre = 'Vivero municipal'
+        viveros[1].save(update_fields=['nombre'])
+        viveros[2].delete()
+
+        self.assertEqual(CeldaCluster.objects.filter(capa='vivero', zoom=0).get().cantidad, 2)
+        self.assertIgualAReconstruir('vivero')
+
+    def test_zonas_activadas_y_desactivadas(self):
+        datos = {'tipo_terreno': 'urbano', 'descripcion': 'd', 'recomendaciones': 'r'}
+        activa = Zona.objects.create(nombre='Activa', latitud=7, longitud=-73, **datos)
+        inactiva = Zona.objects.create(nombre='Inactiva', latitud=7.2, longitud=-73.1, **datos)
+        inactiva.activa = False
+        inactiva.save()
+        activa.longitud = -73.4
+        activa.save()
+
+        self.assertEqual(CeldaCluster.objects.filter(capa='zona', zoom=0).get().cantidad, 1)
+        self.assertIgualAReconstruir('zona')
+
+    def test_siembras_pendientes_que_salen_al_validar(self):
+        ids = crear_siembras(self.sembrador, [(7 + i * 0.003, -73 - i * 0.002) for i in range(6)])
+        clusters.reconstruir('pendiente')
+
+        Siembra.objects.get(pk=ids[0]).validar(self.admin)
+        Siembra.objects.filter(pk__in=ids[1:3]).validar(self.admin)
+        Siembra.objects.filter(pk=ids[3]).cambiar_estado('rechazada')
+
+        self.assertEqual(CeldaCluster.objects.filter(capa='pendiente', zoom=0).get().cantidad, 2)
+        self.assertIgualAReconstruir('pendiente')
+
+    def test_lote_grande_por_filas(self):
+        # Puntos dispersos: más celdas que TAMANO_LOTE_CELDAS, la ruta de aplicar_por_filas
+        lats = [-40 + i * 9.5 for i in range(9)]
+        lngs = [-120 + i * 27.3 for i in range(9)]
+        self.assertGreater(len(clusters.acumular(lats, lngs)), clusters.TAMANO_LOTE_CELDAS)
+
+        clusters.aplicar('pendiente', lats, lngs, 1)
+        clusters.aplicar('pendiente', lats[:4], lngs[:4], -1)
+
+        esperado = {
+            celda: (cantidad, round(suma_lat, 6), round(suma_lng, 6))
+            for celda, (cantidad, suma_lat, suma_lng) in clusters.acumular(lats[4:], lngs[4:]).items()
+        }
+        self.assertEqual(self.indice('pendiente'), esperado)
+
+
+# ========== CATÁLOGO DEL MAPA ==========
+
+class CatalogoMapaTests(TestCase):
+    """Caché del catálogo de viveros y zonas con versión incrementada por señales"""
+
+    def setUp(self):
+        cache.clear()
+        self.vivero = Vivero.objects.create(
+            nombre='Vivero', direccion='d', latitud=7, longitud=-73, especies_disponibles='Ceiba'
+        )
+
+    def assertNuevaVersion(self, cambio):
+        version = CatalogoMapa.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            cambio()
+        self.assertGreater(CatalogoMapa.version(), version)
+
+    def nombres(self):
+        return [vivero['nombre'] for vivero in json.loads(CatalogoMapa.obtener('viveros'))['viveros']]
+
+    def test_se_sirve_desde_la_cache(self):
+        self.assertEqual(self.nombres(), ['Vivero'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.nombres(), ['Vivero'])
+
+    def test_cambiar_un_vivero_incrementa_la_version_tras_el_commit(self):
+        self.nombres()
+        version = CatalogoMapa.version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vivero.nombre = 'Vivero municipal'
+            self.vivero.save()
+            # Antes del commit se sigue leyendo la versión anterior
+            self.assertEqual(CatalogoMapa.version(), version)
+
+        self.assertGreater(CatalogoMapa.version(), version)
+        self.assertEqual(self.nombres(), ['Vivero municipal'])
+
+    def test_eliminar_y_desactivar_incrementan_la_version(self):
+        zona = Zona.objects.create(
+            nombre='Zona', latitud=7, longitud=-73, tipo_terreno='urbano', descripcion='d', recomendaciones='r'
+        )
+        zona.activa = False
+        self.assertNuevaVersion(zona.save)
+        self.assertNuevaVersion(self.vivero.delete)
+        self.assertEqual(json.loads(CatalogoMapa.obtener('todos')), {'viveros': [], 'zonas': []})
+
+    def test_version_perdida(self):
+        version = CatalogoMapa.version()
+        cache.delete(CatalogoMapa.CLAVE_VERSION)
+        CatalogoMapa.invalidar()
+        self.assertGreater(CatalogoMapa.version(), version)
+
+
+# ========== RESPUESTAS CONDICIONALES ==========
+
+class RespuestasCondicionalesTests(TestCase):
+    """ETag y 304 de las APIs consultadas periódicamente"""
+
+    def setUp(self):
+        cache.clear()
+        self.verificador = User.objects.create_user('verificador', password='clave')
+        self.sembrador = User.objects.create_user('sembrador', password='clave')
+        crear_siembras(self.sembrador, [(7.0, -73.0)])
+        Vivero.objects.create(nombre='Vivero', direccion='d', latitud=7, longitud=-73, especies_disponibles='Ceiba')
+
+    def assertNoModificado(self, url, datos=None):
+        """La respuesta lleva ETag y repetirla con If-None-Match responde 304 sin cuerpo"""
+        respuesta = self.client.get(url, datos)
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta['ETag']
+        repetida = self.client.get(url, datos, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida.content, b'')
+        return etag
+
+    def test_catalogo(self):
+        etag = self.assertNoModificado('/api/coordenadas/', {'tipo': 'viveros'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Vivero.objects.create(
+                nombre='Otro', direccion='d', latitud=7.1, longitud=-73, especies_disponibles='Ceiba'
+            )
+
+        respuesta = self.client.get('/api/coordenadas/', {'tipo': 'viveros'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(len(respuesta.json()['viveros']), 2)
+
+    def test_etag_del_cuerpo_enviado(self):
+        # El ETag es la huella del JSON en caché, aunque la base de datos ya haya cambiado
+        respuesta = self.client.get('/api/coordenadas/')
+        Vivero.objects.update(nombre='Cambiado sin señales')
+        repetida = self.client.get('/api/coordenadas/')
+        self.assertEqual((repetida['ETag'], repetida.content), (respuesta['ETag'], respuesta.content))
+
+    def test_siembras_cercanas(self):
+        self.client.login(username='verificador', password='clave')
+        datos = {'lat': 7.0, 'lng': -73.0}
+        etag = self.assertNoModificado('/api/siembras-cercanas/', datos)
+
+        crear_siembras(self.sembrador, [(7.001, -73.0)])
+        respuesta = self.client.get('/api/siembras-cercanas/', datos, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+
+        # Cada usuario tiene su propio ETag: sus siembras se excluyen de la búsqueda
+        self.client.login(username='sembrador', password='clave')
+        self.assertNotEqual(self.client.get('/api/siembras-cercanas/', datos)['ETag'], respuesta['ETag'])
+
+    def test_estadisticas_usuario(self):
+        self.client.login(username='sembrador', password='clave')
+        etag = self.assertNoModificado('/api/estadisticas/')
+
+        Perfil.objects.filter(user=self.sembrador).update(puntos=F('puntos') + 10)
+        respuesta = self.client.get('/api/estadisticas/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+
+# ========== VALIDACIÓN DE SIEMBRAS ==========
+
+class ValidarSiembraTests(TestCase):
+    """Siembra.validar: una transacción con la siembra, los puntos y las estadísticas"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.sembrador = User.objects.create_user('sembrador')
+        siembra_id, = crear_siembras(self.sembrador, [(7.0, -73.0)])
+        # Un árbol de dos años ya genera oxígeno
+        Siembra.objects.filter(pk=siembra_id).update(fecha_siembra=timezone.now() - timedelta(days=730))
+        self.siembra = Siembra.objects.get(pk=siembra_id)
+        EstadisticasGlobales.reconstruir()
+
+    def estado(self):
+        perfil = Perfil.objects.get(user=self.sembrador)
+        estadisticas = EstadisticasGlobales.obtener()
+        return (
+            Siembra.objects.get(pk=self.siembra.pk).estado, perfil.puntos,
+            estadisticas.total_siembras, estadisticas.oxigeno_total,
+        )
+
+    def test_valida_con_una_escritura_de_la_siembra(self):
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            self.siembra.validar(self.admin)
+
+        escrituras = [q['sql'] for q in consultas.captured_queries
+                      if q['sql'].startswith('UPDATE') and '"core_siembra"' in q['sql']]
+        self.assertEqual(len(escrituras), 1)
+        siembra = Siembra.objects.get(pk=self.siembra.pk)
+        self.assertEqual((siembra.estado, siembra.validada_por), ('validada', self.admin))
+        self.assertGreater(siembra.oxigeno_generado, 0)
+        self.assertEqual(self.estado()[:3], ('validada', 20, 1))
+        self.assertEqual(self.estado()[3], siembra.oxigeno_generado)
+
+    def test_validar_dos_veces_no_suma_dos_veces(self):
+        self.siembra.validar(self.admin)
+        self.assertFalse(Siembra.objects.get(pk=self.siembra.pk).validar(self.admin))
+        self.assertEqual(self.estado()[:3], ('validada', 20, 1))
+
+    def test_un_error_deshace_la_validacion(self):
+        antes = self.estado()
+
+        with mock.patch.object(Perfil, 'sumar_puntos', side_effect=RuntimeError), \
+                mock.patch.object(Siembra, 'verificar_crear_zona_automatica') as revisar_zona:
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+                self.siembra.validar(self.admin)
+
+        self.assertEqual(self.estado(), antes)
+        revisar_zona.assert_not_called()
+
+    def test_la_zona_automatica_falla_despues_del_commit(self):
+        def fallar(siembra):
+            raise RuntimeError
+
+        with mock.patch.object(Siembra, 'verificar_crear_zona_automatica', fallar):
+            with self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                self.siembra.validar(self.admin)
+
+        self.assertEqual(self.estado()[:3], ('validada', 20, 1))
+
+
+# ========== ACCIONES POR LOTES DEL ADMIN ==========
+
+class AccionesAdminTests(TestCase):
+    """Acciones por lotes de siembras y verificaciones y los puntos que otorgan"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='clave')
+        self.ana = User.objects.create_user('ana')
+        self.beto = User.objects.create_user('beto')
+        self.personal = User.objects.create_user('personal', is_staff=True)
+        self.client.login(username='admin', password='clave')
+
+    def accion(self, modelo, accion, ids):
+        respuesta = self.client.post(f'/admin/core/{modelo}/', {'action': accion, '_selected_action': ids})
+        self.assertEqual(respuesta.status_code, 302)
+
+    def puntos(self, usuario):
+        return Perfil.objects.get(user=usuario).puntos
+
+    def estados(self, ids):
+        return list(Siembra.objects.filter(pk__in=ids).order_by('id').values_list('estado', flat=True))
+
+    def test_validar_siembras(self):
+        ya_validada, = crear_siembras(self.ana, [(7.0, -73.0)], estado='validada')
+        ids = (
+            crear_siembras(self.ana, [(7.001, -73.0), (7.002, -73.0)])
+            + crear_siembras(self.beto, [(7.003, -73.0)])
+            + crear_siembras(self.personal, [(7.004, -73.0)])
+        )
+        EstadisticasGlobales.reconstruir()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.accion('siembra', 'validar_siembras', ids + [ya_validada])
+
+        self.assertEqual(self.estados(ids), ['validada'] * 4)
+        # 20 puntos por siembra; la ya validada no suma y el personal no recibe puntos
+        self.assertEqual([self.puntos(u) for u in (self.ana, self.beto, self.personal)], [40, 20, 0])
+        self.assertEqual(EstadisticasGlobales.obtener().total_siembras, 5)
+
+    def test_rechazar_siembras(self):
+        ids = crear_siembras(self.ana, [(7.0, -73.0), (7.001, -73.0)])
+        validada, = crear_siembras(self.ana, [(7.002, -73.0)], estado='validada')
+
+        self.accion('siembra', 'rechazar_siembras', ids + [validada])
+
+        self.assertEqual(self.estados(ids + [validada]), ['rechazada', 'rechazada', 'validada'])
+        self.assertEqual(self.puntos(self.ana), 0)
+
+    def crear_verificaciones(self, verificador, datos):
+        """Verificaciones pendientes (sin señales) de siembras nuevas: [(distancia_metros, con_foto_ubicacion)]"""
+        siembras = crear_siembras(self.ana, [(7.0 + i * 0.001, -73.0) for i in range(len(datos))])
+        verificaciones = Verificacion.objects.bulk_create([
+            Verificacion(
+                siembra_id=siembra_id, verificador=verificador, foto_verificacion='verificaciones/prueba.jpg',
+                foto_ubicacion='verificaciones/ubicacion.jpg' if con_foto else '',
+                latitud_verificacion=7, longitud_verificacion=-73,
+                distancia_metros=distancia, precision=Verificacion.precision_para(distancia),
+            )
+            for siembra_id, (distancia, con_foto) in zip(siembras, datos)
+        ])
+        return [verificacion.pk for verificacion in verificaciones], siembras
+
+    def test_aprobar_verificaciones(self):
+        ids_ana, siembras = self.crear_verificaciones(self.beto, [(5, True), (5, False), (35, True)])
+        ids_personal, _ = self.crear_verificaciones(self.personal, [(80, False)])
+        esperado = sum(v.calcular_puntos() for v in Verificacion.objects.filter(pk__in=ids_ana))
+        self.assertEqual(esperado, 100 + 80 + 70)
+
+        self.accion('verificacion', 'aprobar_verificaciones', ids_ana + ids_personal)
+        # Repetir la acción no vuelve a sumar
+        self.accion('verificacion', 'aprobar_verificaciones', ids_ana)
+
+        perfil = Perfil.objects.get(user=self.beto)
+        self.assertEqual(
+            (perfil.puntos, perfil.puntos_verificacion, perfil.verificaciones_realizadas, perfil.verificaciones_aprobadas),
+            (esperado, esperado, 3, 3),
+        )
+        self.assertEqual(Perfil.objects.get(user=self.personal).puntos, 50)
+        self.assertEqual(self.estados(siembras), ['en_verificacion'] * 3)
+        self.assertEqual(
+            list(Verificacion.objects.filter(pk__in=ids_ana).order_by('id').values_list('puntos_otorgados', flat=True)),
+            [100, 80, 70],
+        )
+
+    def test_rechazar_verificaciones(self):
+        ids, siembras = self.crear_verificaciones(self.beto, [(5, True), (90, False)])
+        Siembra.objects.filter(pk__in=siembras).update(estado='en_verificacion')
+
+        self.accion('verificacion', 'rechazar_verificaciones', ids)
+
+        perfil = Perfil.objects.get(user=self.beto)
+        self.assertEqual((perfil.puntos, perfil.verificaciones_realizadas, perfil.verificaciones_aprobadas), (0, 2, 0))
+        self.assertEqual(self.estados(siembras), ['pendiente'] * 2)
+        self.assertEqual(set(Verificacion.objects.filter(pk__in=ids).values_list('estado', flat=True)), {'rechazada'})
+
+
+# ========== PRECISIÓN DE VERIFICACIONES ==========
+
+@override_settings(MEDIA_ROOT=MEDIA_PRUEBAS)
+class PrecisionVerificacionTests(TestCase):
+    """distancia_metros y precision se guardan con la verificación"""
+
+    def setUp(self):
+        self.verificador = User.objects.create_user('verificador')
+        self.sembrador = User.objects.create_user('sembrador')
+        self.siembra_id, = crear_siembras(self.sembrador, [(7.0, -73.0)])
+
+    def verificar(self, latitud, **campos):
+        return Verificacion.objects.create(
+            siembra_id=self.siembra_id, verificador=self.verificador, foto_verificacion=archivo_png(),
+            latitud_verificacion=latitud, longitud_verificacion=-73.0, **campos
+        )
+
+    def test_precision_para(self):
+        casos = [(0, 'excelente'), (19.99, 'excelente'), (20, 'buena'), (49.99, 'buena'), (50, 'revisar')]
+        for distancia, precision in casos:
+            with self.subTest(distancia=distancia):
+                self.assertEqual(Verificacion.precision_para(distancia), precision)
+
+    def test_se_guardan_al_crear_y_al_mover(self):
+        # 0.0003° de latitud son ~33 m
+        verificacion = Verificacion.objects.get(pk=self.verificar(7.0003).pk)
+        self.assertAlmostEqual(verificacion.distancia_metros, 33.36, delta=0.05)
+        self.assertEqual(verificacion.precision, 'buena')
+
+        verificacion.latitud_verificacion = 7.00005
+        verificacion.save(update_fields=['latitud_verificacion'])
+
+        verificacion = Verificacion.objects.get(pk=verificacion.pk)
+        self.assertAlmostEqual(verificacion.distancia_metros, 5.56, delta=0.05)
+        self.assertEqual(verificacion.precision, 'excelente')
+        self.assertEqual(verificacion.calcular_distancia(), verificacion.distancia_metros)
+
+    def test_guardar_otros_campos_no_vuelve_a_medir(self):
+        verificacion = Verificacion.objects.get(pk=self.verificar(7.0).pk)
+        verificacion.notas_admin = 'Revisada'
+        with mock.patch.object(Verificacion, 'medir_distancia') as medir:
+            verificacion.save(update_fields=['notas_admin'])
+        medir.assert_not_called()
+
+    def test_filtro_y_orden_del_panel(self):
+        lejana = self.verificar(7.001)
+        cercana = self.verificar(7.0)
+        media = self.verificar(7.0003)
+        admin = User.objects.create_user('admin', is_staff=True)
+
+        def listadas(**parametros):
+            # admin.site.urls atiende primero /admin/verificaciones/: se llama a la vista directamente
+            peticion = RequestFactory().get('/admin/verificaciones/', parametros)
+            peticion.user = admin
+            with mock.patch('core.views.render') as render:
+                views.admin_verificaciones(peticion)
+            return [verificacion.pk for verificacion in render.call_args.args[2]['verificaciones']]
+
+        self.assertEqual(listadas(orden='precision'), [cercana.pk, media.pk, lejana.pk])
+        self.assertEqual(listadas(precision='revisar'), [lejana.pk])
+        self.assertEqual(len(listadas(precision='desconocida')), 3)
@@ -35,6 +35,10 @@ urlpatterns = [
     
     # API endpoints
     path('api/coordenadas/', views.api_obtener_coordenadas, name='api_coordenadas'),
+    path('api/clusters/', views.api_clusters, name='api_clusters'),
     path('api/estadisticas/', views.api_estadisticas_usuario, name='api_estadisticas'),
     path('api/siembras-cercanas/', views.api_siembras_cercanas, name='api_siembras_cercanas'),
+    path('api/sync/', views.api_sync, name='api_sync'),
+    path('api/subidas/', views.api_subidas, name='api_subidas'),
+    path('api/subidas/<int:subida_id>/', views.api_subida, name='api_subida'),
 ]
\ No newline at end of file
@@ -1,17 +1,30 @@
 """
 Views actualizadas para ReforestGo con sistema de verificación y oxígeno
 """
+import hashlib
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Count, Q, Sum
+from django.http import HttpResponse, JsonResponse
+from django.db.models import Count, F, Max, Q, Sum
 from django.core.paginator import Paginator
+from django.middleware.csrf import get_token
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import condition, require_http_methods
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from decimal import Decimal
-from .models import Perfil, Siembra, Vivero, Zona, Avatar, Verificacion
+from . import clusters
+from .catalogo import CatalogoMapa, datos_vivero, datos_zona
+from .models import Perfil, Siembra, Vivero, Zona, Avatar, Verificacion, EstadisticasGlobales, Eliminacion, SubidaSiembra
+from .estadisticas import EstadisticasUsuario
 from django.contrib.auth.models import User
 
 
@@ -23,30 +36,33 @@ def es_verificador(user):
     return user.perfil.nivel >= 3 or user.perfil.rol in ['verificador', 'admin'] or user.is_staff
 
 
+def datos_siembra_pendiente(siembra):
+    """Datos de una siembra pendiente para el mapa de verificación"""
+    return {
+        'id': siembra.id,
+        'lat': float(siembra.latitud),
+        'lng': float(siembra.longitud),
+        'especie': siembra.especie or 'No especificada',
+        'usuario': siembra.usuario.username,
+        'fecha': siembra.fecha_siembra.strftime('%d/%m/%Y'),
+        'foto_url': siembra.foto_tarjeta_url(),
+    }
+
+
 # ========== VISTAS PÚBLICAS ==========
 
 def index(request):
     """Página de inicio"""
-    # Estadísticas globales
-    total_siembras = Siembra.objects.filter(estado='validada').count()
-    total_usuarios = User.objects.filter(is_active=True).count()
+    # Estadísticas globales (fila desnormalizada, ver EstadisticasGlobales)
+    estadisticas = EstadisticasGlobales.obtener()
     viveros_destacados = Vivero.objects.filter(destacado=True)[:3]
     
-    # Calcular oxígeno total generado
-    oxigeno_total = Siembra.objects.filter(estado='validada').aggregate(
-        total=Sum('oxigeno_generado')
-    )['total'] or 0
-    
-    co2_total = Siembra.objects.filter(estado='validada').aggregate(
-        total=Sum('co2_absorbido')
-    )['total'] or 0
-    
     context = {
-        'total_siembras': total_siembras,
-        'total_usuarios': total_usuarios,
+        'total_siembras': estadisticas.total_siembras,
+        'total_usuarios': estadisticas.total_usuarios,
         'viveros_destacados': viveros_destacados,
-        'oxigeno_total': round(float(oxigeno_total), 2),
-        'co2_total': round(float(co2_total), 2),
+        'oxigeno_total': round(float(estadisticas.oxigeno_total), 2),
+        'co2_total': round(float(estadisticas.co2_total), 2),
     }
     return render(request, 'index.html', context)
 
@@ -89,10 +105,8 @@ def perfil(request):
             )
             request.session[f'mensaje_verificador_mostrado_{request.user.id}'] = True
     
-    # Estadísticas del usuario
-    siembras_validadas_count = request.user.siembras.filter(estado='validada').count()
-    total_siembras = request.user.siembras.count()
-    siembras_pendientes = request.user.siembras.filter(estado='pendiente').count()
+    # Estadísticas del usuario (una consulta, en caché)
+    stats = EstadisticasUsuario.obtener(request.user)
     
     # Últimas 6 siembras
     siembras = request.user.siembras.all()[:6]
@@ -117,22 +131,17 @@ def perfil(request):
     else:
         faltan = 0
     
-    # Cálculo de impacto ambiental personal
-    siembras_validadas_qs = request.user.siembras.filter(estado='validada')
-    oxigeno_personal = siembras_validadas_qs.aggregate(total=Sum('oxigeno_generado'))['total'] or 0
-    co2_personal = siembras_validadas_qs.aggregate(total=Sum('co2_absorbido'))['total'] or 0
-    
     context = {
         'perfil': perfil,
-        'total_siembras': total_siembras,
-        'siembras_validadas': siembras_validadas_count,
-        'siembras_pendientes': siembras_pendientes,
+        'total_siembras': stats['total'],
+        'siembras_validadas': stats['validadas'],
+        'siembras_pendientes': stats['pendientes'],
         'siembras': siembras,
         'avatares_disponibles': avatares_disponibles,
         'progreso': progreso,
         'faltan': faltan,
-        'oxigeno_total': round(float(oxigeno_personal), 2),
-        'co2_capturado': round(float(co2_personal), 2),
+        'oxigeno_total': round(stats['oxigeno'], 2),
+        'co2_capturado': round(stats['co2'], 2),
     }
     return render(request, 'perfil.html', context)
 
@@ -152,14 +161,8 @@ def mis_siembras(request):
     page_number = request.GET.get('page')
     siembras_page = paginator.get_page(page_number)
     
-    # Estadísticas
-    stats = {
-        'total': request.user.siembras.count(),
-        'validadas': request.user.siembras.filter(estado='validada').count(),
-        'pendientes': request.user.siembras.filter(estado='pendiente').count(),
-        'en_verificacion': request.user.siembras.filter(estado='en_verificacion').count(),
-        'rechazadas': request.user.siembras.filter(estado='rechazada').count(),
-    }
+    # Estadísticas (una consulta, en caché)
+    stats = EstadisticasUsuario.obtener(request.user)
     
     context = {
         'siembras': siembras_page,
@@ -172,6 +175,10 @@ def mis_siembras(request):
 @login_required
 def registrar_siembra(request):
     """Registrar una nueva siembra"""
+    # Clave de idempotencia del formulario: reenviarlo no duplica la siembra
+    clave = (request.POST.get('clave') or uuid.uuid4().hex)[:64]
+    context = {'clave': clave}
+    
     if request.method == 'POST':
         foto = request.FILES.get('foto')
         latitud = request.POST.get('latitud')
@@ -179,36 +186,72 @@ def registrar_siembra(request):
         especie = request.POST.get('especie', '')
         descripcion = request.POST.get('descripcion', '')
         
+        if SubidaSiembra.objects.filter(usuario=request.user, clave=clave).exists():
+            # Reintento de un envío que ya se registró (p. ej. tras un corte de red)
+            messages.success(request, '¡Siembra registrada exitosamente! 🌱 Está pendiente de validación por un administrador.')
+            return redirect('reforest:perfil')
+        
         # Validaciones
         if not foto:
             messages.error(request, 'Debes subir una foto del árbol plantado.')
-            return render(request, 'registrar_siembra.html')
+            return render(request, 'registrar_siembra.html', context)
         
         if not latitud or not longitud:
             messages.error(request, 'No se pudo obtener tu ubicación GPS.')
-            return render(request, 'registrar_siembra.html')
+            return render(request, 'registrar_siembra.html', context)
         
         try:
-            siembra = Siembra.objects.create(
-                usuario=request.user,
-                foto=foto,
-                latitud=float(latitud),
-                longitud=float(longitud),
-                especie=especie,
-                descripcion=descripcion
-            )
-            
-            messages.success(
-                request,
-                '¡Siembra registrada exitosamente! 🌱 Está pendiente de validación por un administrador.'
-            )
+            # Reservar la clave antes de escribir la foto: un envío simultáneo o
+            # repetido falla aquí sin dejar un archivo en disco
+            with transaction.atomic():
+                subida = SubidaSiembra.objects.create(
+                    usuario=request.user,
+                    clave=clave,
+                    nombre_archivo=os.path.basename(foto.name)[:100],
+                    tamano=foto.size,
+                    latitud=float(latitud),
+                    longitud=float(longitud),
+                    especie=especie,
+                    descripcion=descripcion,
+                )
+        except IntegrityError:
+            # Otro envío con la misma clave se registró primero
+            messages.success(request, '¡Siembra registrada exitosamente! 🌱 Está pendiente de validación por un administrador.')
             return redirect('reforest:perfil')
-            
         except Exception as e:
             messages.error(request, f'Error al registrar la siembra: {str(e)}')
-            return render(request, 'registrar_siembra.html')
+            return render(request, 'registrar_siembra.html', context)
+        
+        siembra = Siembra(
+            usuario=request.user,
+            foto=foto,
+            latitud=subida.latitud,
+            longitud=subida.longitud,
+            especie=especie,
+            descripcion=descripcion
+        )
+        try:
+            with transaction.atomic():
+                siembra.save()
+                subida.siembra = siembra
+                subida.recibidos = subida.tamano
+                subida.estado = 'completada'
+                subida.save(update_fields=['siembra', 'recibidos', 'estado', 'fecha_actualizacion'])
+        except Exception as e:
+            # El rollback no borra la foto ya escrita; liberar también la clave para reintentar
+            if siembra.foto._committed:
+                siembra.foto.delete(save=False)
+            subida.delete()
+            messages.error(request, f'Error al registrar la siembra: {str(e)}')
+            return render(request, 'registrar_siembra.html', context)
+        
+        messages.success(
+            request,
+            '¡Siembra registrada exitosamente! 🌱 Está pendiente de validación por un administrador.'
+        )
+        return redirect('reforest:perfil')
     
-    return render(request, 'registrar_siembra.html')
+    return render(request, 'registrar_siembra.html', context)
 
 
 @login_required
@@ -221,7 +264,7 @@ def cambiar_avatar(request, avatar_id):
         messages.error(request, f'Debes alcanzar el nivel {avatar.nivel_requerido} para desbloquear este avatar.')
     else:
         perfil.avatar_actual = avatar
-        perfil.save()
+        perfil.save(update_fields=['avatar_actual'])
         messages.success(request, f'Avatar cambiado a {avatar.nombre} {avatar.emoji}')
     
     return redirect('reforest:perfil')
@@ -232,76 +275,20 @@ def cambiar_avatar(request, avatar_id):
 @login_required
 @user_passes_test(es_verificador, login_url='reforest:perfil')
 def mapa_verificacion(request):
-    """Mapa con árboles pendientes de verificación ordenados por distancia"""
-    import json
-    from math import radians, sin, cos, sqrt, atan2
-    
-    def calcular_distancia(lat1, lon1, lat2, lon2):
-        """Calcula distancia en km usando Haversine"""
-        R = 6371
-        lat1_rad = radians(lat1)
-        lon1_rad = radians(lon1)
-        lat2_rad = radians(lat2)
-        lon2_rad = radians(lon2)
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-        a = sin(dlat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        return R * c
-    
+    """
+    Mapa con árboles pendientes de verificación. La página solo lleva el
+    total; el mapa se carga por vista desde api_clusters y la lista, ordenada
+    por distancia y por páginas, desde api_siembras_cercanas.
+    """
     # Obtener ubicación del usuario
     user_lat = request.GET.get('lat')
     user_lng = request.GET.get('lng')
     
-    # Obtener siembras pendientes de verificación (excluir propias)
-    siembras_pendientes = Siembra.objects.filter(
-        estado='pendiente'
-    ).exclude(
-        usuario=request.user
-    ).select_related('usuario')
-    
-    # Convertir a lista con distancias
-    siembras_list = []
-    for siembra in siembras_pendientes:
-        siembra_data = {
-            'id': siembra.id,
-            'lat': float(siembra.latitud),
-            'lng': float(siembra.longitud),
-            'especie': siembra.especie or 'No especificada',
-            'usuario': siembra.usuario.username,
-            'fecha': siembra.fecha_siembra.strftime('%d/%m/%Y'),
-            'foto_url': siembra.foto.url,
-            'descripcion': siembra.descripcion or 'Sin descripción',
-            'distancia': None,
-            'distancia_texto': 'Ubicación no disponible'
-        }
-        
-        # Calcular distancia si hay ubicación del usuario
-        if user_lat and user_lng:
-            try:
-                distancia_km = calcular_distancia(
-                    float(user_lat), float(user_lng),
-                    float(siembra.latitud), float(siembra.longitud)
-                )
-                siembra_data['distancia'] = round(distancia_km, 2)
-                
-                if distancia_km < 1:
-                    siembra_data['distancia_texto'] = f"{int(distancia_km * 1000)} metros"
-                else:
-                    siembra_data['distancia_texto'] = f"{distancia_km:.1f} km"
-            except:
-                pass
-        
-        siembras_list.append(siembra_data)
-    
-    # Ordenar por distancia (los más cercanos primero)
-    if user_lat and user_lng:
-        siembras_list.sort(key=lambda x: x['distancia'] if x['distancia'] is not None else float('inf'))
+    # Siembras pendientes de verificación (excluir propias)
+    total_pendientes = Siembra.objects.filter(estado='pendiente').exclude(usuario=request.user).count()
     
     context = {
-        'siembras': json.dumps(siembras_list),
-        'siembras_lista': siembras_list,  # Para mostrar en la lista
-        'total_pendientes': len(siembras_list),
+        'total_pendientes': total_pendientes,
         'tiene_ubicacion': bool(user_lat and user_lng),
         'user_lat': user_lat,
         'user_lng': user_lng,
@@ -404,14 +391,27 @@ def es_admin(user):
 def admin_verificaciones(request):
     """Panel de administrador para revisar verificaciones"""
     estado_filter = request.GET.get('estado', 'pendiente')
+    precision_filter = request.GET.get('precision', '')
+    orden = request.GET.get('orden', 'recientes')
     
     verificaciones = Verificacion.objects.all().select_related(
-        'siembra', 'verificador', 'revisada_por'
+        'siembra__usuario', 'verificador', 'revisada_por'
     )
     
     if estado_filter != 'todas':
         verificaciones = verificaciones.filter(estado=estado_filter)
     
+    # Precisión y distancia guardadas al crear la verificación: filtro y orden en SQL
+    if precision_filter in dict(Verificacion.PRECISION_CHOICES):
+        verificaciones = verificaciones.filter(precision=precision_filter)
+    else:
+        precision_filter = ''
+    
+    if orden == 'precision':
+        verificaciones = verificaciones.order_by(F('distancia_metros').asc(nulls_last=True), '-fecha_verificacion')
+    else:
+        orden = 'recientes'
+    
     # Paginación
     paginator = Paginator(verificaciones, 15)
     page_number = request.GET.get('page')
@@ -428,6 +428,9 @@ def admin_verificaciones(request):
     context = {
         'verificaciones': verificaciones_page,
         'estado_filter': estado_filter,
+        'precision_filter': precision_filter,
+        'precision_choices': Verificacion.PRECISION_CHOICES,
+        'orden': orden,
         'stats': stats,
     }
     return render(request, 'admin_verificaciones.html', context)
@@ -482,20 +485,11 @@ def revisar_verificacion(request, verificacion_id):
 @login_required
 def estadisticas_oxigeno(request):
     """Dashboard de impacto ambiental"""
-    # Actualizar oxígeno de todas las siembras validadas del usuario
+    # Los valores de oxígeno los mantiene actualizar_oxigeno; aquí solo se leen
     siembras_validadas = request.user.siembras.filter(estado='validada')
-    
-    for siembra in siembras_validadas:
-        siembra.calcular_oxigeno()
-    
-    # Obtener datos actualizados
-    oxigeno_data = siembras_validadas.aggregate(
-        total_oxigeno=Sum('oxigeno_generado'),
-        total_co2=Sum('co2_absorbido')
-    )
-    
-    oxigeno_total = float(oxigeno_data['total_oxigeno'] or 0)
-    co2_total = float(oxigeno_data['total_co2'] or 0)
+    oxigeno_total, co2_total = siembras_validadas.impacto_oxigeno()
+    oxigeno_total = float(oxigeno_total)
+    co2_total = float(co2_total)
     
     # Calcular equivalencias
     equivalencias = {
@@ -541,66 +535,21 @@ def estadisticas_oxigeno(request):
 
 def mapa(request):
     """Mapa interactivo con viveros y zonas de siembra"""
-    import json
-    
-    viveros = Vivero.objects.all()
-    zonas = Zona.objects.filter(activa=True)
-    
-    viveros_data = [
-        {
-            'nombre': v.nombre,
-            'lat': float(v.latitud),
-            'lng': float(v.longitud),
-            'direccion': v.direccion,
-            'telefono': v.telefono,
-            'horario': v.horario,
-            'especies': v.especies_disponibles,
-            'destacado': v.destacado,
-        }
-        for v in viveros
-    ]
-    
-    zonas_data = [
-        {
-            'nombre': z.nombre,
-            'lat': float(z.latitud),
-            'lng': float(z.longitud),
-            'tipo': z.tipo_terreno,
-            'descripcion': z.descripcion,
-            'recomendaciones': z.recomendaciones,
-        }
-        for z in zonas
-    ]
-    
-    context = {
-        'viveros': json.dumps(viveros_data),
-        'zonas': json.dumps(zonas_data),
-    }
-    return render(request, 'mapa.html', context)
+    # Los marcadores se cargan según la vista desde api_clusters
+    return render(request, 'mapa.html')
 
 
 def ranking(request):
     """Ranking de usuarios por puntos"""
-    perfiles = Perfil.objects.select_related('user', 'avatar_actual')\
-        .filter(user__is_staff=False, user__is_superuser=False)\
-        .order_by('-puntos')[:50]
-    
-    # Añadir posición y datos
-    for index, perfil in enumerate(perfiles, start=1):
-        perfil.posicion = index
-        perfil.siembras_validadas = perfil.user.siembras.filter(estado='validada').count()
+    # Instantánea en caché con las siembras validadas anotadas (ver Perfil.obtener_ranking)
+    perfiles = Perfil.obtener_ranking()
     
     # Posición del usuario actual
     usuario_posicion = None
     if request.user.is_authenticated and not request.user.is_staff and not request.user.is_superuser:
         try:
-            usuarios_por_encima = Perfil.objects.filter(
-                puntos__gt=request.user.perfil.puntos,
-                user__is_staff=False,
-                user__is_superuser=False
-            ).count()
-            usuario_posicion = usuarios_por_encima + 1
-        except:
+            usuario_posicion = request.user.perfil.posicion_en_ranking()
+        except Perfil.DoesNotExist:
             usuario_posicion = None
     
     context = {
@@ -612,61 +561,120 @@ def ranking(request):
 
 # ========== API ENDPOINTS ==========
 
+# Búsqueda de siembras cercanas (api_siembras_cercanas)
+RADIO_POR_DEFECTO_KM = 10.0
+RADIO_MAXIMO_KM = 500.0
+K_POR_DEFECTO = 50
+K_MAXIMO = 200
+
+# Subidas por fragmentos (api_subidas): clave de idempotencia del cliente
+CLAVE_SUBIDA = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+# Sincronización incremental (api_sync): el cursor son microsegundos desde EPOCA y
+# cada respuesta repite el último MARGEN para no perder filas guardadas antes del
+# cursor pero confirmadas después
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MARGEN_SINCRONIZACION = timedelta(seconds=60)
+
+
+# Validadores de las respuestas condicionales (ETag): los clientes que consultan
+# periódicamente reciben 304 sin que se serialice nada. No se usa Last-Modified
+# porque la fecha máxima no cambia al eliminar filas; la cantidad sí.
+
+def etag_conjunto(queryset):
+    """Cantidad de filas y fecha_actualizacion máxima del conjunto"""
+    datos = queryset.order_by().aggregate(cantidad=Count('id'), ultima=Max('fecha_actualizacion'))
+    marca = datos['ultima'].timestamp() if datos['ultima'] else 0
+    return f"{datos['cantidad']}-{marca}"
+
+
+def etag_catalogo(request):
+    # Huella del JSON en caché que se va a enviar, no de la base de datos
+    tipo = request.GET.get('tipo', 'todos')
+    if tipo not in CatalogoMapa.TIPOS:
+        return None
+    return f'catalogo-{tipo}-{CatalogoMapa.etag(tipo)}'
+
+
+def etag_siembras_cercanas(request):
+    # Cualquier cambio en las siembras pendientes invalida todas las búsquedas;
+    # el usuario va en el ETag porque sus propias siembras se excluyen
+    return f"cercanas-{request.user.pk}-{etag_conjunto(Siembra.objects.filter(estado='pendiente'))}"
+
+
+def etag_estadisticas_usuario(request):
+    """Huella del perfil y de las estadísticas en caché del usuario"""
+    perfil = request.user.perfil
+    stats = EstadisticasUsuario.obtener(request.user)
+    huella = (
+        request.user.username, request.user.get_full_name(),
+        perfil.nivel, perfil.puntos, perfil.rol, perfil.avatar_actual_id,
+        perfil.verificaciones_realizadas, perfil.verificaciones_aprobadas, perfil.puntos_verificacion,
+        sorted(stats.items()),
+    )
+    return f"estadisticas-{request.user.pk}-{hashlib.md5(repr(huella).encode()).hexdigest()}"
+
+
+@condition(etag_func=etag_catalogo)
 def api_obtener_coordenadas(request):
     """API para obtener viveros y zonas en formato JSON"""
     tipo = request.GET.get('tipo', 'todos')
+    if tipo not in CatalogoMapa.TIPOS:
+        # Compatibilidad: un tipo desconocido respondía un objeto vacío
+        return JsonResponse({})
     
-    data = {}
-    
-    if tipo in ['viveros', 'todos']:
-        viveros = Vivero.objects.all()
-        data['viveros'] = [
-            {
-                'id': v.id,
-                'nombre': v.nombre,
-                'lat': float(v.latitud),
-                'lng': float(v.longitud),
-                'direccion': v.direccion,
-                'telefono': v.telefono,
-                'especies': v.especies_disponibles,
-                'destacado': v.destacado,
-            }
-            for v in viveros
-        ]
-    
-    if tipo in ['zonas', 'todos']:
-        zonas = Zona.objects.filter(activa=True)
-        data['zonas'] = [
-            {
-                'id': z.id,
-                'nombre': z.nombre,
-                'lat': float(z.latitud),
-                'lng': float(z.longitud),
-                'tipo': z.tipo_terreno,
-                'descripcion': z.descripcion,
-                'recomendaciones': z.recomendaciones,
-            }
-            for z in zonas
-        ]
+    # JSON ya serializado en caché (ver core.catalogo)
+    return HttpResponse(CatalogoMapa.obtener(tipo), content_type='application/json')
+
+
+def api_clusters(request):
+    """
+    API con los marcadores visibles en el mapa: grupos precalculados por
+    nivel de zoom (ver core.clusters) o puntos individuales al acercarse.
+    Parámetros: bbox=oeste,sur,este,norte, zoom y capas (vivero,zona,pendiente).
+    """
+    try:
+        lng_min, lat_min, lng_max, lat_max = [float(valor) for valor in request.GET['bbox'].split(',')]
+        zoom = int(request.GET['zoom'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Se requiere bbox=oeste,sur,este,norte y zoom'}, status=400)
+    
+    capas = request.GET.get('capas', 'vivero,zona').split(',')
+    if not set(capas) <= set(clusters.CAPAS):
+        return JsonResponse({'error': f'Capas válidas: {", ".join(clusters.CAPAS)}'}, status=400)
+    
+    consultas = {
+        'vivero': (Vivero.objects.all(), datos_vivero),
+        'zona': (Zona.objects.filter(activa=True), datos_zona),
+    }
+    if 'pendiente' in capas:
+        if not request.user.is_authenticated or not es_verificador(request.user):
+            return JsonResponse({'error': 'Solo los verificadores pueden ver siembras pendientes'}, status=403)
+        consultas['pendiente'] = (
+            Siembra.objects.filter(estado='pendiente').exclude(usuario=request.user).select_related('usuario'),
+            datos_siembra_pendiente,
+        )
+    
+    data = {'zoom': zoom, 'capas': {}}
+    for capa in capas:
+        queryset, serializar = consultas[capa]
+        try:
+            data['capas'][capa] = clusters.consultar(
+                capa, queryset, serializar, zoom, lat_min, lat_max, lng_min, lng_max
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
     
     return JsonResponse(data)
 
 
 @login_required
+@condition(etag_func=etag_estadisticas_usuario)
 def api_estadisticas_usuario(request):
     """API para obtener estadísticas del usuario"""
     perfil = request.user.perfil
     
-    # Actualizar oxígeno
-    siembras_validadas = request.user.siembras.filter(estado='validada')
-    for siembra in siembras_validadas:
-        siembra.calcular_oxigeno()
-    
-    # Obtener datos actualizados
-    oxigeno_data = siembras_validadas.aggregate(
-        total_oxigeno=Sum('oxigeno_generado'),
-        total_co2=Sum('co2_absorbido')
-    )
+    stats = EstadisticasUsuario.obtener(request.user)
     
     data = {
         'usuario': request.user.username,
@@ -679,11 +687,11 @@ def api_estadisticas_usuario(request):
             'nombre': perfil.avatar_actual.nombre if perfil.avatar_actual else 'Semilla',
         },
         'siembras': {
-            'total': request.user.siembras.count(),
-            'validadas': siembras_validadas.count(),
-            'pendientes': request.user.siembras.filter(estado='pendiente').count(),
-            'en_verificacion': request.user.siembras.filter(estado='en_verificacion').count(),
-            'rechazadas': request.user.siembras.filter(estado='rechazada').count(),
+            'total': stats['total'],
+            'validadas': stats['validadas'],
+            'pendientes': stats['pendientes'],
+            'en_verificacion': stats['en_verificacion'],
+            'rechazadas': stats['rechazadas'],
         },
         'verificaciones': {
             'realizadas': perfil.verificaciones_realizadas,
@@ -692,8 +700,8 @@ def api_estadisticas_usuario(request):
             'tasa_aprobacion': perfil.tasa_aprobacion_verificaciones(),
         } if perfil.rol in ['verificador', 'admin'] else None,
         'impacto_ambiental': {
-            'oxigeno_generado': float(oxigeno_data['total_oxigeno'] or 0),
-            'co2_absorbido': float(oxigeno_data['total_co2'] or 0),
+            'oxigeno_generado': stats['oxigeno'],
+            'co2_absorbido': stats['co2'],
         },
         'progreso_nivel': perfil.progreso_siguiente_nivel(),
     }
@@ -702,53 +710,238 @@ def api_estadisticas_usuario(request):
 
 
 @login_required
+@condition(etag_func=etag_siembras_cercanas)
 def api_siembras_cercanas(request):
-    """API para obtener siembras pendientes cercanas al usuario"""
-    lat = request.GET.get('lat')
-    lng = request.GET.get('lng')
-    radio_km = int(request.GET.get('radio', 10))
-    
-    if not lat or not lng:
+    """
+    API para obtener siembras pendientes cercanas al usuario, de la más
+    cercana a la más lejana.
+    Parámetros: lat, lng, radio (km, decimal), k (resultados por página) y
+    cursor (valor 'siguiente' de la página anterior). Con k y sin radio se
+    buscan los k vecinos más cercanos hasta RADIO_MAXIMO_KM.
+    """
+    try:
+        lat = float(request.GET['lat'])
+        lng = float(request.GET['lng'])
+    except (KeyError, ValueError):
         return JsonResponse({'error': 'Se requiere latitud y longitud'}, status=400)
     
-    # Obtener siembras pendientes
-    siembras = Siembra.objects.filter(estado='pendiente').select_related('usuario')
-    
-    # Filtrar por distancia (simplificado - en producción usar PostGIS)
+    try:
+        radio_km = float(request.GET['radio']) if request.GET.get('radio') else None
+        k = int(request.GET.get('k', K_POR_DEFECTO))
+        cursor = request.GET.get('cursor')
+        despues = None
+        if cursor:
+            distancia_cursor, id_cursor = cursor.split(',')
+            despues = (float(distancia_cursor), int(id_cursor))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros radio, k o cursor inválidos'}, status=400)
+    
+    if not 1 <= k <= K_MAXIMO or (radio_km is not None and not 0 < radio_km <= RADIO_MAXIMO_KM):
+        return JsonResponse(
+            {'error': f'k debe estar entre 1 y {K_MAXIMO} y radio entre 0 y {RADIO_MAXIMO_KM} km'}, status=400
+        )
+    
+    if radio_km is None:
+        # Vecinos más cercanos: sin radio se busca hasta el máximo
+        radio_km = RADIO_MAXIMO_KM if 'k' in request.GET else RADIO_POR_DEFECTO_KM
+    
+    # Siembras pendientes de otros usuarios (nadie verifica las propias)
+    pendientes = Siembra.objects.filter(estado='pendiente').exclude(usuario=request.user)
+    cercanas = pendientes.cercanas(lat, lng, radio_km, k, despues)
+    
+    # Cargar solo las siembras de la página
+    siembras = Siembra.objects.select_related('usuario').in_bulk([siembra_id for siembra_id, _ in cercanas])
     siembras_data = []
-    for siembra in siembras[:100]:  # Limitar para performance
-        # Cálculo simplificado de distancia
-        import math
-        R = 6371  # Radio de la Tierra en km
-        
-        lat1 = math.radians(float(lat))
-        lon1 = math.radians(float(lng))
-        lat2 = math.radians(float(siembra.latitud))
-        lon2 = math.radians(float(siembra.longitud))
-        
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        distancia = R * c
-        
-        if distancia <= radio_km:
-            siembras_data.append({
-                'id': siembra.id,
-                'lat': float(siembra.latitud),
-                'lng': float(siembra.longitud),
-                'especie': siembra.especie or 'No especificada',
-                'usuario': siembra.usuario.username,
-                'fecha': siembra.fecha_siembra.strftime('%d/%m/%Y'),
-                'foto_url': siembra.foto.url,
-                'distancia_km': round(distancia, 2),
-            })
-    
-    # Ordenar por distancia
-    siembras_data.sort(key=lambda x: x['distancia_km'])
+    for siembra_id, distancia in cercanas:
+        siembra = siembras.get(siembra_id)
+        if siembra is None:
+            continue  # Eliminada entre ambas consultas
+        datos = datos_siembra_pendiente(siembra)
+        datos['distancia_km'] = round(distancia, 2)
+        siembras_data.append(datos)
+    
+    siguiente = None
+    if len(cercanas) == k:
+        siguiente = f'{cercanas[-1][1]!r},{cercanas[-1][0]}'
     
     return JsonResponse({
         'siembras': siembras_data,
-        'total': len(siembras_data)
-    })
\ No newline at end of file
+        'total': len(siembras_data),
+        'radio_km': radio_km,
+        'siguiente': siguiente,
+    })
+
+
+def cambios_sincronizacion(modelo, filtro, serializar, desde, relacionados=(), alcance=None):
+    """
+    Filas del conjunto (modelo filtrado por `filtro`, todo el modelo si es None)
+    creadas o modificadas desde `desde` y los ids que salieron del conjunto o se
+    eliminaron. Sin `desde` retorna el conjunto completo.
+    
+    Una fila sale del conjunto cuando se modifica y deja de cumplir `filtro`.
+    `alcance` limita esas salidas a las filas que pueden pertenecer al conjunto
+    (p. ej. las siembras de otros usuarios). Se reportan aunque el cliente no
+    las tuviera, como las validadas cuyo oxígeno se recalculó; la app ignora
+    los ids que no conoce.
+    """
+    conjunto = modelo.objects.all() if filtro is None else modelo.objects.filter(filtro)
+    conjunto = conjunto.select_related(*relacionados).order_by('id')
+    if desde is None:
+        return {'actualizados': [serializar(fila) for fila in conjunto], 'eliminados': []}
+    
+    actualizados = [serializar(fila) for fila in conjunto.filter(fecha_actualizacion__gte=desde)]
+    salieron = set()
+    if filtro is not None:
+        modificadas = modelo.objects.filter(fecha_actualizacion__gte=desde)
+        if alcance is not None:
+            modificadas = modificadas.filter(alcance)
+        salieron = set(modificadas.exclude(filtro).order_by().values_list('id', flat=True))
+    eliminados = Eliminacion.objects.filter(
+        modelo=modelo._meta.model_name, fecha_eliminacion__gte=desde
+    ).values_list('objeto_id', flat=True)
+    # Un id eliminado y reutilizado después cuenta como actualizado
+    vigentes = {datos['id'] for datos in actualizados}
+    return {
+        'actualizados': actualizados,
+        'eliminados': sorted((salieron | set(eliminados)) - vigentes),
+    }
+
+
+def api_sync(request):
+    """
+    API de sincronización incremental para la app de campo: viveros, zonas
+    activas y, para verificadores, siembras pendientes de otros usuarios
+    creadas, modificadas o eliminadas desde `since` (el 'cursor' de la
+    respuesta anterior). Sin `since`, o con un cursor más viejo que la
+    retención de las eliminaciones, responde todo con 'completa': true.
+    """
+    inicio = timezone.now()
+    try:
+        since = request.GET.get('since')
+        desde = EPOCA + timedelta(microseconds=int(since)) if since else None
+    except (ValueError, OverflowError):
+        return JsonResponse({'error': 'Cursor inválido'}, status=400)
+    
+    if desde is not None and desde < inicio - timedelta(days=Eliminacion.DIAS_RETENCION):
+        desde = None  # Las eliminaciones de ese periodo ya pudieron purgarse
+    
+    data = {
+        'completa': desde is None,
+        'viveros': cambios_sincronizacion(Vivero, None, datos_vivero, desde),
+        'zonas': cambios_sincronizacion(Zona, Q(activa=True), datos_zona, desde),
+    }
+    if request.user.is_authenticated and es_verificador(request.user):
+        # Una siembra de otro usuario sale de las pendientes por cualquier cambio de
+        # estado (verificación, validación, rechazo o edición en el admin)
+        data['siembras'] = cambios_sincronizacion(
+            Siembra, Q(estado='pendiente') & ~Q(usuario=request.user), datos_siembra_pendiente, desde,
+            relacionados=['usuario'],
+            alcance=~Q(usuario=request.user),
+        )
+    
+    siguiente = inicio - MARGEN_SINCRONIZACION
+    data['cursor'] = str((siguiente - EPOCA) // timedelta(microseconds=1))
+    return JsonResponse(data)
+
+
+def datos_subida(subida):
+    """Estado de una subida por fragmentos para la app móvil"""
+    return {
+        'id': subida.id,
+        'clave': subida.clave,
+        'tamano': subida.tamano,
+        'recibidos': subida.recibidos,
+        'estado': subida.estado,
+        'siembra_id': subida.siembra_id,
+    }
+
+
+@login_required
+@ensure_csrf_cookie
+@require_http_methods(['GET', 'POST'])
+def api_subidas(request):
+    """
+    API para iniciar o retomar la subida por fragmentos de una siembra.
+    GET: subidas en curso del usuario y el token CSRF (también en la cookie
+    csrftoken) que POST y PUT deben enviar en la cabecera X-CSRFToken; por
+    HTTPS Django exige además una cabecera Origin o Referer del mismo sitio.
+    POST: clave (idempotencia, 8 a 64 caracteres), tamano (bytes de la
+    foto), nombre, latitud, longitud, especie y descripcion. Con una clave ya
+    usada retorna la misma subida: los bytes recibidos o la siembra creada.
+    Los fragmentos se envían a api_subida.
+    """
+    if request.method == 'GET':
+        en_curso = SubidaSiembra.objects.filter(usuario=request.user, estado='en_curso').order_by('id')
+        return JsonResponse({
+            'subidas': [datos_subida(subida) for subida in en_curso],
+            'csrf_token': get_token(request),
+        })
+    
+    clave = request.POST.get('clave', '')
+    if not CLAVE_SUBIDA.match(clave):
+        return JsonResponse({'error': 'Se requiere una clave de 8 a 64 caracteres (letras, números, - o _)'}, status=400)
+    
+    try:
+        tamano = int(request.POST['tamano'])
+        latitud = float(request.POST['latitud'])
+        longitud = float(request.POST['longitud'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Se requiere tamano, latitud y longitud'}, status=400)
+    
+    if not 0 < tamano <= SubidaSiembra.TAMANO_MAXIMO:
+        return JsonResponse({'error': f'La foto debe pesar como máximo {SubidaSiembra.TAMANO_MAXIMO} bytes'}, status=400)
+    if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+        return JsonResponse({'error': 'Coordenadas inválidas'}, status=400)
+    
+    subida, creada = SubidaSiembra.objects.get_or_create(
+        usuario=request.user,
+        clave=clave,
+        defaults={
+            'nombre_archivo': os.path.basename(request.POST.get('nombre', ''))[:100] or f'{clave}.jpg',
+            'tamano': tamano,
+            'latitud': round(latitud, 6),
+            'longitud': round(longitud, 6),
+            'especie': request.POST.get('especie', '')[:100],
+            'descripcion': request.POST.get('descripcion', '')[:500],
+        },
+    )
+    if not creada and subida.tamano != tamano:
+        return JsonResponse({'error': 'La clave ya se usó para otro archivo'}, status=409)
+    
+    return JsonResponse(datos_subida(subida), status=201 if creada else 200)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def api_subida(request, subida_id):
+    """
+    GET: estado de la subida. PUT: agrega el cuerpo de la petición
+    (application/octet-stream) en la posición `offset`. Si la posición no
+    coincide con los bytes recibidos responde 409 con el estado para que el
+    cliente retome desde 'recibidos'. El último fragmento crea la siembra.
+    PUT lleva el mismo token CSRF que POST (ver api_subidas).
+    """
+    subida = get_object_or_404(SubidaSiembra, pk=subida_id, usuario=request.user)
+    
+    if request.method == 'PUT':
+        try:
+            posicion = int(request.GET['offset'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Se requiere offset'}, status=400)
+        
+        # Leer del flujo de la petición sin pasar por request.body
+        datos = request.read(SubidaSiembra.TAMANO_MAXIMO_FRAGMENTO + 1)
+        if not datos:
+            return JsonResponse({'error': 'Fragmento vacío'}, status=400)
+        if len(datos) > SubidaSiembra.TAMANO_MAXIMO_FRAGMENTO:
+            return JsonResponse(
+                {'error': f'Los fragmentos deben pesar como máximo {SubidaSiembra.TAMANO_MAXIMO_FRAGMENTO} bytes'},
+                status=413
+            )
+        
+        if not subida.agregar_fragmento(posicion, datos) and subida.estado == 'en_curso':
+            return JsonResponse(datos_subida(subida), status=409)
+    
+    if subida.estado == 'fallida':
+        return JsonResponse(dict(datos_subida(subida), error='El archivo no es una imagen válida'), status=400)
+    return JsonResponse(datos_subida(subida))
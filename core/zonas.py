@@ -0,0 +1,199 @@
+"""
+Pertenencia de las siembras validadas a las zonas (modelo SiembraZona).
+Una siembra validada pertenece a toda zona cuyo círculo (centro y radio_km)
+la contiene. Las filas y el contador Zona.total_siembras se mantienen al
+validar, rechazar o eliminar siembras y al crear, mover o cambiar el radio de
+una zona, así contar o resumir una zona no recorre las siembras validadas.
+"""
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.db.models import F, Max
+
+from . import geo
+
+# Campos de la siembra que deciden a qué zonas pertenece
+CAMPOS_MIEMBRO = ['estado', 'latitud', 'longitud']
+
+# Campos de la zona que deciden qué siembras contiene
+CAMPOS_COBERTURA = ['latitud', 'longitud', 'radio_km']
+
+
+# ========== PERTENENCIA ==========
+
+def zonas_que_cubren(lats, lngs):
+    """
+    Retorna [(índice del punto, zona_id)] de cada punto y cada zona cuyo
+    radio lo contiene. Las zonas se prefiltran por la franja de latitudes
+    de los puntos ampliada con el radio más grande.
+    """
+    from .models import Zona
+
+    radio_maximo = Zona.objects.aggregate(radio=Max('radio_km'))['radio']
+    if radio_maximo is None:
+        return []
+
+    margen = float(radio_maximo) / geo.KM_POR_GRADO
+    zonas = list(
+        Zona.objects.filter(
+            latitud__gte=float(lats.min()) - margen,
+            latitud__lte=float(lats.max()) + margen,
+        ).order_by().values_list('id', 'latitud', 'longitud', 'radio_km')
+    )
+    if not zonas:
+        return []
+
+    ids_zona, lats_zona, lngs_zona, radios = zip(*zonas)
+    distancias = geo.matriz_distancias_km(lats, lngs, lats_zona, lngs_zona)
+    puntos, columnas = np.nonzero(distancias <= geo.arreglo(radios)[np.newaxis, :])
+    return [(i, ids_zona[j]) for i, j in zip(puntos.tolist(), columnas.tolist())]
+
+
+def sumar_contadores(conteo, signo):
+    """Suma (signo=1) o resta (signo=-1) a total_siembras: un UPDATE por cantidad distinta"""
+    from .models import Zona
+
+    zonas_por_cantidad = defaultdict(list)
+    for zona_id, cantidad in conteo.items():
+        zonas_por_cantidad[cantidad].append(zona_id)
+    for cantidad, zona_ids in zonas_por_cantidad.items():
+        Zona.objects.filter(pk__in=zona_ids).update(total_siembras=F('total_siembras') + cantidad * signo)
+
+
+def agregar_siembras(filas):
+    """
+    Agrega las siembras [(id, lat, lng)] que acaban de quedar validadas a las
+    zonas que las cubren y suma los contadores.
+    """
+    from .models import SiembraZona, lotes
+
+    for lote in lotes(filas):
+        ids, lats, lngs = zip(*lote)
+        pares = zonas_que_cubren(geo.arreglo(lats), geo.arreglo(lngs))
+        if not pares:
+            continue
+        SiembraZona.objects.bulk_create(
+            [SiembraZona(siembra_id=ids[i], zona_id=zona_id) for i, zona_id in pares],
+            ignore_conflicts=True,
+        )
+        sumar_contadores(Counter(zona_id for _, zona_id in pares), 1)
+
+
+def quitar_siembras(ids):
+    """Saca las siembras de todas sus zonas y descuenta los contadores"""
+    from .models import SiembraZona, lotes
+
+    for lote in lotes(ids):
+        miembros = SiembraZona.objects.filter(siembra_id__in=lote)
+        conteo = Counter(miembros.values_list('zona_id', flat=True))
+        if conteo:
+            miembros.delete()
+            sumar_contadores(conteo, -1)
+
+
+def recalcular(zona):
+    """
+    Recalcula desde cero las siembras de una zona y su contador: prefiltro
+    por caja y celda y distancia exacta. Retorna la cantidad de siembras.
+    """
+    from .models import Siembra, SiembraZona, Zona, lotes
+
+    radio = float(zona.radio_km)
+    candidatos = list(
+        Siembra.objects.filter(estado='validada').en_caja(zona.latitud, zona.longitud, radio)
+        .order_by().values_list('id', 'latitud', 'longitud')
+    )
+    dentro = set()
+    if candidatos:
+        ids, lats, lngs = zip(*candidatos)
+        distancias = geo.distancias_km(zona.latitud, zona.longitud, lats, lngs)
+        dentro = {ids[i] for i in np.flatnonzero(distancias <= radio).tolist()}
+
+    actuales = set(SiembraZona.objects.filter(zona_id=zona.pk).values_list('siembra_id', flat=True))
+    for lote in lotes(actuales - dentro):
+        SiembraZona.objects.filter(zona_id=zona.pk, siembra_id__in=lote).delete()
+    SiembraZona.objects.bulk_create(
+        [SiembraZona(zona_id=zona.pk, siembra_id=siembra_id) for siembra_id in dentro - actuales],
+        batch_size=1000,
+    )
+
+    zona.total_siembras = len(dentro)
+    Zona.objects.filter(pk=zona.pk).update(total_siembras=zona.total_siembras)
+    return zona.total_siembras
+
+
+# ========== MANTENIMIENTO INCREMENTAL ==========
+
+def punto_miembro(siembra):
+    """(lat, lng) con que una siembra validada entra en las zonas, o None"""
+    if siembra.estado != 'validada' or siembra.latitud is None or siembra.longitud is None:
+        return None
+    return float(siembra.latitud), float(siembra.longitud)
+
+
+def recordar_siembra(siembra):
+    """Guarda el punto cargado de la base de datos para detectar cambios al guardar"""
+    if all(campo in siembra.__dict__ for campo in CAMPOS_MIEMBRO):
+        siembra._miembro_original = punto_miembro(siembra)
+
+
+def cambio_siembra(siembra, update_fields=None):
+    """
+    Retorna (antes, después) del punto de la siembra en las zonas para este
+    guardado, o None si el guardado no escribe campos que lo afecten.
+    """
+    if update_fields is not None and not set(CAMPOS_MIEMBRO) & set(update_fields):
+        return None
+
+    if siembra._state.adding:
+        antes = None
+    elif hasattr(siembra, '_miembro_original'):
+        antes = siembra._miembro_original
+    else:
+        # Punto original desconocido (instancia no cargada de la base de datos o campos diferidos)
+        original = type(siembra)._base_manager.filter(pk=siembra.pk).only(*CAMPOS_MIEMBRO).first()
+        antes = punto_miembro(original) if original is not None else None
+    return antes, punto_miembro(siembra)
+
+
+def aplicar_cambio_siembra(siembra, cambio):
+    """Mueve la siembra entre zonas según el resultado de cambio_siembra"""
+    if cambio is None:
+        return
+    antes, despues = cambio
+    if antes != despues:
+        if antes is not None:
+            quitar_siembras([siembra.pk])
+        if despues is not None:
+            agregar_siembras([(siembra.pk, *despues)])
+    siembra._miembro_original = despues
+
+
+def quitar_siembra_eliminada(siembra):
+    """Descuenta de sus zonas una siembra que se va a eliminar"""
+    if hasattr(siembra, '_miembro_original'):
+        antes = siembra._miembro_original
+    else:
+        antes = punto_miembro(siembra)
+    if antes is not None:
+        quitar_siembras([siembra.pk])
+
+
+def cobertura(zona):
+    """(lat, lng, radio) del círculo de la zona"""
+    return float(zona.latitud), float(zona.longitud), float(zona.radio_km)
+
+
+def recordar_zona(zona):
+    """Guarda el círculo cargado de la base de datos para detectar cambios al guardar"""
+    if all(campo in zona.__dict__ for campo in CAMPOS_COBERTURA):
+        zona._cobertura_original = cobertura(zona)
+
+
+def cambia_cobertura(zona, update_fields=None):
+    """True si este guardado crea la zona o mueve su centro o cambia su radio"""
+    if zona._state.adding:
+        return True
+    if update_fields is not None and not set(CAMPOS_COBERTURA) & set(update_fields):
+        return False
+    return getattr(zona, '_cobertura_original', None) != cobertura(zona)
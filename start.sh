@@ -0,0 +1,14 @@
+#!/usr/bin/env bash
+# Script de arranque recomendado para Render.com
+set -euo pipefail
+
+# El procesador de fotos corre junto a gunicorn porque el disco de media no se
+# comparte entre servicios; si termina por un error se reinicia tras una pausa
+(
+  while true; do
+    python manage.py procesar_imagenes --continuo --intervalo 5 || true
+    sleep 5
+  done
+) &
+
+exec gunicorn ReforestGo.wsgi:application